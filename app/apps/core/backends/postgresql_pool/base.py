@@ -0,0 +1,121 @@
+import os
+import threading
+
+import psycopg2
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from .creation import DatabaseCreation
+from .pool import ConnectionPool
+
+# PostgreSQL backend that checks connections out of a per-process pool
+# instead of opening one per request. Configured by the POOL dict of the
+# database settings; MAX_SIZE 0 opens and closes connections like the
+# stock backend:
+#
+#   'POOL': {'MIN_SIZE': 2, 'MAX_SIZE': 20, 'TIMEOUT': 10, 'MAX_IDLE': 300,
+#            'MAX_LIFETIME': 3600, 'CHECK_AFTER': 5}
+#
+# Keep CONN_MAX_AGE at 0: closing a connection at the end of a request
+# returns it to the pool, where any thread can reuse it.
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 0,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'MAX_IDLE': 300,
+    'MAX_LIFETIME': 3600,
+    'CHECK_AFTER': 5,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+# pools inherited through fork(), kept so that their connections, which
+# belong to the parent process, are never closed by the child
+_inherited = []
+
+
+def _forget_pools():
+    _inherited.extend(_pools.values())
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+def get_pool(alias, conn_params, settings_dict):
+    # the pool of this process for a database alias and connection
+    # parameters, or None when pooling is disabled
+    options = {**POOL_DEFAULTS, **settings_dict.get('POOL', {})}
+    if options['MAX_SIZE'] <= 0:
+        return None
+    key = (alias, repr(sorted(conn_params.items())), repr(sorted(options.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                lambda: connect(conn_params, settings_dict['OPTIONS']),
+                min_size=options['MIN_SIZE'],
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_idle=options['MAX_IDLE'],
+                max_lifetime=options['MAX_LIFETIME'],
+                check_after=options['CHECK_AFTER'],
+                name=f'db-pool-{alias}',
+            )
+            pool.alias = alias
+            pool.database = conn_params['database']
+        return pool
+
+
+def close_pools(alias=None, database=None):
+    # close and forget the pools of an alias and/or database name
+    with _pools_lock:
+        keys = [
+            key for key, pool in _pools.items()
+            if alias in (None, pool.alias) and database in (None, pool.database)
+        ]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    # {alias: [stats of each pool]} of this process
+    with _pools_lock:
+        pools = list(_pools.values())
+    stats = {}
+    for pool in pools:
+        stats.setdefault(pool.alias, []).append({'database': pool.database, **pool.stats()})
+    return stats
+
+
+def connect(conn_params, options):
+    # a new connection, set up like the stock backend's get_new_connection()
+    connection = psycopg2.connect(**conn_params)
+    if 'isolation_level' in options and options['isolation_level'] != connection.isolation_level:
+        connection.set_session(isolation_level=options['isolation_level'])
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    pool = None
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, conn_params, self.settings_dict)
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        connection = self.pool.getconn()
+        self.isolation_level = connection.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
+            return
+        return super()._close()
@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import Counter, deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class ConnectionPool:
+    # Thread-safe pool of psycopg2 connections, between min_size and
+    # max_size open connections. Checkouts reuse the most recently returned
+    # connection and ping it when it sat idle for check_after seconds or
+    # more; connections in a broken state are discarded on return. A
+    # background reaper closes connections idle for max_idle seconds (down
+    # to min_size) or open for max_lifetime seconds, and opens connections
+    # up to min_size, so handshakes stay off the request path.
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=10, max_idle=300,
+                 max_lifetime=3600, check_after=5, name='pool'):
+        self._connect = connect
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.name = name
+        self.reap_interval = max(min(max_idle, max_lifetime, 60) / 2, 0.1)
+        # (connection, returned at) of the idle connections, oldest first
+        self._idle = deque()
+        # open time of every connection the pool owns
+        self._opened = {}
+        # open connections plus the ones being opened
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._stats = Counter()
+        self._closed = threading.Event()
+        self._reaper = None
+
+    def getconn(self):
+        # check a connection out, waiting up to timeout seconds for one when
+        # max_size connections are in use
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, returned = self._checkout(deadline)
+            if connection is None:
+                connection = self._open()
+            elif not self._healthy(connection, returned):
+                self._discard(connection)
+                continue
+            with self._lock:
+                self._stats['checkouts'] += 1
+            return connection
+
+    def putconn(self, connection):
+        # return a checked out connection, closing it when it is broken,
+        # too old or the pool is closed
+        if self._closed.is_set() or not self._reset(connection) or self._expired(connection, time.monotonic()):
+            self._discard(connection)
+            return
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def reap(self):
+        # close expired idle connections and open connections up to
+        # min_size; returns the number of connections closed
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            keep = deque()
+            for connection, returned in self._idle:
+                idle_too_long = now - returned >= self.max_idle and self._size - len(expired) > self.min_size
+                if idle_too_long or self._expired(connection, now):
+                    expired.append(connection)
+                else:
+                    keep.append((connection, returned))
+            self._idle = keep
+            self._stats['reaped'] += len(expired)
+        for connection in expired:
+            self._discard(connection)
+        self._fill()
+        return len(expired)
+
+    def close(self):
+        # close the idle connections; checked out ones close when returned
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._available.notify_all()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'opened': self._stats['opened'],
+                'closed': self._stats['closed'],
+                'checkouts': self._stats['checkouts'],
+                'waits': self._stats['waits'],
+                'wait_seconds': self._stats['wait_seconds'],
+                'timeouts': self._stats['timeouts'],
+                'failed_checks': self._stats['failed_checks'],
+                'reaped': self._stats['reaped'],
+            }
+
+    def _checkout(self, deadline):
+        # (idle connection, returned at), or (None, None) when the caller
+        # may open a new connection
+        with self._lock:
+            if self._closed.is_set():
+                raise psycopg2.OperationalError(f'Connection pool {self.name} is closed.')
+            self._start_reaper()
+            waited = None
+            try:
+                while True:
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None, None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise psycopg2.OperationalError(
+                            f'Connection pool {self.name} exhausted: all {self.max_size} connections '
+                            f'in use for {self.timeout} seconds.'
+                        )
+                    if waited is None:
+                        waited = time.monotonic()
+                        self._stats['waits'] += 1
+                    self._available.wait(remaining)
+            finally:
+                if waited is not None:
+                    self._stats['wait_seconds'] += time.monotonic() - waited
+
+    def _open(self):
+        # open a connection for a slot already counted in _size
+        try:
+            connection = self._connect()
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+                self._available.notify()
+            raise
+        with self._lock:
+            self._opened[connection] = time.monotonic()
+            self._stats['opened'] += 1
+        return connection
+
+    def _fill(self):
+        while not self._closed.is_set():
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except psycopg2.Error:
+                return
+            self.putconn(connection)
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._opened.pop(connection, None)
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._available.notify()
+
+    def _expired(self, connection, now):
+        return now - self._opened.get(connection, now) >= self.max_lifetime
+
+    def _healthy(self, connection, returned):
+        if connection.closed or self._expired(connection, time.monotonic()):
+            return False
+        if time.monotonic() - returned < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # outside autocommit the ping opened a transaction
+            return self._reset(connection)
+        except psycopg2.Error:
+            with self._lock:
+                self._stats['failed_checks'] += 1
+            return False
+
+    def _reset(self, connection):
+        # end the transaction a connection is returned in; False when the
+        # connection cannot be reused
+        if connection.closed:
+            return False
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+            try:
+                connection.rollback()
+                return True
+            except psycopg2.Error:
+                return False
+        return False
+
+    def _start_reaper(self):
+        # called with the lock held
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_forever, name=f'{self.name}-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        self._fill()
+        while not self._closed.wait(self.reap_interval):
+            self.reap()
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Bounded, thread-safe in-process cache with least recently used eviction
+    # entries also expire after `timeout` seconds, which bounds how long a
+    # process can serve a value that was invalidated by another process
+
+    def __init__(self, max_size, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        # return the cached value and mark it as recently used
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        # store a value, evicting the least recently used entries when full
+        expires = None
+        if self.timeout is not None:
+            expires = time.monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,48 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+# Django 3.2 has no async ORM: async views run their queries in a pool of
+# database threads instead, so the event loop keeps serving other requests
+# while one waits on PostgreSQL. With ASYNC_DATABASE_THREADS = 0 the work
+# goes to Django's single thread for sync code, like sync views under ASGI.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # database thread pool shared by the process, created on first use
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_DATABASE_THREADS,
+                thread_name_prefix='async-db',
+            )
+        return _executor
+
+
+def _in_thread(func, *args, **kwargs):
+    # the request_started/request_finished connection handling of Django,
+    # for the connection of this thread
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_database_thread(func, *args, **kwargs):
+    # await func(*args, **kwargs) run in a database thread
+    if settings.ASYNC_DATABASE_THREADS == 0:
+        return await sync_to_async(func)(*args, **kwargs)
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _in_thread, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
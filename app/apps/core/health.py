@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+
+# Probes for orchestrators: /healthz answers as long as the process serves
+# requests, /readyz only once every database it writes to answers, so
+# traffic is routed to instances that can serve it. Both are plain Django
+# views, without the authentication and throttling of the API.
+
+
+def ping(alias):
+    # round trip of a query on the database alias in seconds; raises
+    # DatabaseError when it cannot be reached
+    connection = connections[alias]
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return time.perf_counter() - started
+
+
+def database_status(alias):
+    status = {'ok': True}
+    try:
+        status['latency_ms'] = round(ping(alias) * 1000, 2)
+    except DatabaseError as exc:
+        # a broken connection is closed at the end of the request
+        status.update(ok=False, error=str(exc).strip() or type(exc).__name__)
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is not None:
+        status['pool'] = pool.stats()
+    return status
+
+
+def required_databases():
+    # the aliases requests need: the primary and the shards; replicas are
+    # only reported, reads fall back to the primary without them
+    return list(dict.fromkeys(['default', *settings.SHARD_DATABASES]))
+
+
+@never_cache
+@require_GET
+def healthz(request):
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+@require_GET
+def readyz(request):
+    required = required_databases()
+    databases = {
+        alias: database_status(alias)
+        for alias in [*required, *settings.REPLICA_DATABASES]
+    }
+    ready = all(databases[alias]['ok'] for alias in required)
+    return JsonResponse(
+        {'status': 'ok' if ready else 'unavailable', 'databases': databases},
+        status=200 if ready else 503,
+    )
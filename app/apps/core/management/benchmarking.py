@@ -0,0 +1,118 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from apps.core.models import Tag, Ingredients, Recipe
+from apps.core.sharding import use_shard
+from apps.recipe.counters import recount
+
+# Helpers shared by the benchmark management commands.
+# They seed a dedicated benchmark account and time code against it;
+# run them against a disposable database, never against production.
+
+BENCHMARK_EMAIL = 'benchmark@recipe.local'
+SEED_BATCH_SIZE = 10000
+
+
+def get_benchmark_user(email=BENCHMARK_EMAIL):
+    # return the account that owns the benchmark data
+    user = get_user_model().objects.filter(email=email).first()
+    if user is None:
+        user = get_user_model().objects.create_user(email, 'benchmark')
+    return user
+
+
+def seed(user, recipes, **kwargs):
+    # top the user's data up to the requested row counts, on their shard
+    with use_shard(user.shard):
+        _seed(user, recipes, **kwargs)
+
+
+def _seed(user, recipes, tags=200, ingredients=2000, tags_per_recipe=3,
+          ingredients_per_recipe=8, stdout=None, seed_value=0):
+    rng = random.Random(seed_value)
+    tag_ids = _seed_named(Tag, user, tags, 'tag')
+    ingredient_ids = _seed_named(Ingredients, user, ingredients, 'ingredient')
+
+    existing = Recipe.objects.filter(user=user).count()
+    through_tags = Recipe.tags.through
+    through_ingredients = Recipe.ingredients.through
+    for start in range(existing, recipes, SEED_BATCH_SIZE):
+        size = min(SEED_BATCH_SIZE, recipes - start)
+        with transaction.atomic(using=user.shard):
+            batch = Recipe.objects.bulk_create([
+                Recipe(
+                    user=user,
+                    title=f'Recipe {start + i} {rng.choice(WORDS)} {rng.choice(WORDS)}',
+                    time_minutes=rng.randint(5, 240),
+                    price=rng.randint(100, 99999) / 100,
+                )
+                for i in range(size)
+            ])
+            through_tags.objects.bulk_create([
+                through_tags(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe in batch
+                for tag_id in rng.sample(tag_ids, min(tags_per_recipe, len(tag_ids)))
+            ])
+            through_ingredients.objects.bulk_create([
+                through_ingredients(recipe_id=recipe.id, ingredients_id=ingredient_id)
+                for recipe in batch
+                for ingredient_id in rng.sample(ingredient_ids, min(ingredients_per_recipe, len(ingredient_ids)))
+            ])
+        if stdout is not None:
+            stdout.write(f'Seeded {start + size}/{recipes} recipes')
+
+    # the links were bulk inserted without m2m_changed signals
+    for model in (Tag, Ingredients):
+        recount(model.objects.filter(user=user))
+
+    connection = connections[user.shard]
+    with connection.cursor() as cursor:
+        for model in (Tag, Ingredients, Recipe, through_tags, through_ingredients):
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def _seed_named(model, user, count, prefix):
+    # create named rows up to count and return all of the user's ids
+    existing = model.objects.filter(user=user).count()
+    model.objects.bulk_create([
+        model(user=user, name=f'{prefix}-{i:07d}')
+        for i in range(existing, count)
+    ], batch_size=SEED_BATCH_SIZE)
+    return list(model.objects.filter(user=user).values_list('id', flat=True))
+
+
+def api_request(user, params=None, path='/'):
+    # build an authenticated DRF request for calling viewset code directly
+    request = Request(RequestFactory().get(path, params or {}, HTTP_HOST='localhost'))
+    request.user = user
+    return request
+
+
+def timed(func, runs):
+    # call func runs times and return the durations in milliseconds
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summary(durations):
+    # format median and p95 of a list of durations
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f'median {statistics.median(ordered):8.2f} ms   p95 {p95:8.2f} ms'
+
+
+WORDS = [
+    'apple', 'basil', 'carrot', 'chicken', 'chilli', 'curry', 'garlic', 'ginger',
+    'lemon', 'lentil', 'mushroom', 'noodle', 'onion', 'pasta', 'pepper', 'potato',
+    'pumpkin', 'rice', 'salmon', 'soup', 'spinach', 'stew', 'tofu', 'tomato',
+]
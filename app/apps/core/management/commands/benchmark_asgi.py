@@ -0,0 +1,127 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from apps.core.management import benchmarking
+
+
+class Command(BaseCommand):
+    # Django command to compare the throughput of the WSGI and the ASGI
+    # application under concurrent connections, both driven in process:
+    # WSGI with --workers threads handling one connection each, ASGI with one
+    # event loop and --workers database threads. --client-delay models slow
+    # clients: the response takes that long to send, which holds a WSGI
+    # thread but only suspends the connection under ASGI.
+    help = 'Seed a benchmark account and compare WSGI and ASGI throughput of the recipe API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=64, help='Open connections')
+        parser.add_argument('--workers', type=int, default=4, help='WSGI threads and ASGI database threads')
+        parser.add_argument('--client-delay', type=float, default=0.05, help='Seconds to send a response')
+        parser.add_argument('--path', default='/api/recipe/recipes/')
+        parser.add_argument('--query', default='page_size=100', help='Query string of the requests')
+        parser.add_argument('--no-seed', action='store_true', help='Reuse the data already seeded')
+
+    def handle(self, *args, **options):
+        user = benchmarking.get_benchmark_user()
+        if not options['no_seed']:
+            benchmarking.seed(user, recipes=options['recipes'], stdout=self.stdout)
+        self.token = Token.objects.get_or_create(user=user)[0].key
+
+        # measure the serving path, not the response cache
+        with override_settings(RECIPE_RESPONSE_CACHE='none', ASYNC_DATABASE_THREADS=options['workers']):
+            from config.asgi import application as asgi_application
+            from config.wsgi import application as wsgi_application
+
+            for delay in sorted({0, options['client_delay']}):
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{options["concurrency"]} connections, {options["workers"]} workers, '
+                    f'{delay * 1000:.0f} ms to send a response'
+                ))
+                wsgi = self.run_wsgi(wsgi_application, options, delay)
+                asgi = asyncio.run(self.run_asgi(asgi_application, options, delay))
+                self.stdout.write(f'  WSGI {wsgi:8.1f} requests/s')
+                self.stdout.write(f'  ASGI {asgi:8.1f} requests/s')
+                self.stdout.write(self.style.SUCCESS(f'  {asgi / wsgi:.2f}x'))
+
+    def run_wsgi(self, application, options, delay):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': options['path'],
+            'QUERY_STRING': options['query'],
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_AUTHORIZATION': f'Token {self.token}',
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+        }
+
+        def request(_):
+            statuses = []
+            body = application(dict(environ, **{'wsgi.input': io.BytesIO()}), lambda s, h: statuses.append(s))
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            time.sleep(delay)
+            assert statuses[0].startswith('200'), statuses[0]
+
+        request(None)
+        start = time.perf_counter()
+        # a connection holds its thread until the response is sent
+        with ThreadPoolExecutor(max_workers=min(options['workers'], options['concurrency'])) as pool:
+            list(pool.map(request, range(options['requests'])))
+        return options['requests'] / (time.perf_counter() - start)
+
+    async def run_asgi(self, application, options, delay):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': options['path'],
+            'raw_path': options['path'].encode(),
+            'query_string': options['query'].encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Token {self.token}'.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def request():
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(delay)
+
+            await application(dict(scope), receive, send)
+            assert statuses[0] == 200, statuses[0]
+
+        remaining = iter(range(options['requests']))
+
+        async def connection():
+            for _ in remaining:
+                await request()
+
+        await request()
+        start = time.perf_counter()
+        await asyncio.gather(*(connection() for _ in range(options['concurrency'])))
+        return options['requests'] / (time.perf_counter() - start)
@@ -0,0 +1,154 @@
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import Cursor
+
+from apps.core.management import benchmarking
+from apps.core.models import Tag, Ingredients, Recipe
+from apps.recipe.views import TagViewSet, IngredientViewSet, RecipeViewSet
+
+# the composite indexes --compare replaces with single column user_id
+# indexes; the other indexes of these models stay in place
+COMPOSITE_INDEXES = {
+    Tag: ['core_tag_user_name_idx'],
+    Ingredients: ['core_ingredients_user_name_idx'],
+    Recipe: ['core_recipe_user_id_idx'],
+}
+
+
+class Command(BaseCommand):
+    # Django command to benchmark the per-user query patterns of the recipe API
+    # prints the query plans and latencies with the composite indexes and,
+    # with --compare, with the single column user_id indexes they replaced
+    help = 'Seed a benchmark account and time the recipe API queries (PostgreSQL only).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--no-seed', action='store_true', help='Reuse the data already seeded')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also run without the composite indexes (inside a rolled back transaction)')
+        parser.add_argument('--no-plans', action='store_true', help='Only print latencies')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The index benchmark needs PostgreSQL.')
+
+        user = benchmarking.get_benchmark_user()
+        if not options['no_seed']:
+            benchmarking.seed(
+                user,
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+                stdout=self.stdout,
+            )
+        scenarios = self.get_scenarios(user)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('With composite indexes'))
+        self.run_scenarios(scenarios, options)
+
+        if options['compare']:
+            try:
+                with transaction.atomic():
+                    self.swap_indexes()
+                    self.stdout.write(self.style.MIGRATE_HEADING('With single column user_id indexes'))
+                    self.run_scenarios(scenarios, options)
+                    transaction.set_rollback(True)
+            finally:
+                self.restore_indexes()
+
+    def get_scenarios(self, user):
+        # (name, viewset, action, query parameters) for every access pattern
+        tags = list(Tag.objects.filter(user=user).order_by('id').values_list('id', flat=True)[:2])
+        ingredient = Ingredients.objects.filter(user=user).values_list('id', flat=True).first()
+        recipe = Recipe.objects.filter(user=user).values_list('id', flat=True).last()
+        deep_recipe = self.deep_position(Recipe, user, 'id')
+        deep_tag = self.deep_position(Tag, user, '-name')
+
+        return [
+            ('tags: first page', TagViewSet, 'list', {}),
+            ('tags: deep page', TagViewSet, 'list', {'cursor': self.cursor(TagViewSet, deep_tag)}),
+            ('tags: assigned_only', TagViewSet, 'list', {'assigned_only': 1}),
+            ('ingredients: first page', IngredientViewSet, 'list', {}),
+            ('ingredients: assigned_only', IngredientViewSet, 'list', {'assigned_only': 1}),
+            ('recipes: first page', RecipeViewSet, 'list', {}),
+            ('recipes: deep page', RecipeViewSet, 'list', {'cursor': self.cursor(RecipeViewSet, deep_recipe)}),
+            ('recipes: ?tags=', RecipeViewSet, 'list', {'tags': ','.join(map(str, tags))}),
+            ('recipes: ?tags= match=all', RecipeViewSet, 'list', {'tags': ','.join(map(str, tags)), 'match': 'all'}),
+            ('recipes: ?ingredients=', RecipeViewSet, 'list', {'ingredients': ingredient}),
+            ('recipes: retrieve', RecipeViewSet, 'retrieve', {'pk': recipe}),
+        ]
+
+    def deep_position(self, model, user, ordering):
+        # cursor position 90% of the way through the user's rows
+        queryset = model.objects.filter(user=user).order_by(ordering)
+        count = queryset.count()
+        field = ordering.lstrip('-')
+        return str(queryset.values_list(field, flat=True)[max(0, int(count * 0.9) - 1)])
+
+    def cursor(self, viewset_class, position):
+        # encode a pagination cursor pointing at position
+        paginator = viewset_class.pagination_class()
+        paginator.base_url = 'http://benchmark/'
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        return parse_qs(urlparse(url).query)[paginator.cursor_query_param][0]
+
+    def run_scenarios(self, scenarios, options):
+        user = benchmarking.get_benchmark_user()
+        for name, viewset_class, action, params in scenarios:
+            def run():
+                return self.call_view(viewset_class, action, user, dict(params))
+
+            run()
+            durations = benchmarking.timed(run, options['runs'])
+            self.stdout.write(f'{name:28} {benchmarking.summary(durations)}')
+            if not options['no_plans']:
+                self.explain(run)
+
+    def call_view(self, viewset_class, action, user, params):
+        # run the queryset and pagination code of a viewset action
+        pk = params.pop('pk', None)
+        request = benchmarking.api_request(user, params)
+        view = viewset_class(request=request, action=action, format_kwarg=None, args=(), kwargs={'pk': pk})
+        if action == 'retrieve':
+            return view.get_object()
+        queryset = view.filter_queryset(view.get_queryset())
+        return view.paginator.paginate_queryset(queryset, request, view=view)
+
+    def explain(self, run):
+        # print EXPLAIN ANALYZE for every query the scenario runs
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query['sql'])
+                plan = '\n'.join(f'    {row[0]}' for row in cursor.fetchall())
+                self.stdout.write(plan)
+
+    def swap_indexes(self):
+        # replace the composite indexes with the user_id indexes of 0005
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model, names in COMPOSITE_INDEXES.items():
+                table = model._meta.db_table
+                for name in names:
+                    cursor.execute(f'DROP INDEX {quote(name)}')
+                cursor.execute(f'CREATE INDEX {quote(table + "_bench_user_id")} ON {quote(table)} (user_id)')
+                cursor.execute(f'ANALYZE {quote(table)}')
+
+    def restore_indexes(self):
+        # the rollback normally undoes the swap; put back whatever it did not
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor, connection.schema_editor() as schema_editor:
+            for model, names in COMPOSITE_INDEXES.items():
+                table = model._meta.db_table
+                cursor.execute(f'DROP INDEX IF EXISTS {quote(table + "_bench_user_id")}')
+                existing = connection.introspection.get_constraints(cursor, table)
+                for index in model._meta.indexes:
+                    if index.name in names and index.name not in existing:
+                        schema_editor.add_index(model, index)
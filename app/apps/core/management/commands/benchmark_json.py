@@ -0,0 +1,70 @@
+import io
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.core.management import benchmarking
+from apps.core.models import Recipe
+from apps.core.parsers import FastJSONParser
+from apps.core.renderers import FastJSONRenderer
+from apps.recipe.views import RecipeViewSet
+
+
+class Command(BaseCommand):
+    # Django command to benchmark the JSON renderer and parser on recipe
+    # list payloads against DRF's stdlib based JSONRenderer and JSONParser
+    help = 'Seed a benchmark account and time rendering and parsing recipe lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--no-seed', action='store_true', help='Reuse the data already seeded')
+
+    def handle(self, *args, **options):
+        user = benchmarking.get_benchmark_user()
+        if not options['no_seed']:
+            benchmarking.seed(user, recipes=options['recipes'], stdout=self.stdout)
+
+        page = self.list_page(user, options['page_size'])
+        # the same recipes with Decimal prices, which only the encoder's
+        # fallback handles, and the user's last login datetime
+        raw = {
+            'last_login': user.last_login,
+            'recipes': list(Recipe.objects.filter(user=user).order_by('id').values(
+                'id', 'title', 'time_minutes', 'price', 'link'
+            )[:options['page_size']]),
+        }
+        payloads = [('recipe list page', page), ('rows with Decimal prices', raw)]
+
+        for name, data in payloads:
+            self.compare(
+                f'render {name}',
+                lambda: JSONRenderer().render(data),
+                lambda: FastJSONRenderer().render(data),
+                options['runs'],
+            )
+        body = JSONRenderer().render(page['results'])
+        self.compare(
+            'parse recipe list',
+            lambda: JSONParser().parse(io.BytesIO(body)),
+            lambda: FastJSONParser().parse(io.BytesIO(body)),
+            options['runs'],
+        )
+
+    def list_page(self, user, page_size):
+        # data of a recipe list response as the view returns it
+        request = APIRequestFactory().get('/', {'page_size': page_size}, HTTP_HOST='localhost')
+        force_authenticate(request, user=user)
+        return RecipeViewSet.as_view({'get': 'list'})(request).data
+
+    def compare(self, name, stdlib, fast, runs):
+        stdlib_durations = benchmarking.timed(stdlib, runs)
+        fast_durations = benchmarking.timed(fast, runs)
+        speedup = sorted(stdlib_durations)[runs // 2] / sorted(fast_durations)[runs // 2]
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(f'  json    {benchmarking.summary(stdlib_durations)}')
+        self.stdout.write(f'  orjson  {benchmarking.summary(fast_durations)}')
+        self.stdout.write(self.style.SUCCESS(f'  {speedup:.1f}x faster'))
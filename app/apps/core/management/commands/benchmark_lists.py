@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.core.management import benchmarking
+from apps.recipe.views import TagViewSet, IngredientViewSet, RecipeViewSet
+
+
+class Command(BaseCommand):
+    # Django command to benchmark the list endpoints end to end (queries,
+    # serialization and JSON rendering) with the lists built from values()
+    # rows against the same lists built by the serializers
+    help = 'Seed a benchmark account and time rendering full list pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--no-seed', action='store_true', help='Reuse the data already seeded')
+
+    def handle(self, *args, **options):
+        user = benchmarking.get_benchmark_user()
+        if not options['no_seed']:
+            benchmarking.seed(
+                user,
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+                stdout=self.stdout,
+            )
+        params = {'page_size': options['page_size']}
+        for name, viewset_class in (('tags', TagViewSet), ('ingredients', IngredientViewSet),
+                                    ('recipes', RecipeViewSet)):
+            results = {}
+            for label, representation in (('values rows', viewset_class.list_representation_class),
+                                          ('serializer', None)):
+                view = viewset_class.as_view({'get': 'list'}, list_representation_class=representation)
+
+                def run():
+                    return self.render(view, user, params)
+
+                body = run()
+                results[label] = (benchmarking.timed(run, options['runs']), body)
+                self.stdout.write(f'{name:12} {label:12} {benchmarking.summary(results[label][0])}')
+            fast, slow = results['values rows'], results['serializer']
+            speedup = sorted(slow[0])[len(slow[0]) // 2] / sorted(fast[0])[len(fast[0]) // 2]
+            same = 'identical' if fast[1] == slow[1] else 'DIFFERENT'
+            self.stdout.write(self.style.SUCCESS(f'{name:12} {speedup:.1f}x faster, bodies {same}'))
+
+    @override_settings(RECIPE_RESPONSE_CACHE='none')
+    def render(self, view, user, params):
+        # run a list request through the view and return the rendered body
+        request = APIRequestFactory().get('/', params, HTTP_HOST='localhost')
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        return response.content
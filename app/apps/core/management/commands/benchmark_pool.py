@@ -0,0 +1,90 @@
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from apps.core.backends.postgresql_pool.base import close_pools, pool_stats
+from apps.core.management import benchmarking
+
+
+class Command(BaseCommand):
+    # Django command to time a cheap endpoint through the WSGI application,
+    # which connects at the start of every request and closes at the end,
+    # with a new PostgreSQL connection per request against the pool. The
+    # response cache is off so that every request queries the database.
+    help = 'Time a cheap API request with and without the database connection pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent requests of the threaded run')
+        parser.add_argument('--path', default='/api/recipe/tags/')
+        parser.add_argument('--query', default='page_size=1')
+
+    @override_settings(RECIPE_RESPONSE_CACHE='none')
+    def handle(self, *args, **options):
+        settings_dict = connections['default'].settings_dict
+        if 'POOL' not in settings_dict:
+            raise CommandError('The default database does not use the pooled backend.')
+        user = benchmarking.get_benchmark_user()
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        connections['default'].close()
+
+        from config.wsgi import application
+
+        pool = settings_dict['POOL']
+        results = {}
+        try:
+            for label, max_size in (('new connection', 0), ('pooled', max(pool.get('MAX_SIZE', 0), options['threads']))):
+                settings_dict['POOL'] = dict(pool, MAX_SIZE=max_size)
+
+                def run():
+                    self.request(application, options['path'], options['query'])
+
+                run()
+                durations = benchmarking.timed(run, options['runs'])
+                with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                    threaded = benchmarking.timed(
+                        lambda: list(executor.map(lambda _: run(), range(options['threads']))),
+                        options['runs'] // options['threads'],
+                    )
+                results[label] = durations
+                self.stdout.write(f'{label:15} sequential  {benchmarking.summary(durations)}')
+                self.stdout.write(f'{label:15} {options["threads"]} threads   {benchmarking.summary(threaded)}')
+            for alias, stats in pool_stats().items():
+                for pool_stat in stats:
+                    self.stdout.write(f'pool {alias}: {pool_stat}')
+        finally:
+            settings_dict['POOL'] = pool
+            close_pools()
+
+        before, after = results['new connection'], results['pooled']
+        speedup = sorted(before)[len(before) // 2] / sorted(after)[len(after) // 2]
+        self.stdout.write(self.style.SUCCESS(f'{speedup:.1f}x faster with the pool'))
+
+    def request(self, application, path, query):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'HTTP_AUTHORIZATION': f'Token {self.token}',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+        }
+        statuses = []
+        body = application(environ, lambda status, headers: statuses.append(status))
+        try:
+            b''.join(body)
+        finally:
+            body.close()
+        if not statuses[0].startswith('200'):
+            raise CommandError(f'{path} answered {statuses[0]}')
@@ -0,0 +1,180 @@
+import heapq
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models.functions import Collate
+
+from apps.core.models import MediaBlob, Recipe
+
+# orphans are confirmed against the database this many at a time
+DELETE_BATCH_SIZE = 500
+
+
+def is_derived(name, original):
+    # name is original itself or a file derived from it (<original>.<suffix>)
+    return name == original or name.startswith(original + '.')
+
+
+def possible_originals(name):
+    # name and every prefix of it ending before a dot of the file name
+    directory, _, file_name = name.rpartition('/')
+    names = [name]
+    for index, char in enumerate(file_name):
+        if char == '.' and index:
+            names.append(f'{directory}/{file_name[:index]}' if directory else file_name[:index])
+    return names
+
+
+class Command(BaseCommand):
+    # Django command to delete media files no recipe refers to anymore
+    # the media tree and the Recipe.image column of every shard are read in
+    # sorted order and merge-joined, so memory stays flat however many files
+    # exist
+    help = 'Delete orphaned recipe images and their variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='uploads', help='Directory under MEDIA_ROOT to collect')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Keep files modified in the last N seconds (uploads not committed yet)')
+        parser.add_argument('--rate', type=float, default=200, help='Deletions per second, 0 for no limit')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Image names read per query')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.rate = options['rate']
+        self.cutoff = time.time() - options['min_age']
+        self.last_delete = 0
+        self.deleted = 0
+        self.freed = 0
+        scanned = 0
+        pending = []
+
+        files = self.walk(options['path'])
+        references = self.referenced_names(options['batch_size'])
+        for name, entry in self.orphans(files, references):
+            scanned += 1
+            if entry is None or entry.stat().st_mtime > self.cutoff:
+                continue
+            pending.append((name, entry))
+            if len(pending) >= DELETE_BATCH_SIZE:
+                self.delete(pending)
+                pending = []
+        self.delete(pending)
+
+        verb = 'would delete' if self.dry_run else 'deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} files, {verb} {self.deleted} ({self.freed / 1024 / 1024:.1f} MB)'
+        ))
+
+    def walk(self, path):
+        # yield (name, DirEntry) of the files under path in the code point
+        # order of their names relative to MEDIA_ROOT; a directory sorts as
+        # "<name>/" since the names of its files continue after a slash
+        directory = os.path.join(settings.MEDIA_ROOT, path)
+        try:
+            with os.scandir(directory) as scan:
+                entries = sorted(scan, key=lambda e: e.name + '/' if e.is_dir(follow_symlinks=False) else e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            name = f'{path}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                yield from self.walk(name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry
+
+    def referenced_names(self, batch_size):
+        # yield the distinct Recipe.image names of every shard in code point
+        # order, merging the sorted names of each
+        last = None
+        names = (self.shard_names(alias, batch_size) for alias in settings.SHARD_DATABASES)
+        for name in heapq.merge(*names):
+            if name != last:
+                yield name
+            last = name
+
+    def shard_names(self, using, batch_size):
+        # yield the distinct Recipe.image names of one shard in code point
+        # order, one keyset batch at a time; PostgreSQL compares with the C
+        # collation to match, SQLite compares bytes already
+        queryset = Recipe.objects.using(using).exclude(image__isnull=True).exclude(image='')
+        key = 'image'
+        if connections[using].vendor == 'postgresql':
+            queryset = queryset.annotate(image_c=Collate('image', 'C'))
+            key = 'image_c'
+        last = None
+        while True:
+            batch = queryset if last is None else queryset.filter(**{f'{key}__gt': last})
+            names = list(batch.order_by(key).values_list(key, flat=True).distinct()[:batch_size])
+            yield from names
+            if len(names) < batch_size:
+                return
+            last = names[-1]
+
+    def orphans(self, files, references):
+        # merge-join both sorted streams and yield (name, DirEntry) for every
+        # file, with None instead of the entry for files still in use
+        references = iter(references)
+        reference = next(references, None)
+        # referenced names that are prefixes of each other and of the names
+        # still to come, anything derived from them sorts right after them
+        prefixes = []
+        for name, entry in files:
+            while reference is not None and reference <= name:
+                while prefixes and not reference.startswith(prefixes[-1]):
+                    prefixes.pop()
+                prefixes.append(reference)
+                reference = next(references, None)
+            # a name sorts after everything starting with a reference it does
+            # not start with itself, so those references are done with
+            while prefixes and not name.startswith(prefixes[-1]):
+                prefixes.pop()
+            used = any(is_derived(name, prefix) for prefix in prefixes)
+            yield name, None if used else entry
+
+    def delete(self, pending):
+        # delete a batch of orphans after checking again that no recipe on
+        # any shard took one of them in the meantime, identical uploads reuse
+        # stored files
+        if not pending:
+            return
+        candidates = {original for name, _ in pending for original in possible_originals(name)}
+        claimed = set()
+        for alias in settings.SHARD_DATABASES:
+            claimed.update(Recipe.objects.using(alias).filter(image__in=candidates).values_list('image', flat=True))
+        removed = []
+        for name, entry in pending:
+            if any(original in claimed for original in possible_originals(name)):
+                continue
+            try:
+                stat = os.stat(entry.path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > self.cutoff:
+                continue
+            if self.dry_run:
+                self.stdout.write(f'Would delete {name}')
+            else:
+                self.throttle()
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            removed.append(name)
+            self.deleted += 1
+            self.freed += stat.st_size
+        if removed and not self.dry_run:
+            MediaBlob.objects.filter(name__in=removed).delete()
+
+    def throttle(self):
+        # keep deletions under --rate per second to spare the disk
+        if not self.rate:
+            return
+        wait = self.last_delete + 1 / self.rate - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_delete = time.monotonic()
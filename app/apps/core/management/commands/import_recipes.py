@@ -0,0 +1,389 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from apps.core.models import ImportCheckpoint, Ingredients, Recipe, Tag
+from apps.core.sharding import use_shard
+from apps.recipe.counters import adjust_counts
+from apps.recipe.export import CSV_LIST_SEPARATOR
+from apps.recipe.search import search_vector_sql, update_search_vectors
+from apps.recipe.versioning import bump_user_version
+
+MAX_PRICE = Decimal('1000')
+
+# temporary table holding one batch on its way into core_recipe
+STAGING_TABLE = 'import_recipes_batch'
+STAGING_COLUMNS = ['id', 'title', 'time_minutes', 'price', 'link', 'tag_names', 'ingredient_names']
+
+# bytes at the start of the file and before the checkpoint offset that its
+# fingerprint covers
+FINGERPRINT_BLOCK = 64 * 1024
+
+
+def fingerprint(path, offset):
+    # digest of the first block of the file and of the block ending at
+    # offset: a resumed import must find the same bytes it stopped after,
+    # while rows appended since are fine
+    digest = hashlib.sha256(str(offset).encode())
+    with open(path, 'rb') as file:
+        digest.update(file.read(min(offset, FINGERPRINT_BLOCK)))
+        start = max(0, offset - FINGERPRINT_BLOCK)
+        file.seek(start)
+        digest.update(file.read(offset - start))
+    return digest.hexdigest()
+
+
+def in_background(iterable, depth=2):
+    # iterate iterable in a thread, at most depth items ahead of the caller,
+    # so parsing the next batch overlaps with the database writing this one
+    items = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except BaseException as exc:
+            items.put(exc)
+        else:
+            items.put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+class OffsetReader:
+    # Iterates the lines of a binary file as text and tracks the byte
+    # offset and number of the last line handed out, for the checkpoints
+
+    def __init__(self, file, offset=0, line=0):
+        self.file = file
+        self.offset = offset
+        self.line = line
+
+    def __iter__(self):
+        self.file.seek(self.offset)
+        for raw in self.file:
+            self.offset += len(raw)
+            self.line += 1
+            yield raw.decode('utf-8')
+
+
+class NameMap:
+    # name -> id of the user's tags or ingredients, creating missing names
+    # in one batch so every name is stored once per user
+
+    def __init__(self, model, user):
+        self.model = model
+        self.user = user
+        # ordered so that the oldest of any duplicate names wins
+        self.ids = dict(model.objects.filter(user=user).order_by('-id').values_list('name', 'id'))
+
+    def create_missing(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.ids]
+        if not missing:
+            return
+        objects = [self.model(user=self.user, name=name) for name in missing]
+        if connections[self.model.objects.db].features.can_return_rows_from_bulk_insert:
+            self.model.objects.bulk_create(objects)
+        else:
+            for obj in objects:
+                obj.save()
+        self.ids.update((obj.name, obj.id) for obj in objects)
+
+
+def parse_names(value):
+    # tag or ingredient names from a list of names or of {"name": ...}
+    # objects (NDJSON), or from names joined with CSV_LIST_SEPARATOR (CSV)
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = value.split(CSV_LIST_SEPARATOR)
+    if not isinstance(value, list):
+        raise ValueError('tags and ingredients must be lists')
+    names = []
+    for item in value:
+        name = item.get('name') if isinstance(item, dict) else item
+        if not isinstance(name, str):
+            raise ValueError(f'invalid name {name!r}')
+        name = name.strip()
+        if len(name) > 255:
+            raise ValueError(f'name longer than 255 characters: {name[:20]}...')
+        if name:
+            names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def parse_recipe(data):
+    # validate one record of an export file, return
+    # (title, time_minutes, price, link, tag names, ingredient names)
+    if not isinstance(data, dict):
+        raise ValueError('expected an object')
+    title = str(data.get('title') or '').strip()
+    if not title or len(title) > 255:
+        raise ValueError('title must have 1 to 255 characters')
+    try:
+        time_minutes = int(data.get('time_minutes'))
+        price = Decimal(str(data.get('price'))).quantize(Decimal('0.01'))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError('time_minutes must be an integer and price a decimal')
+    if not price.is_finite() or abs(price) >= MAX_PRICE:
+        raise ValueError('price must be below 1000')
+    link = str(data.get('link') or '')
+    if len(link) > 255:
+        raise ValueError('link longer than 255 characters')
+    return title, time_minutes, price, link, parse_names(data.get('tags')), parse_names(data.get('ingredients'))
+
+
+def copy_value(value):
+    # a value in the text format of PostgreSQL COPY
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table, columns, rows):
+    quote = cursor.db.ops.quote_name
+    data = io.StringIO(''.join('\t'.join(map(copy_value, row)) + '\n' for row in rows))
+    cursor.copy_expert(f'COPY {quote(table)} ({", ".join(map(quote, columns))}) FROM STDIN', data)
+
+
+class Command(BaseCommand):
+    # Django command to load recipe datasets in the export formats of
+    # /api/recipe/recipes/export/ into one user's account
+    # the file is parsed as a stream and written in large batches (COPY on
+    # PostgreSQL); a checkpoint committed with every batch lets an
+    # interrupted import continue where it stopped
+    help = 'Import recipes from an NDJSON or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Email of the account receiving the recipes')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint name, defaults to the absolute path of the file; kept per user')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+        parser.add_argument('--max-errors', type=int, default=100, help='Abort after this many invalid records')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in ('ndjson', 'csv'):
+            raise CommandError('Pass --format ndjson or --format csv.')
+        try:
+            self.user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["user"]}.')
+
+        # the rows go to the user's shard, and so does the checkpoint, which
+        # is saved in the same transactions
+        self.using = self.user.shard
+        with use_shard(self.using):
+            self.import_file(path, file_format, options)
+
+    def import_file(self, path, file_format, options):
+        name = options['checkpoint'] or os.path.abspath(path)
+        checkpoint, _ = ImportCheckpoint.objects.using(self.using).get_or_create(user=self.user, name=name)
+        if options['restart']:
+            checkpoint.offset = checkpoint.line = checkpoint.recipes = 0
+        elif checkpoint.offset and checkpoint.fingerprint != fingerprint(path, checkpoint.offset):
+            raise CommandError(
+                f'{path} changed since the checkpoint at line {checkpoint.line}; '
+                f'pass --restart to import it from the start.'
+            )
+        self.path = path
+        self.checkpoint = checkpoint
+        self.max_errors = options['max_errors']
+        self.errors = 0
+        self.tags = NameMap(Tag, self.user)
+        self.ingredients = NameMap(Ingredients, self.user)
+        self.postgres = connections[Recipe.objects.db].vendor == 'postgresql'
+
+        size = os.path.getsize(path)
+        started = time.monotonic()
+        imported = 0
+        if checkpoint.offset:
+            self.stdout.write(f'Resuming at line {checkpoint.line + 1} ({checkpoint.recipes} recipes imported)')
+        with open(path, 'rb') as file:
+            reader = OffsetReader(file, checkpoint.offset, checkpoint.line)
+            records = self.read_csv(reader) if file_format == 'csv' else self.read_ndjson(reader)
+            batches = self.batches(records, reader, options['batch_size'])
+            for batch, offset, line in in_background(batches):
+                imported += self.write(batch, offset, line)
+                self.progress(imported, started, offset, size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes in {time.monotonic() - started:.1f}s '
+            f'({checkpoint.recipes} in total), skipped {self.errors} invalid records'
+        ))
+
+    def read_ndjson(self, reader):
+        for line in reader:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield exc
+
+    def read_csv(self, reader):
+        # the header is read again on every run, then the rows continue at
+        # the checkpoint; csv pulls only the lines a row needs, so the
+        # reader offset is always at the end of the last row
+        offset, line = reader.offset, reader.line
+        reader.offset = reader.line = 0
+        header = next(csv.reader(iter(reader)), None)
+        if header is None:
+            return
+        if offset:
+            reader.offset, reader.line = offset, line
+        header[0] = header[0].lstrip('\ufeff')
+        for row in csv.reader(iter(reader)):
+            if row:
+                yield dict(zip(header, row))
+
+    def batches(self, records, reader, batch_size):
+        # yield (recipes, offset, line) with the position after each batch;
+        # the last batch may be empty, it still moves the checkpoint
+        batch = []
+        for record in records:
+            recipe = self.parse(record, reader.line)
+            if recipe is not None:
+                batch.append(recipe)
+            if len(batch) >= batch_size:
+                yield batch, reader.offset, reader.line
+                batch = []
+        yield batch, reader.offset, reader.line
+
+    def parse(self, record, line):
+        try:
+            if isinstance(record, Exception):
+                raise ValueError(str(record))
+            return parse_recipe(record)
+        except ValueError as exc:
+            self.errors += 1
+            self.stderr.write(f'Line {line}: {exc}')
+            if self.errors > self.max_errors:
+                raise CommandError(f'More than {self.max_errors} invalid records, stopping.')
+            return None
+
+    def write(self, batch, offset, line):
+        # write a batch of parsed recipes with their relations and move the
+        # checkpoint past it, all in one transaction
+        with transaction.atomic(using=self.using):
+            self.tags.create_missing(name for recipe in batch for name in recipe[4])
+            self.ingredients.create_missing(name for recipe in batch for name in recipe[5])
+            if self.postgres:
+                self.copy_recipes(batch)
+            else:
+                self.insert_recipes(batch)
+            # the links are new, so every one adds a recipe to its target
+            for model, index, names in ((Tag, 4, self.tags), (Ingredients, 5, self.ingredients)):
+                adjust_counts(
+                    model, Counter(names.ids[name] for recipe in batch for name in recipe[index]), using=self.using
+                )
+
+            self.checkpoint.offset = offset
+            self.checkpoint.line = line
+            self.checkpoint.fingerprint = fingerprint(self.path, offset)
+            self.checkpoint.recipes += len(batch)
+            self.checkpoint.save(using=self.using)
+            if batch:
+                # bulk writes send no model signals, so mark the change here
+                user_id = self.user.id
+                transaction.on_commit(lambda: bump_user_version(user_id), using=self.using)
+        return len(batch)
+
+    def links(self, batch, recipe_ids):
+        # (through model, column, rows) of the tag and ingredient links
+        for index, relation, names in ((4, 'tags', self.tags), (5, 'ingredients', self.ingredients)):
+            field = Recipe._meta.get_field(relation)
+            rows = [
+                (recipe_id, names.ids[name])
+                for recipe_id, recipe in zip(recipe_ids, batch)
+                for name in recipe[index]
+            ]
+            yield field.remote_field.through, field.m2m_reverse_name(), rows
+
+    def copy_recipes(self, batch):
+        # COPY the batch into a temporary table and INSERT ... SELECT it into
+        # the recipes, computing the search vectors on the way in from the
+        # names at hand instead of updating every new row afterwards; the
+        # primary keys are reserved from the sequence first, so the links can
+        # be copied straight into the through tables
+        connection = connections[Recipe.objects.db]
+        quote = connection.ops.quote_name
+        table = Recipe._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, len(batch)],
+            )
+            recipe_ids = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} (id bigint, title text, time_minutes integer, '
+                f'price numeric, link text, tag_names text, ingredient_names text)'
+            )
+            cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+            copy_rows(cursor, STAGING_TABLE, STAGING_COLUMNS, (
+                (recipe_id, title, time_minutes, price, link, ' '.join(tags), ' '.join(ingredients))
+                for recipe_id, (title, time_minutes, price, link, tags, ingredients) in zip(recipe_ids, batch)
+            ))
+            vector = search_vector_sql('b.title', 'b.tag_names', 'b.ingredient_names')
+            columns = ['id', 'user_id', 'title', 'time_minutes', 'price', 'link', 'image_variants', 'search_vector']
+            cursor.execute(
+                f"INSERT INTO {quote(table)} ({', '.join(map(quote, columns))}) "
+                f"SELECT b.id, %(user)s, b.title, b.time_minutes, b.price, b.link, '{{}}', {vector} "
+                f"FROM {STAGING_TABLE} b",
+                {'user': self.user.id, 'config': settings.RECIPE_SEARCH_CONFIG},
+            )
+
+            for through, column, rows in self.links(batch, recipe_ids):
+                copy_rows(cursor, through._meta.db_table, ['recipe_id', column], rows)
+        return recipe_ids
+
+    def insert_recipes(self, batch):
+        # batched INSERTs for other databases; like the bulk endpoint, one
+        # INSERT per recipe where the new primary keys cannot be returned
+        recipes = [
+            Recipe(user=self.user, title=title, time_minutes=time_minutes, price=price, link=link)
+            for title, time_minutes, price, link, _, _ in batch
+        ]
+        if connections[Recipe.objects.db].features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        recipe_ids = [recipe.id for recipe in recipes]
+        for through, column, rows in self.links(batch, recipe_ids):
+            through.objects.bulk_create([through(recipe_id=recipe_id, **{column: target}) for recipe_id, target in rows])
+        update_search_vectors(recipe_ids, using=Recipe.objects.db)
+        return recipe_ids
+
+    def progress(self, imported, started, offset, size):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{self.checkpoint.recipes} recipes imported, {imported / elapsed:.0f}/s, '
+            f'{offset * 100 / max(size, 1):.1f}% of the file'
+        )
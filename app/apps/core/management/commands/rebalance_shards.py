@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.sharding import ShardMoveError, move_user, pick_shard
+
+
+class Command(BaseCommand):
+    # Django command to move users' tags, ingredients and recipes between
+    # shards while the API keeps serving them (see apps.core.sharding);
+    # without --user it moves every user whose email now hashes to another
+    # shard, e.g. after a shard was added to SHARD_DATABASES
+    help = 'Move users to another shard, by default to the shard their email hashes to.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], help='Email of a user to move, repeatable')
+        parser.add_argument('--to', help='Target shard alias, instead of the one the email hashes to')
+        parser.add_argument('--grace', type=float, default=None,
+                            help='Seconds writes wait before and after the switch '
+                                 '(default AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows copied per INSERT')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the moves')
+
+    def handle(self, *args, **options):
+        if options['to'] is not None and options['to'] not in settings.SHARD_DATABASES:
+            raise CommandError(f'{options["to"]} is not one of the shards {settings.SHARD_DATABASES}.')
+        users = get_user_model().objects.using('default').order_by('pk')
+        if options['user']:
+            users = users.filter(email__in=options['user'])
+            missing = set(options['user']) - set(users.values_list('email', flat=True))
+            if missing:
+                raise CommandError(f'No user with email {", ".join(sorted(missing))}.')
+
+        moved = 0
+        for user in list(users.only('id', 'email', 'shard')):
+            target = options['to'] or pick_shard(user.email)
+            if target == user.shard:
+                continue
+            self.stdout.write(f'{user.email}: {user.shard} -> {target}')
+            if options['dry_run']:
+                continue
+            try:
+                rows = move_user(
+                    user, target,
+                    grace=options['grace'],
+                    batch_size=options['batch_size'],
+                    log=lambda message: self.stdout.write(f'  {message}'),
+                )
+            except ShardMoveError as exc:
+                raise CommandError(str(exc))
+            moved += 1
+            self.stdout.write(self.style.SUCCESS(f'  moved {rows} rows'))
+        self.stdout.write(self.style.SUCCESS(f'{moved} users moved'))
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from apps.core.sharding import use_shard
+from apps.recipe.counters import RELATIONS, recount
+
+
+class Command(BaseCommand):
+    # Django command to repair Tag.recipe_count and Ingredients.recipe_count
+    # the rows are recounted shard by shard in primary key batches, one
+    # UPDATE each, which only writes the counters that drifted
+    help = 'Recompute the recipe counts of tags and ingredients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only the tags and ingredients of the user with this email')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows recounted per statement')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(email=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist.')
+
+        shards = settings.SHARD_DATABASES if user is None else [user.shard]
+        for model in RELATIONS:
+            checked = fixed = 0
+            for shard in shards:
+                with use_shard(shard):
+                    queryset = model.objects.all() if user is None else model.objects.filter(user=user)
+                    last = None
+                    while True:
+                        batch = queryset if last is None else queryset.filter(pk__gt=last)
+                        ids = list(batch.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+                        if not ids:
+                            break
+                        with transaction.atomic(using=shard):
+                            fixed += recount(model.objects.filter(pk__in=ids))
+                        checked += len(ids)
+                        last = ids[-1]
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: checked {checked}, fixed {fixed}'
+            ))
@@ -1,21 +1,47 @@
+import random
 import time
 
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.health import ping, required_databases
 
 
 class Command(BaseCommand):
-    # Django command to pause execution until database is avaiable
+    # Django command to pause execution until the databases answer queries
+    # looking a connection up does not connect, so each database is sent a
+    # query, retried with exponential backoff and full jitter until --timeout
+    help = 'Wait until the databases accept queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', default=[],
+                            help='Alias of a database to wait for, repeatable (default the primary and shards)')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait in total')
+        parser.add_argument('--delay', type=float, default=0.1, help='Seconds before the first retry')
+        parser.add_argument('--max-delay', type=float, default=5, help='Longest wait between two retries')
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
         self.stdout.write('Waiting for postgres...')
-        db_conn = None
-        while not db_conn:
-            try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 sec...')
-                time.sleep(1)
+        deadline = time.monotonic() + options['timeout']
+        for alias in options['database'] or required_databases():
+            self.wait(alias, deadline, options['delay'], options['max_delay'])
 
         self.stdout.write(self.style.SUCCESS('Database available'))
+
+    def wait(self, alias, deadline, delay, max_delay):
+        attempt = 0
+        while True:
+            try:
+                ping(alias)
+                return
+            except OperationalError as exc:
+                # forget the failed connection, the next query reconnects
+                connections[alias].close()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(f'Database {alias} unavailable: {str(exc).strip()}')
+                sleep = min(remaining, random.uniform(0, min(max_delay, delay * 2 ** attempt)))
+                attempt += 1
+                self.stdout.write(f'Database {alias} unavailable, waiting {sleep:.2f} sec...')
+                time.sleep(sleep)
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.9 on 2026-10-18 04:43
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# GinIndex cannot be declared in Meta.indexes because the tests run on
+# SQLite, so the index is only created when migrating PostgreSQL
+CREATE_INDEX = 'CREATE INDEX core_recipe_search_vector_gin ON core_recipe USING gin (search_vector)'
+DROP_INDEX = 'DROP INDEX IF EXISTS core_recipe_search_vector_gin'
+
+# the text search config is the %(config)s parameter, RECIPE_SEARCH_CONFIG
+# like for the vectors the signals maintain
+BACKFILL = """
+UPDATE core_recipe AS r SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(r.title, '')), 'A') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(t.name, ' ') FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = r.id), '')), 'B') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(i.name, ' ') FROM core_ingredients i
+        JOIN core_recipe_ingredients ri ON ri.ingredients_id = i.id
+        WHERE ri.recipe_id = r.id), '')), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(BACKFILL, {'config': settings.RECIPE_SEARCH_CONFIG})
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_per_user_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.9 on 2026-10-18 04:53
+
+import apps.core.models
+import apps.core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_images(apps, schema_editor):
+    # images uploaded before content addressing keep their names, count
+    # their references so they are deleted once no recipe shows them
+    Recipe = apps.get_model('core', 'Recipe')
+    MediaBlob = apps.get_model('core', 'MediaBlob')
+    images = Recipe.objects.exclude(image__isnull=True).exclude(image='').values('image').annotate(
+        references=Count('id')
+    ).order_by()
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=row['image'], refcount=row['references']) for row in images.iterator()),
+        batch_size=10000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=apps.core.storage.ContentAddressedStorage(), upload_to=apps.core.models.recipe_image_file_path),
+        ),
+        migrations.RunPython(count_existing_images, migrations.RunPython.noop),
+    ]
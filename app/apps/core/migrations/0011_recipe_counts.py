@@ -0,0 +1,46 @@
+# Generated by Django 3.2.9 on 2026-10-18 05:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_links(apps, schema_editor):
+    # the counters start from the links already stored
+    Recipe = apps.get_model('core', 'Recipe')
+    for relation, model_name in (('tags', 'Tag'), ('ingredients', 'Ingredients')):
+        field = Recipe._meta.get_field(relation)
+        target = field.m2m_reverse_name()
+        links = field.remote_field.through.objects.filter(**{target: OuterRef('pk')}).order_by().values(
+            target
+        ).annotate(count=Count('*')).values('count')
+        apps.get_model('core', model_name).objects.update(recipe_count=Coalesce(Subquery(links), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredients',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_links, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredients',
+            index=models.Index(fields=['user', 'recipe_count', 'id'], name='core_ingr_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count', 'id'], name='core_tag_user_count_idx'),
+        ),
+    ]
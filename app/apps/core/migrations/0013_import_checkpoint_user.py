@@ -0,0 +1,34 @@
+# Generated by Django 3.2.9 on 2026-10-18 06:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_user_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='importcheckpoint',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='importcheckpoint',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='core_importcheckpoint_user_name'),
+        ),
+    ]
@@ -1,17 +1,24 @@
 import os
-import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from .sharding import pick_shard
+from .storage import ContentAddressedStorage
+
+recipe_image_storage = ContentAddressedStorage()
 
 
 def recipe_image_file_path(instance, file_name):
     # generate file path for a new recipe image
+    # recipe_image_storage replaces the file name with the content hash,
+    # only the directory and the extension are kept
     extension = file_name.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{extension}'
 
-    return os.path.join('uploads/recipe/', filename)
+    return os.path.join('uploads/recipe/', f'image.{extension}')
 
 
 class UserManager(BaseUserManager):
@@ -20,7 +27,9 @@ class UserManager(BaseUserManager):
         # Creates and saves a new user
         if not email:
             raise ValueError('User must have a unique email address')
-        user = self.model(email=self.normalize_email(email), **extra_fields)
+        email = self.normalize_email(email)
+        extra_fields.setdefault('shard', pick_shard(email))
+        user = self.model(email=email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
 
@@ -42,6 +51,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # database alias holding the user's tags, ingredients and recipes, see
+    # apps.core.sharding
+    shard = models.CharField(max_length=100, default='default', editable=False)
 
     objects = UserManager()
 
@@ -51,11 +63,24 @@ class User(AbstractBaseUser, PermissionsMixin):
 class Tag(models.Model):
     # Tag to be used for a recipe
     name = models.CharField(max_length=255)
+    # indexed through the (user, name, id) index below
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_index=False,
+        # the user may live on another database (see apps.core.sharding)
+        db_constraint=False,
     )
 
+    # recipes linked to this row, kept up to date by apps.recipe.counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name', 'id'], name='core_tag_user_name_idx'),
+            models.Index(fields=['user', 'recipe_count', 'id'], name='core_tag_user_count_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -63,20 +88,37 @@ class Tag(models.Model):
 class Ingredients(models.Model):
     # Ingredients to be used in the recipe
     name = models.CharField(max_length=255)
+    # indexed through the (user, name, id) index below
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False,
+        # the user may live on another database (see apps.core.sharding)
+        db_constraint=False,
     )
 
+    # recipes linked to this row, kept up to date by apps.recipe.counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name', 'id'], name='core_ingredients_user_name_idx'),
+            models.Index(fields=['user', 'recipe_count', 'id'], name='core_ingr_user_count_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 
 class Recipe(models.Model):
     # Recipe object
+    # indexed through the (user, id) index below
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False,
+        # the user may live on another database (see apps.core.sharding)
+        db_constraint=False,
     )
     title = models.CharField(max_length=255)
     time_minutes = models.IntegerField()
@@ -84,7 +126,79 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredients')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(null=True, upload_to=recipe_image_file_path, storage=recipe_image_storage)
+    # storage names of the resized copies of image, filled in by the
+    # background pipeline in apps.recipe.images: {variant: {format: name}}
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # title, tag and ingredient names for full-text search, kept up to date
+    # by apps.recipe.search; GIN indexed on PostgreSQL (see migration 0007)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class MediaBlobManager(models.Manager):
+
+    def acquire(self, name, size=0):
+        # count one more reference to the stored file name
+        if self.filter(name=name).update(refcount=F('refcount') + 1):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, size=size, refcount=1)
+        except IntegrityError:
+            # created by a concurrent upload of the same file
+            self.filter(name=name).update(refcount=F('refcount') + 1)
+
+    def release(self, name):
+        # drop one reference, return whether it was the last one
+        self.filter(name=name).update(refcount=F('refcount') - 1)
+        deleted, _ = self.filter(name=name, refcount__lte=0).delete()
+        return bool(deleted)
+
+
+class MediaBlob(models.Model):
+    # A stored file shared by every row referencing its content
+    # see apps.core.storage.ContentAddressedStorage
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+
+    objects = MediaBlobManager()
+
+    def __str__(self):
+        return self.name
+
+
+class ImportCheckpoint(models.Model):
+    # Progress of a recipe import, saved in the same transaction as each
+    # imported batch so a resumed import neither skips nor repeats rows
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        # checkpoints of imports older than this field belong to no user
+        null=True,
+        # the user may live on another database (see apps.core.sharding)
+        db_constraint=False,
+    )
+    name = models.CharField(max_length=255)
+    offset = models.BigIntegerField(default=0)
+    line = models.BigIntegerField(default=0)
+    recipes = models.BigIntegerField(default=0)
+    # digest of the file contents before offset, checked before resuming
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='core_importcheckpoint_user_name'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,30 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import json
+
+from .renderers import FastJSONRenderer, orjson, use_orjson
+
+
+class FastJSONParser(JSONParser):
+    # JSONParser backed by orjson for UTF-8 bodies, see FastJSONRenderer
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not use_orjson() or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+        # orjson rejects a few documents the stdlib accepts (integers beyond
+        # 64 bits); parse those with it and report its errors otherwise
+        try:
+            return json.loads(body.decode(encoding))
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+# Renders everything orjson handles natively in C and hands the rest
+# (Decimal, datetimes, lazy translations, querysets...) to DRF's encoder, so
+# the output is byte for byte what JSONRenderer produces. JSON_BACKEND = 'json'
+# or a missing orjson switches back to the stdlib encoder.
+
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+_encoder = JSONEncoder()
+
+
+def use_orjson():
+    return orjson is not None and settings.JSON_BACKEND == 'orjson'
+
+
+class FastJSONRenderer(JSONRenderer):
+    # JSONRenderer backed by orjson for the compact UTF-8 output the API
+    # returns; indented, ASCII-only or non-strict output uses the stdlib
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (not use_orjson() or self.ensure_ascii or not self.compact or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits; the stdlib encodes them or
+            # raises the error JSONRenderer would
+            return super().render(data, accepted_media_type, renderer_context)
+        # escape U+2028 and U+2029 like JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,140 @@
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from .sharding import is_sharded, shard_for_query
+
+# Reads go to the primary unless a view opts in with read_from_replica(),
+# which picks one replica for the rest of the request so that its queries
+# see a single snapshot. Replicas more than REPLICA_MAX_LAG seconds behind
+# (or unreachable) are skipped, and users who wrote within the last
+# REPLICA_PIN_SECONDS stay on the primary so they read their own writes.
+
+_replica = contextvars.ContextVar('replica', default=None)
+
+# alias: (checked at, lag in seconds or None when unreachable)
+_lag = {}
+_lag_lock = threading.Lock()
+
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    # keep the user's reads on the primary until their writes replicated
+    if settings.REPLICA_DATABASES and user_id is not None:
+        cache.set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def pinned_to_primary(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+def replica_lag(alias):
+    # seconds the replica is behind the primary, None when unreachable
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                return 0.0
+            cursor.execute(LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        return None
+
+
+def healthy_replicas():
+    # replicas within REPLICA_MAX_LAG, measured at most once per
+    # REPLICA_LAG_CHECK_INTERVAL per process
+    healthy = []
+    for alias in settings.REPLICA_DATABASES:
+        now = time.monotonic()
+        with _lag_lock:
+            checked = _lag.get(alias)
+        if checked is None or now - checked[0] >= settings.REPLICA_LAG_CHECK_INTERVAL:
+            checked = (now, replica_lag(alias))
+            with _lag_lock:
+                _lag[alias] = checked
+        lag = checked[1]
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+            healthy.append(alias)
+    return healthy
+
+
+def read_from_replica(user_id=None):
+    # route the reads of the current context to a healthy replica; returns
+    # a token for stop_reading_from_replica(), or None when reads stay on
+    # the primary
+    if not settings.REPLICA_DATABASES or pinned_to_primary(user_id):
+        return None
+    replicas = healthy_replicas()
+    if not replicas:
+        return None
+    return _replica.set(random.choice(replicas))
+
+
+def stop_reading_from_replica(token):
+    _replica.reset(token)
+
+
+class ShardRouter:
+    # Send the queries on the user owned models to their user's shard (see
+    # apps.core.sharding); everything else goes on to the next router
+
+    def db_for_read(self, model, **hints):
+        alias = shard_for_query(model, hints)
+        # reads of the default database may still go to a replica
+        return None if alias == 'default' else alias
+
+    def db_for_write(self, model, **hints):
+        return shard_for_query(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # users stay on the default database, their rows live on their shard
+        user_model = get_user_model()
+        for owner, owned in ((obj1, obj2), (obj2, obj1)):
+            if isinstance(owner, user_model) and is_sharded(type(owned)):
+                return True
+        return None
+
+
+class ReplicaRouter:
+    # Send the reads of read_from_replica() contexts to the chosen replica
+    # and writes of replica rows to the primary
+
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        # instances read from a replica are saved on the primary
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.REPLICA_DATABASES:
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema through replication
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
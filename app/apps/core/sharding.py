@@ -0,0 +1,221 @@
+import contextlib
+import contextvars
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+
+# The user owned tables (tags, ingredients, recipes and their links) are
+# split across SHARD_DATABASES by user: User.shard, stored on the default
+# database, names the alias holding a user's rows. New users are placed by
+# rendezvous hashing of their email, so adding a shard only changes the
+# place of the users that now rank it first; rebalance_shards moves those
+# users' rows with move_user(). Queries are routed by ShardRouter to the
+# shard set for the current request (see use_shard()), or else to the
+# shard of the instance they are about.
+
+SHARDED_MODELS = ('core.tag', 'core.ingredients', 'core.recipe', 'core.recipe_tags', 'core.recipe_ingredients')
+
+_shard = contextvars.ContextVar('shard', default=None)
+
+
+class ShardMoveError(Exception):
+    pass
+
+
+def pick_shard(key):
+    # the shard a new user with this key (their email) is placed on
+    return max(
+        settings.SHARD_DATABASES,
+        key=lambda alias: hashlib.sha1(f'{alias}:{key}'.encode()).digest(),
+    )
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def sharded_models():
+    # in insertion order: the links last
+    from .models import Tag, Ingredients, Recipe
+
+    return [Tag, Ingredients, Recipe, Recipe.tags.through, Recipe.ingredients.through]
+
+
+def set_shard(alias):
+    # route the sharded queries of the current context to alias; returns a
+    # token for reset_shard()
+    return _shard.set(alias)
+
+
+def reset_shard(token):
+    _shard.reset(token)
+
+
+@contextlib.contextmanager
+def use_shard(alias):
+    token = set_shard(alias)
+    try:
+        yield alias
+    finally:
+        reset_shard(token)
+
+
+def shard_for_user(user_id):
+    return get_user_model().objects.using('default').filter(pk=user_id).values_list('shard', flat=True).first()
+
+
+def shard_for_query(model, hints):
+    # the alias a query on model belongs to, None when it is not sharded or
+    # nothing tells the user apart
+    if not is_sharded(model):
+        return None
+    alias = _shard.get()
+    if alias is not None:
+        return alias
+    instance = hints.get('instance')
+    if instance is None:
+        return None
+    if isinstance(instance, get_user_model()):
+        return instance.shard
+    if instance._state.db and instance._state.db not in settings.REPLICA_DATABASES:
+        return instance._state.db
+    if is_sharded(type(instance)) and getattr(instance, 'user_id', None) is not None:
+        user_field = type(instance)._meta.get_field('user')
+        if user_field.is_cached(instance):
+            return instance.user.shard
+        return shard_for_user(instance.user_id)
+    return None
+
+
+def _moving_key(user_id):
+    return f'shard-moving:{user_id}'
+
+
+def user_moving(user_id):
+    # whether the user's rows are being moved, writes must wait meanwhile
+    return len(settings.SHARD_DATABASES) > 1 and cache.get(_moving_key(user_id)) is not None
+
+
+def user_rows(model, user_id, using):
+    queryset = model._base_manager.using(using)
+    if any(field.name == 'user' for field in model._meta.fields):
+        return queryset.filter(user_id=user_id)
+    return queryset.filter(recipe__user_id=user_id)
+
+
+def delete_user_rows(user_id, using):
+    # delete the user's rows without signals: the images and the counters
+    # they would release move along with the rows; returns the row count
+    deleted = 0
+    with transaction.atomic(using=using):
+        for model in reversed(sharded_models()):
+            deleted += user_rows(model, user_id, using)._raw_delete(using)
+    return deleted
+
+
+def copy_user_rows(user_id, source, target, batch_size=1000):
+    # copy the user's rows, primary keys included, from one snapshot of the
+    # source into the target, replacing any earlier copy; returns the row count
+    copied = 0
+    source_connection = connections[source]
+    snapshot = not source_connection.in_atomic_block and source_connection.vendor == 'postgresql'
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        if snapshot:
+            with source_connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        for model in reversed(sharded_models()):
+            user_rows(model, user_id, target)._raw_delete(target)
+        for model in sharded_models():
+            batch = []
+            for row in user_rows(model, user_id, source).order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    copied += _insert(model, batch, target)
+                    batch = []
+            copied += _insert(model, batch, target)
+    return copied
+
+
+def _insert(model, rows, using):
+    if not rows:
+        return 0
+    taken = model._base_manager.using(using).filter(pk__in=[row.pk for row in rows])
+    if taken.exists():
+        raise ShardMoveError(
+            f'{model._meta.label} ids {sorted(taken.values_list("pk", flat=True))[:10]} already exist on {using}; '
+            f'shards must draw ids from disjoint ranges (see stride_sequences()).'
+        )
+    model._base_manager.using(using).bulk_create(rows)
+    return len(rows)
+
+
+def move_user(user, target, grace=None, batch_size=1000, log=None):
+    # move the user's rows to target while the API keeps serving them:
+    # reads go on throughout, writes get a 503 for the two grace periods
+    # at the end, which cover requests in flight and the user copies cached
+    # by other processes (AUTH_TOKEN_LOCAL_CACHE_TIMEOUT). Returns the number
+    # of rows moved.
+    from apps.recipe.versioning import bump_user_version, get_user_version
+
+    if grace is None:
+        grace = settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT
+    if target not in settings.SHARD_DATABASES:
+        raise ShardMoveError(f'{target} is not one of the shards {settings.SHARD_DATABASES}.')
+    source = user.shard
+    if source == target:
+        return 0
+    log = log or (lambda message: None)
+
+    version = get_user_version(user.id)
+    copied = copy_user_rows(user.id, source, target, batch_size)
+    log(f'copied {copied} rows from {source} to {target}')
+
+    # the flag outlives a crashed move by a little, after which the user
+    # simply keeps writing to the source
+    cache.set(_moving_key(user.id), target, 2 * grace + 60)
+    try:
+        time.sleep(grace)
+        if get_user_version(user.id) != version:
+            copied = copy_user_rows(user.id, source, target, batch_size)
+            log(f'copied {copied} rows again, they changed during the first copy')
+        user.shard = target
+        # saving evicts the cached tokens, which carry a copy of the user
+        user.save(update_fields=['shard'])
+        bump_user_version(user.id)
+        time.sleep(grace)
+    finally:
+        cache.delete(_moving_key(user.id))
+    if user.shard == target:
+        log(f'deleted {delete_user_rows(user.id, source)} rows from {source}')
+    return copied
+
+
+def stride_sequences(using):
+    # make the primary key sequences of the sharded tables on using hand out
+    # ids congruent to its position in SHARD_DATABASES modulo SHARD_ID_STRIDE,
+    # above every id in use on any shard, so that rows keep their ids when
+    # they move between shards (PostgreSQL only)
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or len(settings.SHARD_DATABASES) < 2:
+        return
+    index = settings.SHARD_DATABASES.index(using)
+    stride = settings.SHARD_ID_STRIDE
+    for model in sharded_models():
+        top = 0
+        for alias in settings.SHARD_DATABASES:
+            try:
+                with transaction.atomic(using=alias):
+                    top = max(top, model._base_manager.using(alias).order_by('-pk').values_list('pk', flat=True).first() or 0)
+            except DatabaseError:
+                # a shard that is not migrated yet
+                pass
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, model._meta.pk.column])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f'ALTER SEQUENCE {sequence} INCREMENT BY {stride}')
+            cursor.execute('SELECT setval(%s, %s, false)', [sequence, (top // stride + 1) * stride + index])
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import MediaBlob, Recipe, Tag, Ingredients
+from .sharding import stride_sequences
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_image(sender, instance, update_fields, **kwargs):
+    # keep the stored image name to compare with after the save
+    if instance._state.adding or (update_fields is not None and 'image' not in update_fields):
+        return
+    stored = Recipe.objects.using(instance._state.db).filter(pk=instance.pk)
+    instance._stored_image = stored.values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, created, **kwargs):
+    # one MediaBlob reference per recipe showing a stored image
+    previous = getattr(instance, '_stored_image', None) or ''
+    current = instance.image.name or ''
+    instance._stored_image = current
+    if previous == current:
+        return
+    if current:
+        try:
+            size = instance.image.size
+        except OSError:
+            # names assigned directly may point at files not written yet
+            size = 0
+        MediaBlob.objects.acquire(current, size)
+    if previous:
+        release_image(previous, instance._state.db)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name, instance._state.db)
+
+
+def release_image(name, using):
+    # drop the reference once the recipe change commits on its database, a
+    # rolled back change keeps it; delete the file and its variants once
+    # nothing references it anymore
+    storage = Recipe._meta.get_field('image').storage
+
+    def release():
+        if not MediaBlob.objects.release(name):
+            return
+        # an upload of the same content may have claimed it again meanwhile
+        if not MediaBlob.objects.filter(name=name).exists():
+            storage.delete_with_derived(name)
+
+    transaction.on_commit(release, using=using)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def delete_sharded_rows(sender, instance, **kwargs):
+    # the cascade only reaches rows on the user's database; delete the rows
+    # on another shard the same way, releasing their images
+    if instance.shard == instance._state.db:
+        return
+    for model in (Recipe, Tag, Ingredients):
+        model.objects.using(instance.shard).filter(user_id=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def stride_shard_sequences(sender, using, **kwargs):
+    # keep the ids of the sharded tables unique across shards
+    if sender.label == 'core' and using in settings.SHARD_DATABASES:
+        stride_sequences(using)
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    # File system storage naming files after the SHA-256 of their content
+    # <directory>/ab/cd/abcd...<extension>, where <directory> is the directory
+    # of the name the file was saved under. Identical files share one name,
+    # so saving a file that is already stored writes nothing.
+    # Files derived from a stored file (e.g. resized images) are saved next
+    # to it under <name>.<suffix> with save_derived() and deleted with it.
+    shard_depth = 2
+    shard_width = 2
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            self.touch(name)
+            return name
+        # two uploads of the same new file can race to this point, the loser
+        # is stored under an alternative name by FileSystemStorage
+        return super().save(name, content, max_length)
+
+    def content_name(self, name, content):
+        # sharded name for content saved as name
+        digest = getattr(content, 'sha256', None) or self.digest(content)
+        directory, file_name = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(file_name)[1].lower()
+        shards = [digest[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_depth)]
+        return posixpath.join(directory, *shards, digest + extension)
+
+    def digest(self, content):
+        # uploads streamed by apps.recipe.uploads carry the hash already,
+        # anything else is hashed chunk by chunk
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def save_derived(self, name, content):
+        # store a file derived from another stored file under its exact name
+        if self.exists(name):
+            self.touch(name)
+            return name
+        return super().save(name, content)
+
+    def touch(self, name):
+        # a reused file counts as new, gc_media spares recently modified
+        # files whose recipe may not be committed yet
+        os.utime(self.path(name))
+
+    def derived_names(self, name):
+        # names of the files saved with save_derived() for name
+        directory, file_name = posixpath.split(name)
+        try:
+            _, files = self.listdir(directory)
+        except FileNotFoundError:
+            return []
+        # shard directories hold a handful of files, listing them is cheap
+        return [posixpath.join(directory, file) for file in files if file.startswith(file_name + '.')]
+
+    def delete_with_derived(self, name):
+        for derived in self.derived_names(name):
+            self.delete(derived)
+        self.delete(name)
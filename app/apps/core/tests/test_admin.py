@@ -2,7 +2,10 @@ from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from apps.core.tests.utils import single_database
 
+
+@single_database
 class AdminSiteTests(TestCase):
 
     def setUp(self):
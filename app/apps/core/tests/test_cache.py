@@ -0,0 +1,32 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from apps.core.cache import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_evicted(self):
+        # Test that the oldest untouched entry is evicted when full
+        lru = LRUCache(max_size=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(len(lru), 2)
+
+    @patch('time.monotonic')
+    def test_entries_expire(self, monotonic):
+        # Test that entries are dropped after the timeout
+        monotonic.return_value = 100
+        lru = LRUCache(max_size=2, timeout=10)
+        lru.set('a', 1)
+
+        monotonic.return_value = 111
+
+        self.assertIsNone(lru.get('a'))
@@ -1,23 +1,319 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
 from unittest.mock import patch
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
+from apps.core.management.commands import gc_media
+from apps.core.models import ImportCheckpoint, Ingredients, MediaBlob, Recipe, Tag
+from apps.core.tests.utils import single_database
+from apps.recipe.search import search_recipes
 
+
+@single_database
 class CommandTests(TestCase):
 
     def test_wait_for_postgres_ready(self):
         # Test waiting for db when db is available
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_postgres')
-            self.assertEqual(gi.call_count, 1)
+        with patch('apps.core.management.commands.wait_for_postgres.ping') as ping:
+            call_command('wait_for_postgres', stdout=StringIO())
+            self.assertEqual(ping.call_count, 1)
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_postgres(self, ts):
-        # Test waiting for db
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_postgres')
-            self.assertEqual(gi.call_count, 6)
+        # Test waiting for db with growing delays until it answers a query
+        with patch('apps.core.management.commands.wait_for_postgres.ping') as ping:
+            ping.side_effect = [OperationalError] * 5 + [0.001]
+            call_command('wait_for_postgres', '--delay', '1', '--max-delay', '4', stdout=StringIO())
+            self.assertEqual(ping.call_count, 6)
+        delays = [call.args[0] for call in ts.call_args_list]
+        self.assertEqual(len(delays), 5)
+        for delay, limit in zip(delays, [1, 2, 4, 4, 4]):
+            self.assertLessEqual(delay, limit)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_postgres_timeout(self, ts):
+        # Test waiting for db gives up after the timeout
+        with patch('apps.core.management.commands.wait_for_postgres.ping') as ping:
+            ping.side_effect = OperationalError('connection refused')
+            with self.assertRaises(CommandError):
+                call_command('wait_for_postgres', '--timeout', '0', stdout=StringIO())
+            self.assertEqual(ping.call_count, 1)
+
+
+@single_database
+class GcMediaCommandTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = get_user_model().objects.create_user('test@email.com', 'test_pass')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_file(self, name, age=7200):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * 10)
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+        return path
+
+    def create_recipe(self, image):
+        return Recipe.objects.create(user=self.user, title='Pizza', time_minutes=5, price=5, image=image)
+
+    def test_gc_media_deletes_orphans(self):
+        # Test that only files no recipe refers to are deleted
+        kept = 'uploads/recipe/ab/cd/abcd.jpg'
+        self.create_recipe(kept)
+        paths = {name: self.create_file(name) for name in [
+            kept,
+            f'{kept}.thumbnail.webp',
+            'uploads/recipe/ab/cd/abce.jpg',
+            'uploads/recipe/ab/cd/abce.jpg.card.jpg',
+            'uploads/recipe/legacy.jpg',
+            'uploads/staging/tmp1234.upload.jpg',
+        ]}
+        recent = self.create_file('uploads/recipe/ef/01/ef01.jpg', age=10)
+        MediaBlob.objects.create(name='uploads/recipe/ab/cd/abce.jpg', refcount=1)
+
+        out = StringIO()
+        call_command('gc_media', rate=0, stdout=out)
+
+        self.assertTrue(os.path.exists(paths[kept]))
+        self.assertTrue(os.path.exists(paths[f'{kept}.thumbnail.webp']))
+        self.assertTrue(os.path.exists(recent))
+        for name in list(paths)[2:]:
+            self.assertFalse(os.path.exists(paths[name]), name)
+        self.assertEqual(list(MediaBlob.objects.values_list('name', flat=True)), [kept])
+        self.assertIn('deleted 4', out.getvalue())
+
+    def test_gc_media_dry_run(self):
+        # Test that a dry run reports orphans without deleting them
+        path = self.create_file('uploads/recipe/orphan.jpg')
+
+        out = StringIO()
+        call_command('gc_media', dry_run=True, stdout=out)
+
+        self.assertTrue(os.path.exists(path))
+        self.assertIn('Would delete uploads/recipe/orphan.jpg', out.getvalue())
+
+    def test_gc_media_merges_across_batches(self):
+        # Test that references read in several batches are all matched
+        names = [f'uploads/recipe/{i:02d}/{i:02d}.jpg' for i in range(7)]
+        for name in names:
+            self.create_recipe(name)
+            self.create_file(name)
+            self.create_file(f'{name}.full.jpg')
+        orphan = self.create_file('uploads/recipe/03/03.png')
+
+        call_command('gc_media', rate=0, batch_size=2, stdout=StringIO())
+
+        for name in names:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, f'{name}.full.jpg')))
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_orphans_with_interleaved_names(self):
+        # Test that names sorting between a reference and its variants do not hide it
+        files = [(name, name) for name in ['a.jpg', 'a.jpg-x', 'a.jpg.thumb', 'a.jpg.thumb.x', 'a.png', 'b']]
+        references = ['a.jpg', 'a.jpg-x']
+
+        result = dict(gc_media.Command().orphans(iter(files), references))
+
+        self.assertEqual([name for name, entry in result.items() if entry], ['a.png', 'b'])
+
+
+@single_database
+class ImportRecipesCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('import@email.com', 'test_pass')
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def ndjson(self, *records):
+        return ''.join(json.dumps(record) + '\n' for record in records)
+
+    def import_recipes(self, path, **options):
+        out = StringIO()
+        call_command('import_recipes', path, user=self.user.email, stdout=out, stderr=out, **options)
+        return out.getvalue()
+
+    def test_import_ndjson(self):
+        # Test recipes are imported with deduplicated tags and ingredients
+        existing = Tag.objects.create(user=self.user, name='Vegan')
+        path = self.write_file('recipes.ndjson', self.ndjson(
+            {'title': 'Soup', 'time_minutes': 20, 'price': '5.50', 'tags': ['Vegan', 'Quick'],
+             'ingredients': [{'id': 7, 'name': 'Leek'}]},
+            {'title': 'Curry', 'time_minutes': 40, 'price': 12, 'link': 'https://curry.example',
+             'tags': [{'name': 'Quick'}], 'ingredients': ['Leek', 'Rice']},
+        ))
+
+        self.import_recipes(path, batch_size=1)
+
+        soup, curry = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(soup.title, 'Soup')
+        self.assertEqual(str(soup.price), '5.50')
+        self.assertEqual(curry.link, 'https://curry.example')
+        self.assertEqual(sorted(soup.tags.values_list('name', flat=True)), ['Quick', 'Vegan'])
+        self.assertIn(existing, soup.tags.all())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredients.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(list(curry.ingredients.order_by('name').values_list('name', flat=True)), ['Leek', 'Rice'])
+        self.assertEqual(
+            dict(Ingredients.objects.filter(user=self.user).values_list('name', 'recipe_count')),
+            {'Leek': 2, 'Rice': 1},
+        )
+
+    def test_import_csv_export(self):
+        # Test a csv export of one account can be imported into another
+        path = self.write_file('recipes.csv', (
+            'id,title,time_minutes,price,link,tags,ingredients\n'
+            '1,"Soup, with\nleeks",20,5.50,,Vegan|Quick,Leek\n'
+            '2,Curry,40,12.00,,,\n'
+        ))
+
+        self.import_recipes(path)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([r.title for r in recipes], ['Soup, with\nleeks', 'Curry'])
+        self.assertEqual(recipes[0].tags.count(), 2)
+        self.assertEqual(recipes[1].tags.count(), 0)
+
+    def test_import_resumes_from_checkpoint(self):
+        # Test a second run continues after the rows already imported
+        first = self.ndjson({'title': 'Soup', 'time_minutes': 20, 'price': 5})
+        path = self.write_file('recipes.ndjson', first)
+        self.import_recipes(path)
+        with open(path, 'a') as file:
+            file.write(self.ndjson({'title': 'Curry', 'time_minutes': 40, 'price': 12}))
+
+        output = self.import_recipes(path)
+
+        self.assertIn('Resuming at line 2', output)
+        self.assertEqual(list(Recipe.objects.order_by('id').values_list('title', flat=True)), ['Soup', 'Curry'])
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.line, checkpoint.recipes), (2, 2))
+
+    def test_import_resumes_csv_after_header(self):
+        # Test a resumed csv import still knows its columns
+        path = self.write_file('recipes.csv', 'title,time_minutes,price\nSoup,20,5\n')
+        self.import_recipes(path)
+        with open(path, 'a') as file:
+            file.write('Curry,40,12\n')
+
+        self.import_recipes(path)
+
+        self.assertEqual(list(Recipe.objects.order_by('id').values_list('title', flat=True)), ['Soup', 'Curry'])
+
+    def test_checkpoint_per_user(self):
+        # Test the same file imports in full for each user
+        other = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        path = self.write_file('recipes.ndjson', self.ndjson({'title': 'Soup', 'time_minutes': 20, 'price': 5}))
+        self.import_recipes(path)
+
+        call_command('import_recipes', path, user=other.email, stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.filter(user=other).count(), 1)
+        self.assertEqual(ImportCheckpoint.objects.filter(user=other).get().recipes, 1)
+
+    def test_changed_file_not_resumed(self):
+        # Test a file rewritten since the checkpoint stops the import instead of resuming mid-record
+        path = self.write_file('recipes.ndjson', self.ndjson({'title': 'Soup', 'time_minutes': 20, 'price': 5}))
+        self.import_recipes(path)
+        self.write_file('recipes.ndjson', self.ndjson({'title': 'Curry stew', 'time_minutes': 40, 'price': 12}))
+
+        with self.assertRaisesMessage(CommandError, '--restart'):
+            self.import_recipes(path)
+        self.import_recipes(path, restart=True)
+
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat=True)), ['Curry stew', 'Soup'])
+
+    def test_import_skips_invalid_records(self):
+        # Test invalid records are reported and skipped
+        path = self.write_file('recipes.ndjson', self.ndjson(
+            {'title': '', 'time_minutes': 20, 'price': 5},
+            {'title': 'Soup', 'time_minutes': 20, 'price': 5},
+        ) + '{not json\n')
+
+        output = self.import_recipes(path)
+
+        self.assertIn('Line 1: title', output)
+        self.assertIn('Line 3:', output)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_import_stops_after_max_errors(self):
+        # Test the import aborts when too many records are invalid
+        path = self.write_file('recipes.ndjson', self.ndjson(*[{'title': 'Soup', 'price': 'x'}] * 3))
+
+        with self.assertRaises(CommandError):
+            self.import_recipes(path, max_errors=2)
+
+    def test_imported_recipes_are_searchable(self):
+        # Test the search vectors of imported recipes are filled in
+        path = self.write_file('recipes.ndjson', self.ndjson(
+            {'title': 'Soup', 'time_minutes': 20, 'price': 5, 'tags': ['Vegan'], 'ingredients': ['Leek']},
+        ))
+
+        self.import_recipes(path)
+
+        recipes = search_recipes(Recipe.objects.filter(user=self.user), 'vegan leek soup')
+        self.assertEqual([recipe.title for recipe in recipes], ['Soup'])
+
+
+@single_database
+class RecountRecipesCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('recount@email.com', 'test_pass')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredients.objects.create(user=self.user, name='Leek')
+        for title in ('Soup', 'Curry'):
+            recipe = Recipe.objects.create(user=self.user, title=title, time_minutes=10, price=5)
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+
+    def test_recount_fixes_drift(self):
+        # Test counters that drifted are recomputed and the rest left alone
+        Tag.objects.filter(pk=self.tag.pk).update(recipe_count=7)
+        Tag.objects.create(user=self.user, name='Unused')
+        out = StringIO()
+
+        call_command('recount_recipes', batch_size=1, stdout=out)
+
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 2)
+        self.assertIn('Tag: checked 2, fixed 1', out.getvalue())
+        self.assertIn('Ingredients: checked 1, fixed 0', out.getvalue())
+
+    def test_recount_one_user(self):
+        # Test --user limits the repair to one account
+        other = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        other_tag = Tag.objects.create(user=other, name='Quick', recipe_count=3)
+
+        call_command('recount_recipes', user=self.user.email, stdout=StringIO())
+
+        other_tag.refresh_from_db()
+        self.assertEqual(other_tag.recipe_count, 3)
+        with self.assertRaises(CommandError):
+            call_command('recount_recipes', user='nobody@email.com', stdout=StringIO())
@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+HEALTHZ_URL = reverse('healthz')
+READYZ_URL = reverse('readyz')
+
+
+class HealthTests(TestCase):
+    # readyz queries every configured database
+    databases = {'default', *settings.SHARD_DATABASES, *settings.REPLICA_DATABASES}
+
+    def test_healthz_without_database(self):
+        # Test liveness is answered without querying a database
+        with self.assertNumQueries(0):
+            res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'status': 'ok'})
+        self.assertIn('no-cache', res['Cache-Control'])
+
+    def test_readyz_reports_databases(self):
+        # Test readiness reports the latency of each database and its pool
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        default = res.json()['databases']['default']
+        self.assertTrue(default['ok'])
+        self.assertGreaterEqual(default['latency_ms'], 0)
+        self.assertEqual('pool' in default, getattr(connections['default'], 'pool', None) is not None)
+
+    def test_readyz_unavailable_database(self):
+        # Test readiness fails while the primary does not answer
+        with patch('apps.core.health.ping', side_effect=OperationalError('connection refused')):
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.json()['status'], 'unavailable')
+        self.assertEqual(res.json()['databases']['default']['error'], 'connection refused')
+
+    @override_settings(REPLICA_DATABASES=['replica_1'])
+    def test_readyz_ignores_replicas(self):
+        # Test a replica that is down is reported without failing readiness
+        def ping(alias):
+            if alias == 'replica_1':
+                raise OperationalError('replica down')
+            return 0.001
+
+        with patch('apps.core.health.ping', side_effect=ping), \
+                patch('apps.core.health.connections') as handler:
+            handler.__getitem__.return_value.pool = None
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.json()['databases']['replica_1']['ok'])
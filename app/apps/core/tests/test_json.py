@@ -0,0 +1,79 @@
+import datetime
+import io
+import uuid
+from decimal import Decimal
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from apps.core.parsers import FastJSONParser
+from apps.core.renderers import FastJSONRenderer
+
+PAYLOAD = {
+    'price': Decimal('12.50'),
+    'created': datetime.datetime(2021, 11, 5, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'day': datetime.date(2021, 11, 5),
+    'duration': datetime.timedelta(minutes=90),
+    'label': gettext_lazy('Recipe'),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'ids': (1, 2, 3),
+    1: 'integer key',
+    'separator': 'line\u2028paragraph\u2029',
+    'unicode': 'crème brûlée',
+    'nested': [{'id': 1, 'name': 'Soup', 'price': '4.50', 'ratio': 0.1}],
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def test_output_matches_json_renderer(self):
+        # Test that the orjson output is byte for byte what DRF renders
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD), JSONRenderer().render(PAYLOAD))
+
+    def test_huge_integers(self):
+        # Test integers orjson cannot encode fall back to the stdlib encoder
+        self.assertEqual(FastJSONRenderer().render({'huge': 2 ** 70}), b'{"huge":%d}' % 2 ** 70)
+
+    def test_indent_matches_json_renderer(self):
+        # Test that indented output falls back to the stdlib encoder
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(PAYLOAD, media_type),
+            JSONRenderer().render(PAYLOAD, media_type),
+        )
+
+    @override_settings(JSON_BACKEND='json')
+    def test_stdlib_backend(self):
+        # Test that JSON_BACKEND = 'json' renders with the stdlib encoder
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD), JSONRenderer().render(PAYLOAD))
+
+    def test_unserializable_raises(self):
+        # Test that unsupported objects raise like JSONRenderer does
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render({'value': object()})
+
+
+class FastJSONParserTests(SimpleTestCase):
+
+    def _parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(io.BytesIO(body), parser_context={'encoding': encoding})
+
+    def test_parses_like_json_parser(self):
+        # Test documents parse to what JSONParser returns
+        body = '{"title": "Crème", "price": 4.5, "tags": [1, 2], "huge": %d, "none": null}' % 2 ** 70
+        self.assertEqual(self._parse(FastJSONParser(), body.encode()), self._parse(JSONParser(), body.encode()))
+
+    def test_other_encodings(self):
+        # Test non UTF-8 bodies are decoded with their charset
+        body = '{"title": "Crème"}'.encode('latin-1')
+        self.assertEqual(self._parse(FastJSONParser(), body, 'latin-1'), {'title': 'Crème'})
+
+    def test_invalid_documents_rejected(self):
+        # Test malformed JSON and NaN raise a parse error
+        for body in (b'{"title": ', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                self._parse(FastJSONParser(), body)
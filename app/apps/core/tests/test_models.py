@@ -1,9 +1,11 @@
-from unittest.mock import patch
+import hashlib
 
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.test import TestCase
 
 from apps.core import models
+from apps.core.tests.utils import single_database
 
 
 def sample_user(email='test@email.com', password='test_pass'):
@@ -11,6 +13,7 @@ def sample_user(email='test@email.com', password='test_pass'):
     return get_user_model().objects.create_user(email, password)
 
 
+@single_database
 class ModelTests(TestCase):
 
     def test_create_user_with_email_successful(self):
@@ -73,13 +76,15 @@ class ModelTests(TestCase):
         )
         self.assertEqual(str(recipe), recipe.title)
 
-    @patch('uuid.uuid4')
-    def test_recipe_file_name_uuid(self, mock_uuid):
-        # test that image is saved in a correct location
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_image_file_path(None, 'myimage.jpg')
+    def test_recipe_file_name_content_hash(self):
+        # test that image is saved under the hash of its content
+        content = b'image content'
+        digest = hashlib.sha256(content).hexdigest()
+        file_path = models.recipe_image_file_path(None, 'myimage.JPG')
 
-        expected_path = f'uploads/recipe/{uuid}.jpg'
+        name = models.recipe_image_storage.save(file_path, ContentFile(content))
+        models.recipe_image_storage.delete(name)
 
-        self.assertEqual(file_path, expected_path)
+        expected_path = f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+
+        self.assertEqual(name, expected_path)
@@ -0,0 +1,193 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+import psycopg2
+from django.db import connection, connections
+from django.test import SimpleTestCase, TransactionTestCase
+from psycopg2 import extensions
+
+from apps.core.backends.postgresql_pool.pool import ConnectionPool
+from apps.core.tests.utils import single_database
+
+
+class FakeConnection:
+    # the parts of a psycopg2 connection the pool uses
+
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.pings = 0
+        self.broken = False
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql):
+        if self.connection.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.connection.pings += 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+
+        pool = ConnectionPool(connect, **{'max_idle': 300, 'check_after': 5, **kwargs})
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_returned_connection_reused(self):
+        # Test that a returned connection is checked out again
+        pool = self.make_pool(max_size=2)
+        first = pool.getconn()
+        pool.putconn(first)
+
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_exhausted_pool_times_out(self):
+        # Test that checkouts beyond max_size wait and then fail
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.getconn()
+
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        # Test that a waiting checkout is handed a connection returned meanwhile
+        pool = self.make_pool(max_size=1, timeout=5)
+        first = pool.getconn()
+        threading.Timer(0.05, pool.putconn, [first]).start()
+
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_connection_in_transaction_rolled_back(self):
+        # Test that a connection returned inside a transaction is rolled back
+        pool = self.make_pool(max_size=1)
+        first = pool.getconn()
+        first.status = extensions.TRANSACTION_STATUS_INERROR
+        pool.putconn(first)
+
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(first.status, extensions.TRANSACTION_STATUS_IDLE)
+
+    def test_broken_connection_discarded_on_return(self):
+        # Test that closed connections are not put back
+        pool = self.make_pool(max_size=1)
+        first = pool.getconn()
+        first.closed = 2
+        pool.putconn(first)
+
+        self.assertIsNot(pool.getconn(), first)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    @patch('time.monotonic')
+    def test_idle_connection_checked_on_checkout(self, monotonic):
+        # Test that a connection idle for check_after is pinged, and replaced
+        # when the ping fails
+        monotonic.return_value = 100
+        pool = self.make_pool(max_size=1)
+        pool._reaper = 'not started'
+        first = pool.getconn()
+        pool.putconn(first)
+        monotonic.return_value = 101
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(first.pings, 0)
+
+        pool.putconn(first)
+        first.broken = True
+        monotonic.return_value = 110
+        second = pool.getconn()
+
+        self.assertIsNot(second, first)
+        self.assertEqual(first.closed, 1)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+    @patch('time.monotonic')
+    def test_reap_closes_idle_connections_above_min_size(self, monotonic):
+        # Test that reaping closes connections idle for max_idle down to min_size
+        monotonic.return_value = 100
+        pool = self.make_pool(min_size=1, max_size=3, max_idle=60)
+        pool._reaper = 'not started'
+        connections = [pool.getconn() for _ in range(3)]
+        for pooled in connections:
+            pool.putconn(pooled)
+
+        monotonic.return_value = 200
+        self.assertEqual(pool.reap(), 2)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_reaper_opens_min_size(self):
+        # Test that the reaper opens min_size connections in the background
+        pool = self.make_pool(min_size=2, max_size=4)
+        pool.putconn(pool.getconn())
+        pool._closed.wait(0.2)
+
+        self.assertEqual(pool.stats()['size'], 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+
+@single_database
+@skipUnless(connection.vendor == 'postgresql', 'the pooled backend needs PostgreSQL')
+class PooledBackendTests(TransactionTestCase):
+
+    def test_closed_connection_returns_to_pool(self):
+        # Test that closing the Django connection keeps the psycopg2 connection
+        # open for the next connect
+        wrapper = connections.create_connection('default')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+
+        self.assertFalse(raw.closed)
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+
+    def test_connection_shared_across_threads(self):
+        # Test that a connection returned by one thread is used by another
+        used = []
+
+        def query():
+            wrapper = connections['default']
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            used.append(wrapper.connection)
+            wrapper.close()
+
+        for _ in range(2):
+            thread = threading.Thread(target=query)
+            thread.start()
+            thread.join()
+
+        self.assertIs(used[0], used[1])
@@ -0,0 +1,88 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from apps.core import routers
+from apps.core.models import Recipe
+from apps.recipe.versioning import bump_user_version
+
+
+@override_settings(REPLICA_DATABASES=['replica_1', 'replica_2'], REPLICA_MAX_LAG=2,
+                   REPLICA_LAG_CHECK_INTERVAL=60, REPLICA_PIN_SECONDS=60)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        routers._lag.clear()
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+
+    def read_alias(self, user_id=1):
+        # the alias reads go to inside a read_from_replica() context
+        token = routers.read_from_replica(user_id)
+        if token is None:
+            return self.router.db_for_read(Recipe)
+        try:
+            return self.router.db_for_read(Recipe)
+        finally:
+            routers.stop_reading_from_replica(token)
+
+    def test_reads_stay_on_primary_by_default(self):
+        # Test that reads outside a replica context are not routed
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    @patch('apps.core.routers.replica_lag', return_value=0)
+    def test_reads_routed_to_one_replica(self, replica_lag):
+        # Test that a replica context keeps reading from the replica it picked
+        token = routers.read_from_replica(1)
+        alias = self.router.db_for_read(Recipe)
+        self.assertIn(alias, ['replica_1', 'replica_2'])
+        self.assertEqual({self.router.db_for_read(Recipe) for _ in range(20)}, {alias})
+
+        routers.stop_reading_from_replica(token)
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    @patch('apps.core.routers.replica_lag')
+    def test_lagging_and_unreachable_replicas_skipped(self, replica_lag):
+        # Test that replicas behind REPLICA_MAX_LAG or down are routed around
+        replica_lag.side_effect = {'replica_1': 30.0, 'replica_2': 0.5}.get
+        self.assertEqual({self.read_alias() for _ in range(20)}, {'replica_2'})
+
+        routers._lag.clear()
+        replica_lag.side_effect = {'replica_1': 30.0, 'replica_2': None}.get
+        self.assertIsNone(routers.read_from_replica(1))
+
+    @patch('apps.core.routers.replica_lag', return_value=0)
+    def test_lag_measured_once_per_interval(self, replica_lag):
+        # Test that the lag of each replica is cached for the check interval
+        routers.healthy_replicas()
+        routers.healthy_replicas()
+        self.assertEqual(replica_lag.call_count, 2)
+
+        with override_settings(REPLICA_LAG_CHECK_INTERVAL=0):
+            routers.healthy_replicas()
+        self.assertEqual(replica_lag.call_count, 4)
+
+    @patch('apps.core.routers.replica_lag', return_value=0)
+    def test_user_who_wrote_pinned_to_primary(self, replica_lag):
+        # Test that a user's reads stay on the primary after a write
+        routers.pin_to_primary(1)
+
+        self.assertIsNone(routers.read_from_replica(1))
+        self.assertIn(self.read_alias(user_id=2), ['replica_1', 'replica_2'])
+
+    @patch('apps.core.routers.replica_lag', return_value=0)
+    def test_version_bump_pins_to_primary(self, replica_lag):
+        # Test that every change of a user's version keeps their reads on the primary
+        bump_user_version(1)
+
+        self.assertIsNone(routers.read_from_replica(1))
+
+    def test_writes_and_migrations_on_primary(self):
+        # Test that writes go to the primary and replicas are not migrated
+        recipe = Recipe()
+        recipe._state.db = 'replica_1'
+        self.assertEqual(self.router.db_for_write(Recipe, instance=recipe), 'default')
+        self.assertIsNone(self.router.db_for_write(Recipe))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
@@ -0,0 +1,277 @@
+import os
+import shutil
+import tempfile
+from collections import Counter
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core import sharding
+from apps.core.management.commands import gc_media
+from apps.core.models import Ingredients, MediaBlob, Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+SHARDS = ['default', 'shard_1']
+
+# the first configured shard besides default; set POSTGRES_SHARDS to run
+# the tests that move rows between databases
+SHARD = next(iter(settings.SHARD_DATABASES[1:]), None)
+needs_shard = skipUnless(SHARD, 'needs a second shard (POSTGRES_SHARDS)')
+
+
+def detail_url(recipe_id):
+    # Return recipe detail url
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class PickShardTests(SimpleTestCase):
+
+    @override_settings(SHARD_DATABASES=SHARDS)
+    def test_placement_stable_and_spread(self):
+        # Test that an email always maps to the same shard and emails spread
+        emails = [f'user{i}@email.com' for i in range(1000)]
+        placed = [sharding.pick_shard(email) for email in emails]
+
+        self.assertEqual(placed, [sharding.pick_shard(email) for email in emails])
+        self.assertGreater(min(Counter(placed).values()), 400)
+
+    def test_new_shard_only_takes_users(self):
+        # Test that adding a shard moves users to it and nowhere else
+        emails = [f'user{i}@email.com' for i in range(1000)]
+        with override_settings(SHARD_DATABASES=SHARDS):
+            before = [sharding.pick_shard(email) for email in emails]
+        with override_settings(SHARD_DATABASES=[*SHARDS, 'shard_2']):
+            after = [sharding.pick_shard(email) for email in emails]
+
+        moves = {(old, new) for old, new in zip(before, after) if old != new}
+        self.assertEqual({new for _, new in moves}, {'shard_2'})
+
+
+@needs_shard
+@override_settings(SHARD_DATABASES=['default', SHARD], RECIPE_RESPONSE_CACHE='none')
+class ShardRoutingTests(TestCase):
+    # test the rows of a user on another shard are written and read there
+    databases = {'default', *settings.SHARD_DATABASES[1:2]}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'sharded@email.com',
+            'test_pass',
+            shard=SHARD,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_api_uses_users_shard(self):
+        # test the API writes the user's rows on their shard and reads them back
+        tag = self.client.post(TAGS_URL, {'name': 'Vegan'}).data
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [tag['id']],
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        recipe = Recipe.objects.using(SHARD).get(user=self.user)
+        self.assertEqual(list(recipe.tags.values_list('name', flat=True)), ['Vegan'])
+        self.assertFalse(Recipe.objects.using('default').exists())
+        self.assertFalse(Tag.objects.using('default').exists())
+
+        listed = self.client.get(RECIPES_URL)
+        self.assertEqual([item['id'] for item in listed.data['results']], [recipe.id])
+        detail = self.client.get(detail_url(recipe.id))
+        self.assertEqual([item['id'] for item in detail.data['tags']], [tag['id']])
+
+    def test_orm_follows_user(self):
+        # test rows saved for a user outside a request go to their shard
+        tag = Tag(user=self.user, name='Quick')
+        tag.save()
+        ingredient = self.user.ingredients_set.create(name='Leek')
+
+        self.assertEqual((tag._state.db, ingredient._state.db), (SHARD, SHARD))
+        self.assertEqual(list(self.user.tag_set.all()), [tag])
+        with sharding.use_shard(SHARD):
+            self.assertEqual(list(Ingredients.objects.filter(user=self.user)), [ingredient])
+
+    def test_writes_wait_while_moving(self):
+        # test writes are answered 503 while the user's rows move, reads are not
+        cache.set(sharding._moving_key(self.user.id), 'default')
+        self.addCleanup(cache.delete, sharding._moving_key(self.user.id))
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+        self.assertEqual(self.client.get(TAGS_URL).status_code, status.HTTP_200_OK)
+
+    def test_deleting_user_deletes_sharded_rows(self):
+        # test deleting a user removes their rows from their shard
+        recipe = self.user.recipe_set.create(title='Soup', time_minutes=10, price=5)
+        recipe.ingredients.add(self.user.ingredients_set.create(name='Leek'))
+
+        self.user.delete()
+
+        self.assertFalse(Recipe.objects.using(SHARD).exists())
+        self.assertFalse(Ingredients.objects.using(SHARD).exists())
+
+    def test_image_released_when_shard_commits(self):
+        # test an image reference is only dropped once the shard commits
+        name = 'uploads/recipe/ab/cd/abcd.jpg'
+        recipe_id = self.user.recipe_set.create(title='Soup', time_minutes=10, price=5, image=name).id
+
+        with self.assertRaises(RuntimeError), transaction.atomic(using=SHARD):
+            Recipe.objects.using(SHARD).get(pk=recipe_id).delete()
+            raise RuntimeError
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(using=SHARD, execute=True):
+            Recipe.objects.using(SHARD).get(pk=recipe_id).delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+
+@needs_shard
+@override_settings(SHARD_DATABASES=['default', SHARD])
+class GcMediaShardTests(TestCase):
+    # test media collection keeps the images of recipes on every shard
+    databases = {'default', *settings.SHARD_DATABASES[1:2]}
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def create_file(self, name):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * 10)
+        return path
+
+    def test_images_on_every_shard_kept(self):
+        # test only the files no recipe on any shard refers to are deleted
+        paths = {}
+        for number, shard in enumerate(['default', SHARD]):
+            user = get_user_model().objects.create_user(f'user{number}@email.com', 'test_pass', shard=shard)
+            name = f'uploads/recipe/{number:02d}/{number:02d}.jpg'
+            user.recipe_set.create(title='Soup', time_minutes=10, price=5, image=name)
+            paths[shard] = self.create_file(name)
+            paths[f'{shard} variant'] = self.create_file(f'{name}.thumbnail.webp')
+        orphan = self.create_file('uploads/recipe/99/99.jpg')
+
+        call_command('gc_media', min_age=0, rate=0, batch_size=1, stdout=StringIO())
+
+        for path in paths.values():
+            self.assertTrue(os.path.exists(path), path)
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_claimed_on_other_shard_kept(self):
+        # test a file is kept when a recipe on a shard took it after the names were read
+        user = get_user_model().objects.create_user('user@email.com', 'test_pass', shard=SHARD)
+        name = 'uploads/recipe/ab/cd/abcd.jpg'
+        path = self.create_file(name)
+        user.recipe_set.create(title='Soup', time_minutes=10, price=5, image=name)
+
+        with patch.object(gc_media.Command, 'referenced_names', return_value=iter([])):
+            call_command('gc_media', min_age=0, rate=0, stdout=StringIO())
+
+        self.assertTrue(os.path.exists(path))
+
+
+@needs_shard
+@override_settings(SHARD_DATABASES=['default', SHARD], RECIPE_RESPONSE_CACHE='none')
+class RebalanceShardsTests(TransactionTestCase):
+    # test users' rows move between shards with their ids
+    databases = {'default', *settings.SHARD_DATABASES[1:2]}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('mover@email.com', 'test_pass', shard='default')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        tag = self.client.post(TAGS_URL, {'name': 'Vegan'}).data
+        ingredient = Ingredients.objects.create(user=self.user, name='Leek')
+        for title in ('Soup', 'Stew'):
+            self.client.post(RECIPES_URL, {
+                'title': title,
+                'time_minutes': 10,
+                'price': '5.00',
+                'tags': [tag['id']],
+                'ingredients': [ingredient.id],
+            })
+
+    def rows(self, using):
+        return {
+            model._meta.label: sorted(sharding.user_rows(model, self.user.id, using).values_list('pk', flat=True))
+            for model in sharding.sharded_models()
+        }
+
+    def test_user_moved_with_ids(self):
+        # test a move copies every row, switches the user and empties the source
+        before = self.rows('default')
+        listed = self.client.get(RECIPES_URL).content
+        out = StringIO()
+
+        call_command('rebalance_shards', '--user', self.user.email, '--to', SHARD, '--grace', '0', stdout=out)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, SHARD)
+        self.assertEqual(self.rows(SHARD), before)
+        self.assertEqual(sum(map(len, self.rows('default').values())), 0)
+        self.assertEqual(Tag.objects.using(SHARD).get(user=self.user).recipe_count, 2)
+        self.assertIn('1 users moved', out.getvalue())
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(RECIPES_URL).content, listed)
+
+    def test_colliding_ids_abort_move(self):
+        # test a move stops before the switch when the target uses the same ids
+        tag = Tag.objects.using('default').get(user=self.user)
+        other = get_user_model().objects.create_user('other@email.com', 'test_pass', shard=SHARD)
+        Tag.objects.using(SHARD).create(id=tag.id, user=other, name='Taken')
+
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards', '--user', self.user.email, '--to', SHARD, '--grace', '0',
+                         stdout=StringIO())
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, 'default')
+        self.assertEqual(Recipe.objects.using('default').filter(user=self.user).count(), 2)
+
+    def test_rebalance_moves_users_to_their_hashed_shard(self):
+        # test without --user every user ends up on the shard their email hashes to
+        users = [
+            get_user_model().objects.create_user(f'user{i}@email.com', 'test_pass', shard='default')
+            for i in range(6)
+        ]
+
+        call_command('rebalance_shards', '--grace', '0', stdout=StringIO())
+
+        for user in [self.user, *users]:
+            user.refresh_from_db()
+            self.assertEqual(user.shard, sharding.pick_shard(user.email))
+
+    @skipUnless(connections['default'].vendor == 'postgresql', 'sequences are PostgreSQL only')
+    def test_shard_ids_strided(self):
+        # test each shard hands out ids of its own residue class
+        sharding.stride_sequences(SHARD)
+        other = get_user_model().objects.create_user('other@email.com', 'test_pass', shard=SHARD)
+
+        tag = other.tag_set.create(name='Strided')
+
+        self.assertEqual(tag.id % settings.SHARD_ID_STRIDE, 1)
+        self.assertGreater(tag.id, Tag.objects.using('default').order_by('-id').first().id)
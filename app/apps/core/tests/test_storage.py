@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from apps.core.models import MediaBlob, Recipe, recipe_image_storage
+from apps.core.tests.utils import single_database
+
+
+def sample_recipe(user, title='Pizza'):
+    return Recipe.objects.create(user=user, title=title, time_minutes=10, price=5)
+
+
+@single_database
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.storage = recipe_image_storage
+        self.user = get_user_model().objects.create_user('test@email.com', 'test_pass')
+
+    def tearDown(self):
+        for name in MediaBlob.objects.values_list('name', flat=True):
+            self.storage.delete_with_derived(name)
+
+    def set_image(self, recipe, content, file_name='photo.jpg'):
+        recipe.image.save(file_name, ContentFile(content))
+        return recipe.image.name
+
+    def test_identical_content_stored_once(self):
+        # Test that saving the same bytes twice returns the same name
+        first = self.storage.save('uploads/recipe/a.jpg', ContentFile(b'same'))
+        second = self.storage.save('uploads/recipe/b.JPG', ContentFile(b'same'))
+        other = self.storage.save('uploads/recipe/c.jpg', ContentFile(b'other'))
+        for name in (first, other):
+            self.storage.delete(name)
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_derived_files_deleted_with_original(self):
+        # Test that files saved next to an original are deleted with it
+        name = self.storage.save('uploads/recipe/a.jpg', ContentFile(b'original'))
+        derived = self.storage.save_derived(f'{name}.thumbnail.webp', ContentFile(b'thumbnail'))
+
+        self.assertEqual(self.storage.derived_names(name), [derived])
+        self.storage.delete_with_derived(name)
+
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(self.storage.exists(derived))
+
+    def test_shared_image_reference_counted(self):
+        # Test that recipes showing the same image share one counted blob
+        first = sample_recipe(self.user)
+        second = sample_recipe(self.user, title='Pasta')
+        name = self.set_image(first, b'shared')
+        self.assertEqual(self.set_image(second, b'shared'), name)
+
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+        self.assertTrue(self.storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+
+    def test_replaced_image_released(self):
+        # Test that replacing the only reference deletes the old file
+        recipe = sample_recipe(self.user)
+        old = self.set_image(recipe, b'old')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new = self.set_image(recipe, b'new')
+
+        self.assertFalse(self.storage.exists(old))
+        self.assertTrue(self.storage.exists(new))
+        self.assertEqual(list(MediaBlob.objects.values_list('name', 'refcount')), [(new, 1)])
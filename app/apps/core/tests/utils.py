@@ -0,0 +1,8 @@
+from django.test import override_settings
+
+# The tests outside test_sharding and test_replica_reads query the rows of
+# the users they create without naming a database, and inside transactions
+# no other connection sees: decorate their classes with this to keep every
+# user on the default database and every read on the primary, however many
+# shards and replicas are configured.
+single_database = override_settings(SHARD_DATABASES=['default'], REPLICA_DATABASES=[])
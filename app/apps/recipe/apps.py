@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecipeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.recipe'
+
+    def ready(self):
+        # connect the change tracking handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,49 @@
+from django.urls import URLPattern
+from rest_framework.exceptions import APIException
+
+from apps.core.concurrency import run_in_database_thread
+from apps.user.authentication import CachedTokenAuthentication
+from .urls import router
+
+
+class AsyncAuthentication(CachedTokenAuthentication):
+    # hands DRF the outcome of the authentication async_view() ran on the
+    # event loop, including its errors, so responses stay the same
+    def authenticate(self, request):
+        outcome = request._request.async_authentication
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def async_view(view):
+    # async version of a viewset view: the request is authenticated on the
+    # event loop, queries and rendering run in a database thread
+    sync_view = view.cls.as_view(
+        view.actions, **dict(view.initkwargs, authentication_classes=[AsyncAuthentication])
+    )
+
+    def respond(request, args, kwargs):
+        response = sync_view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    async def handle(request, *args, **kwargs):
+        try:
+            request.async_authentication = await CachedTokenAuthentication().authenticate_async(request)
+        except APIException as exc:
+            request.async_authentication = exc
+        return await run_in_database_thread(respond, request, args, kwargs)
+
+    handle.csrf_exempt = True
+    return handle
+
+
+# the list and detail routes of the tags, ingredients and recipes; writes on
+# them go through the same views, the other routes stay synchronous
+urlpatterns = [
+    URLPattern(pattern.pattern, async_view(pattern.callback), pattern.default_args, pattern.name)
+    for pattern in router.urls
+    if pattern.name and pattern.name.endswith(('-list', '-detail'))
+]
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.core.cache import LRUCache
+
+# Rendered list and detail responses, keyed on the host and the response
+# ETag: it covers the user, the path, the normalized query parameters, the
+# media type and the per-user change version, so every write makes the
+# user's cached responses unreachable and nothing has to be deleted.
+
+
+class LocalResponseCache:
+    # responses kept in this process; only the version lookup is shared
+    def __init__(self):
+        self.lru = LRUCache(
+            max_size=settings.RECIPE_RESPONSE_CACHE_SIZE,
+            timeout=settings.RECIPE_RESPONSE_CACHE_TIMEOUT,
+        )
+
+    def get(self, key):
+        return self.lru.get(key)
+
+    def set(self, key, value):
+        self.lru.set(key, value)
+
+
+class SharedResponseCache:
+    # responses kept in a Django cache shared by every process
+    def __init__(self):
+        self.cache = caches[settings.RECIPE_RESPONSE_CACHE_ALIAS]
+
+    def get(self, key):
+        return self.cache.get(f'recipe-response:{key}')
+
+    def set(self, key, value):
+        self.cache.set(f'recipe-response:{key}', value, settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+
+
+BACKENDS = {
+    'local': LocalResponseCache,
+    'shared': SharedResponseCache,
+}
+_instances = {}
+
+
+def get_response_cache():
+    # the backend selected by RECIPE_RESPONSE_CACHE, None when disabled
+    name = settings.RECIPE_RESPONSE_CACHE
+    if name not in BACKENDS:
+        return None
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
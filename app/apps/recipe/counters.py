@@ -0,0 +1,106 @@
+from collections import Counter
+
+from django.db import connections
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from apps.core.models import Tag, Ingredients, Recipe
+
+# Tag.recipe_count and Ingredients.recipe_count hold the number of recipes
+# linked to each row. The m2m_changed and delete handlers in signals.py
+# adjust them with relative UPDATEs, so concurrent writers never overwrite
+# each other's changes. On PostgreSQL the handlers write the links
+# themselves and count the rows the INSERT and DELETE report, so two
+# requests adding or removing the same link count it once; bulk writes that send no signals recount the rows
+# they touched, and the recount_recipes command repairs any drift.
+
+RELATIONS = {
+    Tag: 'tags',
+    Ingredients: 'ingredients',
+}
+
+
+def relation_field(model):
+    # the Recipe many-to-many field pointing at model
+    return Recipe._meta.get_field(RELATIONS[model])
+
+
+def adjust_counts(model, counts, using='default'):
+    # add {pk: delta} to the counters, one UPDATE per distinct delta
+    by_delta = {}
+    for pk, delta in counts.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        # never below zero, the repair command fixes counters that drifted
+        value = F('recipe_count') + delta if delta > 0 else Greatest(F('recipe_count') + delta, 0)
+        model.objects.using(using).filter(pk__in=pks).update(recipe_count=value)
+
+
+def linked_counts(model, recipe_ids=None, target_ids=None, using='default'):
+    # {pk: number of linked recipes} for the rows of model, counting only the
+    # links to recipe_ids and to rows in target_ids when they are given
+    field = relation_field(model)
+    target = field.m2m_reverse_name()
+    links = field.remote_field.through.objects.using(using).all()
+    if recipe_ids is not None:
+        links = links.filter(**{f'{field.m2m_column_name()}__in': list(recipe_ids)})
+    if target_ids is not None:
+        links = links.filter(**{f'{target}__in': list(target_ids)})
+    return dict(links.values_list(target).annotate(count=Count('*')).order_by())
+
+
+def returning_links(using):
+    # whether link and unlink can run on the database
+    return connections[using].vendor == 'postgresql'
+
+
+def link(model, recipe_ids, target_ids, using='default'):
+    # insert the missing links between recipe_ids and the rows of model in
+    # target_ids; returns {pk: number of links inserted}, a link another
+    # transaction inserted first is not counted
+    field = relation_field(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    pairs = [(recipe_id, target_id) for recipe_id in recipe_ids for target_id in target_ids]
+    if not pairs:
+        return {}
+    sql = 'INSERT INTO {} ({}, {}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}'.format(
+        qn(field.m2m_db_table()), qn(field.m2m_column_name()), qn(field.m2m_reverse_name()),
+        ', '.join(['(%s, %s)'] * len(pairs)), qn(field.m2m_reverse_name()),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for pair in pairs for value in pair])
+        return Counter(target_id for target_id, in cursor.fetchall())
+
+
+def unlink(model, recipe_ids=None, target_ids=None, using='default'):
+    # delete the links of the rows of model, only those to recipe_ids and to
+    # rows in target_ids when they are given; returns {pk: number of links
+    # deleted}, a link another transaction deleted first is not counted
+    field = relation_field(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    where, params = [], []
+    for column, ids in ((field.m2m_column_name(), recipe_ids), (field.m2m_reverse_name(), target_ids)):
+        if ids is not None:
+            where.append(f'{qn(column)} = ANY(%s)')
+            params.append(list(ids))
+    sql = 'DELETE FROM {} WHERE {} RETURNING {}'.format(
+        qn(field.m2m_db_table()), ' AND '.join(where) or 'TRUE', qn(field.m2m_reverse_name()),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return Counter(target_id for target_id, in cursor.fetchall())
+
+
+def recount(queryset):
+    # recompute the counters of the rows in queryset in one UPDATE that only
+    # writes the rows that are off; returns their number
+    field = relation_field(queryset.model)
+    target = field.m2m_reverse_name()
+    links = field.remote_field.through.objects.filter(**{target: OuterRef('pk')}).order_by().values(
+        target
+    ).annotate(count=Count('*')).values('count')
+    count = Coalesce(Subquery(links), 0)
+    return queryset.alias(actual=count).exclude(recipe_count=F('actual')).update(recipe_count=count)
@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from apps.core.models import Tag, Ingredients
+
+# recipes read from the database cursor and prefetched together
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_COLUMNS = ['id', 'title', 'time_minutes', 'price', 'link', 'tags', 'ingredients']
+# separates the tag and ingredient names inside one CSV cell
+CSV_LIST_SEPARATOR = '|'
+
+
+class NDJSONRenderer(BaseRenderer):
+    # One JSON document per line; the export streams its rows itself,
+    # this renders everything else (e.g. errors) as a single line
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return _json_line(data).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    # Comma separated values, see NDJSONRenderer
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        items = data.items() if isinstance(data, dict) else enumerate(data)
+        for key, value in items:
+            writer.writerow([key, value])
+        return buffer.getvalue().encode(self.charset)
+
+
+def _json_line(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def recipe_chunks(queryset, chunk_size=None):
+    # yield lists of recipes with their tags and ingredients loaded
+    # the recipes come from a server-side cursor and every chunk is
+    # prefetched on its own, so memory depends on chunk_size only
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    queryset = queryset.prefetch_related(None).only(
+        'id', 'title', 'time_minutes', 'price', 'link'
+    ).order_by('id')
+    chunk = []
+    for recipe in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(recipe)
+        if len(chunk) == chunk_size:
+            yield _prefetch(chunk)
+            chunk = []
+    if chunk:
+        yield _prefetch(chunk)
+
+
+def _prefetch(recipes):
+    prefetch_related_objects(
+        recipes,
+        Prefetch('tags', queryset=Tag.objects.only('id', 'name').order_by('id')),
+        Prefetch('ingredients', queryset=Ingredients.objects.only('id', 'name').order_by('id')),
+    )
+    return recipes
+
+
+def recipe_row(recipe):
+    # same fields and values as RecipeDetailSerializer without the images
+    # and the usage counts of the tags and ingredients
+    return {
+        'id': recipe.id,
+        'title': recipe.title,
+        'time_minutes': recipe.time_minutes,
+        'price': str(recipe.price),
+        'link': recipe.link,
+        'tags': [{'id': tag.id, 'name': tag.name} for tag in recipe.tags.all()],
+        'ingredients': [
+            {'id': ingredient.id, 'name': ingredient.name} for ingredient in recipe.ingredients.all()
+        ],
+    }
+
+
+def ndjson_stream(queryset):
+    for chunk in recipe_chunks(queryset):
+        yield ''.join(_json_line(recipe_row(recipe)) for recipe in chunk).encode('utf-8')
+
+
+def csv_stream(queryset):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for chunk in recipe_chunks(queryset):
+        for recipe in chunk:
+            row = recipe_row(recipe)
+            for relation in ('tags', 'ingredients'):
+                row[relation] = CSV_LIST_SEPARATOR.join(item['name'] for item in row[relation])
+            writer.writerow([row[column] for column in CSV_COLUMNS])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # the header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+STREAMS = {
+    NDJSONRenderer.format: (ndjson_stream, NDJSONRenderer.media_type),
+    CSVRenderer.format: (csv_stream, CSVRenderer.media_type),
+}
+
+
+def export_response(queryset, export_format):
+    # stream the recipes of queryset in export_format (ndjson or csv)
+    stream, media_type = STREAMS[export_format]
+    response = StreamingHttpResponse(stream(queryset), content_type=f'{media_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="recipes.{export_format}"'
+    return response
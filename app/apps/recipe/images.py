@@ -0,0 +1,121 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+
+from apps.core.models import Recipe
+from .versioning import bump_user_version
+
+logger = logging.getLogger(__name__)
+
+# variant name: (width, height, crop to exactly that size)
+VARIANTS = {
+    'thumbnail': (200, 200, True),
+    'card': (600, 400, True),
+    'full': (1600, 1600, False),
+}
+
+# format name: (file extension, Pillow format, save options)
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # worker pool shared by the process, created on first use
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def variant_name(name, variant, fmt):
+    # variants live next to the original: <original name>.<variant>.<ext>
+    return f'{name}.{variant}.{FORMATS[fmt][0]}'
+
+
+def queue_variants(recipe):
+    # generate the variants of the recipe's current image outside the request
+    # the job is submitted once the upload is committed, so the worker never
+    # reads a file whose recipe row might still roll back; the worker runs
+    # outside the request, so it is told the recipe's shard
+    args = (recipe.pk, recipe.user_id, recipe.image.name, recipe._state.db)
+    transaction.on_commit(lambda: _submit(*args), using=recipe._state.db)
+
+
+def _submit(recipe_id, user_id, name, using):
+    if settings.RECIPE_IMAGE_WORKERS == 0:
+        generate_variants(recipe_id, user_id, name, using)
+    else:
+        get_executor().submit(_run, recipe_id, user_id, name, using)
+
+
+def _run(recipe_id, user_id, name, using):
+    try:
+        generate_variants(recipe_id, user_id, name, using)
+    except Exception:
+        logger.exception('Generating image variants of recipe %s failed', recipe_id)
+    finally:
+        # worker threads are not request threads, nothing else closes these
+        connections[using].close()
+
+
+def generate_variants(recipe_id, user_id, name, using='default'):
+    # resize the original into every variant and format, then publish them
+    # variants are named after the content addressed original, so an image
+    # uploaded before reuses the files already stored for it
+    storage = Recipe._meta.get_field('image').storage
+    variants = {
+        variant: {fmt: variant_name(name, variant, fmt) for fmt in FORMATS}
+        for variant in VARIANTS
+    }
+    missing = {
+        (variant, fmt)
+        for variant, formats in variants.items()
+        for fmt, saved in formats.items()
+        if not storage.exists(saved)
+    }
+    if missing:
+        largest = max((width, height) for width, height, _ in VARIANTS.values())
+        with storage.open(name) as source, Image.open(source) as image:
+            # JPEG can decode straight at a reduced scale, which keeps the memory
+            # of large phone photos down to what the biggest variant needs
+            image.draft('RGB', largest)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for variant, (width, height, crop) in VARIANTS.items():
+                formats = [fmt for fmt in FORMATS if (variant, fmt) in missing]
+                if not formats:
+                    continue
+                if crop:
+                    resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+                else:
+                    resized = image.copy()
+                    resized.thumbnail((width, height), Image.LANCZOS)
+                for fmt in formats:
+                    variants[variant][fmt] = _save(storage, resized, variants[variant][fmt], fmt)
+
+    # only publish if the recipe still shows the image we worked on, the
+    # files stay with the original and are deleted along with it
+    if Recipe.objects.using(using).filter(pk=recipe_id, image=name).update(image_variants=variants):
+        bump_user_version(user_id)
+    return variants
+
+
+def _save(storage, image, name, fmt):
+    _, pillow_format, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return storage.save_derived(name, ContentFile(buffer.getvalue()))
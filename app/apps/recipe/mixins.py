@@ -0,0 +1,232 @@
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from apps.core.routers import read_from_replica, stop_reading_from_replica
+from apps.core.sharding import reset_shard, set_shard, user_moving
+
+from .caching import get_response_cache
+from .versioning import get_user_version
+
+
+class NotModified(Exception):
+    # Raised to short-circuit a request the client already has the answer to
+    pass
+
+
+class CachedResponse(Exception):
+    # Raised to answer a request with a response rendered earlier
+    def __init__(self, response):
+        self.response = response
+
+
+class ShardMoving(APIException):
+    # Raised for writes while the user's rows move to another shard
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your recipes are being moved, try again in a moment.'
+    default_code = 'shard_moving'
+    # sent as Retry-After
+    wait = 5
+
+
+class UserShardMixin:
+    # Run the queries of the request on the user's shard (see
+    # apps.core.sharding) and hold writes back while the user's rows move;
+    # goes first
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS and user_moving(request.user.id):
+            raise ShardMoving()
+        self.shard_token = set_shard(request.user.shard)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'shard_token', None)
+        if token is not None:
+            self.shard_token = None
+            reset_shard(token)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaReadMixin:
+    # Run the queries of the safe actions on a read replica unless the user
+    # wrote recently (see apps.core.routers); goes first after UserShardMixin,
+    # so requests answered from the ETag or the response cache never pick a
+    # replica. The replicas are those of the default database.
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method == 'GET' and self.action in self.replica_actions and request.user.shard == 'default':
+            self.replica_token = read_from_replica(request.user.id)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            self.replica_token = None
+            stop_reading_from_replica(token)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class UserVersionETagMixin:
+    # Answer conditional GETs from the per-user change version
+    # the check runs in initial(), before the handler builds any queryset,
+    # so a poll whose If-None-Match still matches costs one cache lookup
+    etag_actions = ('list', 'retrieve')
+
+    def get_etag(self, request):
+        # the version changes on every write to the user's data; the rest of
+        # the key separates endpoints, query parameters and representations
+        version = get_user_version(request.user.id)
+        query = sorted(request.query_params.lists())
+        raw = f'{version}:{request.user.id}:{request.path}:{query}:{request.accepted_media_type}'
+        return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method != 'GET' or self.action not in self.etag_actions:
+            return
+        self.etag = self.get_etag(request)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if self.etag in etags or '*' in etags:
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            # responses are per user: shared caches must not store them and
+            # clients should revalidate instead of reusing them blindly
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ValuesListMixin:
+    # Build list responses from values() rows instead of serializing model
+    # instances; list_representation_class reproduces the serializer's output
+    # and None falls back to the serializer
+    list_representation_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.list_representation_class is None:
+            return super().list(request, *args, **kwargs)
+        representation = self.list_representation_class(self.get_serializer())
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        queryset = representation.rows(
+            self.filter_queryset(self.get_queryset()),
+            extra=[field.lstrip('-') for field in ordering],
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(representation.to_representation(page))
+        return Response(representation.to_representation(queryset))
+
+
+class SparseFieldsetMixin:
+    # ?fields=id,title trims the representation of the sparse actions to the
+    # listed fields; sparse_queryset() and field_requested() let
+    # get_queryset() load only what those fields read
+    fields_query_param = 'fields'
+    sparse_actions = ('list', 'retrieve')
+
+    def get_requested_fields(self):
+        # names listed in ?fields=, or None for every field
+        if self.request is None or self.request.method != 'GET' or self.action not in self.sparse_actions:
+            return None
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def field_requested(self, name):
+        requested = self.get_requested_fields()
+        return requested is None or name in requested
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        requested = self.get_requested_fields()
+        if requested is not None:
+            fields = getattr(serializer, 'child', serializer).fields
+            unknown = [name for name in requested if name not in fields]
+            if unknown:
+                raise ValidationError({
+                    self.fields_query_param: [f'Unknown field "{name}".' for name in unknown]
+                })
+            for name in list(fields):
+                if name not in requested:
+                    fields.pop(name)
+        return serializer
+
+    def sparse_queryset(self, queryset):
+        # defer the columns no requested field reads; the pagination ordering
+        # is read from the instances too
+        if self.get_requested_fields() is None:
+            return queryset
+        model = queryset.model
+        columns = []
+        for field in self.get_serializer().fields.values():
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                # computed from something only the serializer knows about
+                return queryset
+            if model_field.concrete and not model_field.many_to_many:
+                columns.append(model_field.name)
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        columns += [field.lstrip('-') for field in ordering]
+        return queryset.only(*dict.fromkeys(columns))
+
+
+class ResponseCacheMixin:
+    # Serve repeated GETs of the ETag actions from rendered bytes stored
+    # under their ETag and host (see apps.recipe.caching); a hit skips the
+    # queries, the serializer and the renderer. Goes before UserVersionETagMixin.
+    cached_headers = ('Content-Type', 'Vary', 'Allow')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.response_cache = get_response_cache() if getattr(self, 'etag', None) else None
+        if self.response_cache is not None:
+            # links in the payload are absolute, the ETag leaves the host out
+            self.response_cache_key = f'{request.scheme}://{request.get_host()}/{self.etag}'
+            cached = self.response_cache.get(self.response_cache_key)
+            if cached is not None:
+                content, headers = cached
+                response = HttpResponse(content)
+                for header, value in headers.items():
+                    response[header] = value
+                raise CachedResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CachedResponse):
+            self.response_cache = None
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'response_cache', None) is not None and response.status_code == 200:
+            response.render()
+            if len(response.content) <= settings.RECIPE_RESPONSE_CACHE_MAX_BYTES:
+                headers = {header: response[header] for header in self.cached_headers if header in response}
+                self.response_cache.set(self.response_cache_key, (response.content, headers))
+        return response
@@ -0,0 +1,110 @@
+from django.db import connections
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    # Keyset pagination for recipes
+    # the cursor encodes the last seen position, so deep pages cost the same
+    # as the first one instead of scanning and discarding an OFFSET
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class RecipeAttributeCursorPagination(RecipeCursorPagination):
+    # Keyset pagination for tags and ingredients
+    # both columns descend so a single backward index scan serves the ordering
+    ordering = ('-name', '-id')
+
+
+class KeysetCursorPagination(RecipeCursorPagination):
+    # Cursor pagination keyed on every field of the ordering
+    # DRF keys its cursor on the first field only and steps over the rows
+    # sharing it with an OFFSET, capped at offset_cutoff, so long runs of
+    # ties scan and end up repeating rows. Here the position holds all the
+    # fields and a page continues after the row value of the last row,
+    # e.g. (recipe_count, id) < (3, 17), which an index on the same columns
+    # answers directly. The fields must be integers, sorted in the same
+    # direction, the last one unique.
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        descending = self.ordering[0].startswith('-')
+        if reverse:
+            queryset = queryset.order_by(*[self.reversed_field(field) for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = self.after(queryset, current_position, reverse != descending)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        # positions are unique, so the links never need an offset
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def reversed_field(self, field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def after(self, queryset, position, smaller):
+        # the rows past position in the direction of the page
+        try:
+            values = [int(value) for value in position.split(',')]
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        quote = connections[queryset.db].ops.quote_name
+        table = quote(queryset.model._meta.db_table)
+        columns = ', '.join(
+            f'{table}.{quote(queryset.model._meta.get_field(field.lstrip("-")).column)}'
+            for field in self.ordering
+        )
+        placeholders = ', '.join(['%s'] * len(values))
+        return queryset.extra(where=[f'({columns}) {"<" if smaller else ">"} ({placeholders})'], params=values)
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [field.lstrip('-') for field in ordering]
+        if isinstance(instance, dict):
+            values = [instance[field] for field in fields]
+        else:
+            values = [getattr(instance, field) for field in fields]
+        return ','.join(str(value) for value in values)
+
+
+class RecipeAttributePopularityPagination(KeysetCursorPagination):
+    # Keyset pagination for tags and ingredients by usage, most used first;
+    # served by a backward scan of the (user, recipe_count, id) indexes
+    ordering = ('-recipe_count', '-id')
+
+
+class RecipeSearchPagination(LimitOffsetPagination):
+    # Offset pagination for ranked search results
+    # a cursor cannot be keyed on a floating point rank; search results are
+    # narrowed by the GIN index and browsed at shallow depths anyway
+    max_limit = 500
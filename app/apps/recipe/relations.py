@@ -0,0 +1,77 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    # Resolves every submitted primary key with a single query
+    # instead of one query per item
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = [self.child_relation.to_pk(item) for item in data]
+        objects = self._resolve(pks)
+        for pk in pks:
+            if pk not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+
+        return [objects[pk] for pk in pks]
+
+    def preload(self, values):
+        # resolve the primary keys sent for this field by many serializer
+        # items at once, e.g. by every recipe of a bulk request
+        pks = set()
+        for value in values:
+            if isinstance(value, str) or not hasattr(value, '__iter__'):
+                continue
+            for item in value:
+                try:
+                    pks.add(self.child_relation.to_pk(item))
+                except serializers.ValidationError:
+                    continue
+        preloaded = self.context.setdefault('preloaded_relations', {})
+        preloaded[self.field_name] = (pks, self._query(pks))
+
+    def _resolve(self, pks):
+        preloaded = self.context.get('preloaded_relations', {}).get(self.field_name)
+        if preloaded is not None and preloaded[0].issuperset(pks):
+            return preloaded[1]
+        return self._query(set(pks))
+
+    def _query(self, pks):
+        if not pks:
+            return {}
+        return self.child_relation.get_queryset().in_bulk(pks)
+
+
+class UserOwnedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    # Primary key relation limited to objects owned by the requesting user
+    # used with many=True it validates all submitted keys in one query
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(user=request.user)
+
+    def to_pk(self, data):
+        # convert submitted data to a primary key value without a query
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.queryset.model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
@@ -0,0 +1,90 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+from rest_framework import serializers
+
+# fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.ReadOnlyField)
+
+
+class ValuesRepresentation:
+    # Read-only representation of a ModelSerializer list built from values()
+    # rows: no model instances, and per-field to_representation calls only
+    # where the field changes the value. Many-to-many primary keys come as
+    # ARRAY_AGG subqueries on PostgreSQL and from one query per relation on
+    # other databases. The output equals serializer(many=True).data.
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        # (field name, values() column, converter or None, is many-to-many)
+        self.columns = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name} cannot be read from values().')
+            if isinstance(field, serializers.ManyRelatedField):
+                self.columns.append((name, f'{field.source}_ids', None, True))
+            elif type(field) in PASSTHROUGH_FIELDS:
+                self.columns.append((name, field.source, None, False))
+            else:
+                self.columns.append((name, field.source, field.to_representation, False))
+        self.relations = [(name, column) for name, column, _, many in self.columns if many]
+        self.aggregated = False
+
+    def rows(self, queryset, extra=()):
+        # values() queryset with the columns of the representation and extra
+        # (e.g. the fields pagination reads its position from)
+        queryset = queryset.prefetch_related(None)
+        self.aggregated = bool(self.relations) and connections[queryset.db].vendor == 'postgresql'
+        if self.aggregated:
+            queryset = queryset.annotate(**{
+                column: self.ids_subquery(name) for name, column in self.relations
+            })
+        columns = [column for _, column, _, many in self.columns if self.aggregated or not many]
+        if self.relations and not self.aggregated:
+            # to look the related ids up by
+            columns.append(self.model._meta.pk.attname)
+        return queryset.values(*dict.fromkeys([*columns, *extra]))
+
+    def relation(self, name):
+        # (through model, column of this model, column of the related model)
+        field = self.model._meta.get_field(name)
+        return field.remote_field.through, field.m2m_column_name(), field.m2m_reverse_name()
+
+    def ids_subquery(self, name):
+        through, column, target = self.relation(name)
+        return Subquery(
+            through.objects.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(
+                ids=ArrayAgg(target, ordering=target)
+            ).values('ids')
+        )
+
+    def load_ids(self, rows, name, column):
+        # add the related ids to rows, for databases without ARRAY_AGG
+        through, own, target = self.relation(name)
+        ids = {row['id']: [] for row in rows}
+        links = through.objects.filter(**{f'{own}__in': list(ids)}).order_by(own, target).values_list(own, target)
+        for pk, related in links:
+            ids[pk].append(related)
+        for row in rows:
+            row[column] = ids[row['id']]
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        if rows and self.relations and not self.aggregated:
+            for name, column in self.relations:
+                self.load_ids(rows, name, column)
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert, many in self.columns:
+                value = row[column]
+                if many:
+                    value = value or []
+                elif value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
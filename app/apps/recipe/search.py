@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Q
+
+from apps.core.models import Tag, Ingredients, Recipe
+
+
+def search_vector_sql(title, tag_names, ingredient_names):
+    # SQL computing a search vector from the title (weight A), tag names (B)
+    # and ingredient names (C); the config is the %(config)s parameter
+    return ' || '.join(
+        f"setweight(to_tsvector(%(config)s::regconfig, coalesce({expression}, '')), '{weight}')"
+        for expression, weight in ((title, 'A'), (tag_names, 'B'), (ingredient_names, 'C'))
+    )
+
+
+def _update_sql(connection):
+    # rebuild Recipe.search_vector of the given recipes from their rows
+    quote = connection.ops.quote_name
+    recipe = quote(Recipe._meta.db_table)
+    names = []
+    for field_name, model in (('tags', Tag), ('ingredients', Ingredients)):
+        field = Recipe._meta.get_field(field_name)
+        through = quote(field.remote_field.through._meta.db_table)
+        target = quote(field.m2m_reverse_name())
+        names.append(
+            f"(SELECT string_agg(x.name, ' ') FROM {quote(model._meta.db_table)} x "
+            f"JOIN {through} rel ON rel.{target} = x.id "
+            f"WHERE rel.{quote(field.m2m_column_name())} = r.id)"
+        )
+    vector = search_vector_sql('r.title', *names)
+    return f"UPDATE {recipe} AS r SET search_vector = {vector} WHERE r.id = ANY(%(ids)s)"
+
+
+def search_index_enabled(using='default'):
+    # the search vector only serves PostgreSQL full-text search, other
+    # backends search with a plain scan and leave the column empty
+    return connections[using].vendor == 'postgresql'
+
+
+def update_search_vectors(recipe_ids, using='default'):
+    # refresh the search vectors of the given recipes in one statement
+    if not search_index_enabled(using):
+        return
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(_update_sql(connection), {
+            'config': settings.RECIPE_SEARCH_CONFIG,
+            'ids': recipe_ids,
+        })
+
+
+def search_recipes(queryset, terms):
+    # filter recipes matching terms in their title, tags or ingredients
+    if search_index_enabled(queryset.db):
+        query = SearchQuery(terms, search_type='websearch', config=settings.RECIPE_SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+
+    # slow path for SQLite (tests): every word has to appear somewhere
+    for word in terms.split():
+        queryset = queryset.filter(
+            Q(title__icontains=word)
+            | Exists(Recipe.tags.through.objects.filter(recipe=OuterRef('pk'), tag__name__icontains=word))
+            | Exists(Recipe.ingredients.through.objects.filter(
+                recipe=OuterRef('pk'), ingredients__name__icontains=word
+            ))
+        )
+    return queryset.order_by('-id')
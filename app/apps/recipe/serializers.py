@@ -1,6 +1,16 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import prefetch_related_objects
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from apps.core.models import Tag, Ingredients, Recipe
+from .counters import recount
+from .relations import BatchedManyRelatedField, UserOwnedPrimaryKeyRelatedField
+from .search import update_search_vectors
+from .versioning import bump_user_version
+
+BULK_BATCH_SIZE = 1000
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -9,9 +19,10 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
         fields = [
             'id',
-            'name'
+            'name',
+            'recipe_count',
         ]
-        read_only_fields = ['id', ]
+        read_only_fields = ['id', 'recipe_count']
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -20,21 +31,38 @@ class IngredientSerializer(serializers.ModelSerializer):
         model = Ingredients
         fields = [
             'id',
-            'name'
+            'name',
+            'recipe_count',
         ]
-        read_only_fields = ['id', ]
+        read_only_fields = ['id', 'recipe_count']
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    # URLs of the resized copies of the recipe image, once they are ready
+
+    def to_representation(self, value):
+        storage = Recipe._meta.get_field('image').storage
+        request = self.context.get('request')
+        urls = {}
+        for variant, formats in value.items():
+            urls[variant] = {}
+            for fmt, name in formats.items():
+                url = storage.url(name)
+                urls[variant][fmt] = request.build_absolute_uri(url) if request is not None else url
+        return urls
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     # Serializer for recipe object
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserOwnedPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredients.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserOwnedPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -45,11 +73,150 @@ class RecipeSerializer(serializers.ModelSerializer):
             'tags',
             'time_minutes',
             'price',
-            'link'
+            'link',
+            'image_variants'
         ]
         read_only_fields = ['id', ]
 
 
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    # Validates a list of recipes together and writes them with batched
+    # INSERT/UPDATE statements instead of one request per recipe
+    update_fields = ['title', 'time_minutes', 'price', 'link']
+
+    def to_internal_value(self, data):
+        # refuse oversized payloads before validating every item
+        max_items = settings.RECIPE_BULK_MAX_ITEMS
+        if isinstance(data, list) and len(data) > max_items:
+            raise serializers.ValidationError({
+                'non_field_errors': [_('At most %d recipes can be sent at once.') % max_items]
+            })
+        if isinstance(data, list):
+            # look up the tags and ingredients of all recipes in one query each
+            for field in self.child.fields.values():
+                if isinstance(field, BatchedManyRelatedField):
+                    field.preload(item.get(field.field_name) for item in data if isinstance(item, dict))
+        items = super().to_internal_value(data)
+
+        # recipes sent with an id are updates and must belong to the user;
+        # errors are reported per item, in the same shape as field errors
+        request = self.context['request']
+        ids = [item['id'] for item in items if item.get('id') is not None]
+        self.existing = Recipe.objects.filter(user=request.user).in_bulk(ids)
+        errors = []
+        seen = set()
+        for item in items:
+            recipe_id = item.get('id')
+            error = {}
+            if recipe_id is not None and recipe_id not in self.existing:
+                error = {'id': [_('Recipe %d does not exist.') % recipe_id]}
+            elif recipe_id is not None and recipe_id in seen:
+                error = {'id': [_('Recipe %d is sent more than once.') % recipe_id]}
+            errors.append(error)
+            seen.add(recipe_id)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    def create(self, validated_data):
+        # write all recipes and their tag and ingredient links in one transaction
+        relations = {
+            'tags': Recipe.tags.through,
+            'ingredients': Recipe.ingredients.through,
+        }
+        recipes = []
+        created = []
+        updated = []
+        links = {name: [] for name in relations}
+        # the updated recipes whose links of each relation are replaced
+        replaced = {name: [] for name in relations}
+        for item in validated_data:
+            item = dict(item)
+            recipe_id = item.pop('id', None)
+            related = {name: item.pop(name) for name in relations if name in item}
+            if recipe_id is None:
+                recipe = Recipe(**item)
+                created.append(recipe)
+            else:
+                recipe = self.existing[recipe_id]
+                for attr, value in item.items():
+                    setattr(recipe, attr, value)
+                updated.append(recipe)
+                for name in related:
+                    replaced[name].append(recipe)
+            recipes.append(recipe)
+            for name, objects in related.items():
+                links[name].append((recipe, objects))
+
+        # the user's shard, set for the request by UserShardMixin
+        using = router.db_for_write(Recipe)
+        with transaction.atomic(using=using):
+            self._insert(created, using)
+            if updated:
+                Recipe.objects.bulk_update(updated, self.update_fields, batch_size=BULK_BATCH_SIZE)
+            for name, through in relations.items():
+                # updates replace the relations they send and leave the others
+                # alone, like PATCH does for one recipe
+                target = Recipe._meta.get_field(name).m2m_reverse_field_name()
+                old_links = through.objects.filter(recipe__in=replaced[name])
+                touched = set(old_links.values_list(f'{target}_id', flat=True))
+                old_links.delete()
+                through.objects.bulk_create([
+                    through(recipe_id=recipe.id, **{f'{target}_id': obj.id})
+                    for recipe, objects in links[name]
+                    for obj in objects
+                ], batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+                # the links changed without m2m_changed signals
+                touched.update(obj.id for _, objects in links[name] for obj in objects)
+                model = Recipe._meta.get_field(name).related_model
+                recount(model.objects.filter(pk__in=touched))
+            update_search_vectors([recipe.id for recipe in recipes], using=using)
+
+            # bulk statements send no model signals, so mark the change here
+            user_ids = {recipe.user_id for recipe in recipes}
+
+            def bump_versions():
+                for user_id in user_ids:
+                    bump_user_version(user_id)
+
+            transaction.on_commit(bump_versions, using=using)
+
+        prefetch_related_objects(recipes, *relations)
+        return recipes
+
+    def _insert(self, recipes, using):
+        # INSERT new recipes in batches; backends that cannot return the new
+        # primary keys from a bulk insert fall back to one INSERT per recipe
+        if not recipes:
+            return
+        if connections[using].features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes, batch_size=BULK_BATCH_SIZE)
+        else:
+            for recipe in recipes:
+                recipe.save()
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    # Serializer for one recipe of a bulk create/update request
+    # recipes sent with an id update the existing recipe
+    id = serializers.IntegerField(required=False)
+    ingredients = UserOwnedPrimaryKeyRelatedField(
+        many=True,
+        required=False,
+        queryset=Ingredients.objects.all()
+    )
+    tags = UserOwnedPrimaryKeyRelatedField(
+        many=True,
+        required=False,
+        queryset=Tag.objects.all()
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        read_only_fields = []
+        list_serializer_class = RecipeBulkListSerializer
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     # Serializer for detail recipe object
     ingredients = IngredientSerializer(many=True, read_only=True)
@@ -58,8 +225,9 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     # serializer for uploading images to recipes
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'image_variants']
         read_only_fields = ['id', ]
@@ -0,0 +1,138 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.core.models import Tag, Ingredients, Recipe
+from .counters import RELATIONS, adjust_counts, link, linked_counts, returning_links, unlink
+from .search import search_index_enabled, update_search_vectors
+from .versioning import bump_user_version
+
+
+def _bump(user_id, using):
+    bump_user_version(user_id)
+    if transaction.get_connection(using).in_atomic_block:
+        # a response rendered before the commit may have been cached under
+        # the version bumped above, so move past it once the data is visible;
+        # the primary pin also runs from the commit
+        transaction.on_commit(lambda: bump_user_version(user_id), using=using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredients)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredients)
+@receiver(post_delete, sender=Recipe)
+def bump_owner_version(sender, instance, **kwargs):
+    # any write to a user owned row changes what the user's lists return
+    _bump(instance.user_id, instance._state.db)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_relation_version(sender, instance, action, reverse, pk_set, **kwargs):
+    # adding or removing tags and ingredients changes the recipe payloads
+    if not action.startswith('post_'):
+        return
+    _bump(instance.user_id, instance._state.db)
+    if reverse and pk_set:
+        # tag.recipe_set.add(...) may touch recipes owned by someone else
+        user_ids = Recipe.objects.filter(pk__in=pk_set).exclude(
+            user_id=instance.user_id
+        ).values_list('user_id', flat=True).distinct()
+        for user_id in user_ids:
+            _bump(user_id, instance._state.db)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields, **kwargs):
+    # keep the search vector in step with the title
+    if update_fields is None or 'title' in update_fields:
+        update_search_vectors([instance.pk], using=instance._state.db)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_recipe_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    # tag and ingredient names are part of the recipe search vector
+    if not reverse:
+        if action.startswith('post_'):
+            update_search_vectors([instance.pk], using=instance._state.db)
+        return
+    if action == 'pre_clear' and search_index_enabled(instance._state.db):
+        # the cleared recipes are only known before the clear
+        instance._cleared_recipe_ids = list(instance.recipe_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        update_search_vectors(instance.__dict__.pop('_cleared_recipe_ids', []), using=instance._state.db)
+    elif action in ('post_add', 'post_remove'):
+        update_search_vectors(pk_set, using=instance._state.db)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredients)
+def index_renamed_attribute(sender, instance, created, **kwargs):
+    # a renamed tag or ingredient changes the vectors of its recipes
+    if not created:
+        update_search_vectors(
+            instance.recipe_set.values_list('pk', flat=True),
+            using=instance._state.db
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredients)
+def remember_attribute_recipes(sender, instance, **kwargs):
+    # the links disappear with the row, so collect the recipes first
+    if search_index_enabled(instance._state.db):
+        instance._indexed_recipe_ids = list(instance.recipe_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredients)
+def index_deleted_attribute(sender, instance, **kwargs):
+    update_search_vectors(instance.__dict__.pop('_indexed_recipe_ids', []), using=instance._state.db)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_relations(sender, instance, action, reverse, model, pk_set, using, **kwargs):
+    # keep recipe_count of the tags and ingredients in step with the links
+    counted = type(instance) if reverse else model
+    if returning_links(using):
+        # write the links here and count the rows the statements report; the
+        # manager's own insert and delete then find nothing left to do
+        recipe_ids, target_ids = (pk_set, [instance.pk]) if reverse else ([instance.pk], pk_set)
+        if action == 'pre_add' and pk_set:
+            adjust_counts(counted, link(counted, recipe_ids, target_ids, using=using), using=using)
+        elif action in ('pre_remove', 'pre_clear'):
+            # pk_set is None when clearing
+            unlinked = unlink(counted, recipe_ids, target_ids, using=using)
+            adjust_counts(counted, {pk: -count for pk, count in unlinked.items()}, using=using)
+        return
+    # elsewhere removals count the links that exist before they are deleted
+    key = f'_unlinked_{counted._meta.model_name}'
+    if action in ('pre_remove', 'pre_clear'):
+        # pk_set is None when clearing
+        if reverse:
+            instance.__dict__[key] = linked_counts(counted, pk_set, [instance.pk], using=using)
+        else:
+            instance.__dict__[key] = linked_counts(counted, [instance.pk], pk_set, using=using)
+    elif action in ('post_remove', 'post_clear'):
+        unlinked = instance.__dict__.pop(key, {})
+        adjust_counts(counted, {pk: -count for pk, count in unlinked.items()}, using=using)
+    elif action == 'post_add' and pk_set:
+        if reverse:
+            adjust_counts(counted, {instance.pk: len(pk_set)}, using=using)
+        else:
+            adjust_counts(counted, dict.fromkeys(pk_set, 1), using=using)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, using, **kwargs):
+    # the links of a deleted recipe go without m2m_changed signals
+    for model in RELATIONS:
+        if returning_links(using):
+            unlinked = unlink(model, [instance.pk], using=using)
+        else:
+            unlinked = linked_counts(model, [instance.pk], using=using)
+        adjust_counts(model, {pk: -count for pk, count in unlinked.items()}, using=using)
@@ -0,0 +1,105 @@
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+from apps.recipe.views import TagViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredients-list')
+
+
+def detail_url(recipe_id):
+    # Return recipe detail url
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@single_database
+@override_settings(ROOT_URLCONF='config.urls_asgi', ASYNC_DATABASE_THREADS=0, RECIPE_RESPONSE_CACHE='none')
+class AsyncReadAPITests(TestCase):
+    # test the async views answer like the synchronous ones
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'async@email.com',
+            'test_pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        # AsyncClient of Django 3.2 takes raw header names
+        self.auth = {'authorization': f'Token {self.token.key}'}
+        self.recipe = Recipe.objects.create(user=self.user, title='Soup', time_minutes=10, price=5.00)
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        self.recipe.ingredients.add(Ingredients.objects.create(user=self.user, name='Leek'))
+
+    async def test_reads_match_sync_views(self):
+        # test lists and details are served by the async views with the same bytes
+        for url in (RECIPES_URL, TAGS_URL, INGREDIENTS_URL, detail_url(self.recipe.id)):
+            response = await self.async_client.get(url, **self.auth)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.resolver_match.func.__name__, 'handle')
+
+            with override_settings(ROOT_URLCONF='config.urls'):
+                expected = await self.sync_get(url)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+
+    async def sync_get(self, url):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return await sync_to_async(client.get)(url)
+
+    async def test_authentication_errors(self):
+        # test missing and invalid tokens get the usual 401 responses
+        response = await self.async_client.get(TAGS_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+        response = await self.async_client.get(TAGS_URL, authorization='Token invalid')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+    async def test_writes_on_async_routes(self):
+        # test writes to the list routes still work
+        response = await self.async_client.post(
+            TAGS_URL, {'name': 'Quick'}, content_type='application/json', **self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+@single_database
+@override_settings(ROOT_URLCONF='config.urls_asgi', ASYNC_DATABASE_THREADS=2)
+class AsyncDatabaseThreadTests(TransactionTestCase):
+    # test the async views run the queries in the database threads
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'threads@email.com',
+            'test_pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    async def test_queries_in_database_thread(self):
+        # test the view ran in a database thread, not on the event loop
+        threads = []
+        get_queryset = TagViewSet.get_queryset
+
+        def record_thread(view):
+            threads.append(threading.current_thread().name)
+            return get_queryset(view)
+
+        with patch.object(TagViewSet, 'get_queryset', record_thread):
+            response = await self.async_client.get(TAGS_URL, authorization=f'Token {self.token.key}')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in response.json()['results']], ['Vegan'])
+        self.assertTrue(threads[0].startswith('async-db'))
@@ -0,0 +1,121 @@
+import tempfile
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredients-list')
+
+
+def detail_url(recipe_id):
+    # Return recipe detail url
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@single_database
+class ConditionalGetTests(TestCase):
+    # test ETag based conditional requests on the recipe API
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'etag@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=5.00
+        )
+
+    def _etag(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response['ETag']
+
+    def test_matching_etag_not_modified(self):
+        # test that a matching If-None-Match skips the queries
+        for url in (RECIPES_URL, TAGS_URL, INGREDIENTS_URL, detail_url(self.recipe.id)):
+            etag = self._etag(url)
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertFalse(response.content)
+
+    def test_etag_depends_on_query_parameters(self):
+        # test that different filters get different ETags
+        self.assertNotEqual(
+            self._etag(TAGS_URL),
+            self._etag(TAGS_URL, assigned_only=1)
+        )
+
+    def test_write_changes_etag(self):
+        # test that creating, editing and deleting rows changes the ETag
+        etag = self._etag(TAGS_URL)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.assertNotEqual(self._etag(TAGS_URL), etag)
+
+        etag = self._etag(TAGS_URL)
+        tag.name = 'Vegetarian'
+        tag.save()
+        self.assertNotEqual(self._etag(TAGS_URL), etag)
+
+        etag = self._etag(TAGS_URL)
+        tag.delete()
+        self.assertNotEqual(self._etag(TAGS_URL), etag)
+
+    def test_m2m_change_changes_etag(self):
+        # test that assigning ingredients to a recipe changes the ETag
+        ingredient = Ingredients.objects.create(user=self.user, name='Salt')
+        etag = self._etag(RECIPES_URL)
+
+        self.recipe.ingredients.add(ingredient)
+        self.assertNotEqual(self._etag(RECIPES_URL), etag)
+
+        etag = self._etag(RECIPES_URL)
+        self.recipe.ingredients.clear()
+        self.assertNotEqual(self._etag(RECIPES_URL), etag)
+
+    def test_upload_image_changes_etag(self):
+        # test that uploading an image changes the recipe ETag
+        url = detail_url(self.recipe.id)
+        etag = self._etag(url)
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(
+                reverse('recipe:recipe-upload-image', args=[self.recipe.id]),
+                {'image': ntf},
+                format='multipart'
+            )
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete(save=False)
+
+        self.assertNotEqual(self._etag(url), etag)
+
+    def test_other_user_write_keeps_etag(self):
+        # test that writes by another user do not invalidate the ETag
+        user2 = get_user_model().objects.create_user(
+            'other@email.com',
+            'test_pass'
+        )
+        etag = self._etag(TAGS_URL)
+        Tag.objects.create(user=user2, name='Fruity')
+
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
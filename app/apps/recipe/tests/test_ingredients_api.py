@@ -5,11 +5,13 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from apps.core.models import Ingredients, Recipe
+from apps.core.tests.utils import single_database
 from apps.recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredients-list')
 
 
+@single_database
 class PublicIngredientsAPITests(TestCase):
     # Test publicly available ingredients API
 
@@ -23,6 +25,7 @@ class PublicIngredientsAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateIngredientsAPITests(TestCase):
     # test the private ingredients API
     def setUp(self):
@@ -44,7 +47,7 @@ class PrivateIngredientsAPITests(TestCase):
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         # test that only ingredients for the authenticated user are returned
@@ -56,8 +59,8 @@ class PrivateIngredientsAPITests(TestCase):
         response = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], ingredient.name)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], ingredient.name)
 
     def test_create_ingredients_successful(self):
         # Test create a new ingredient
@@ -97,14 +100,15 @@ class PrivateIngredientsAPITests(TestCase):
             user=self.user
         )
         recipe.ingredients.add(ingredient1)
+        ingredient1.refresh_from_db()
 
         response = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
 
-        self.assertIn(serializer1.data, response.data)
-        self.assertNotIn(serializer2.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertNotIn(serializer2.data, response.data['results'])
 
     def test_retrieve_ingredient_assigned_unique(self):
         # test filtering ingredients by assigned returns unique items
@@ -130,5 +134,5 @@ class PrivateIngredientsAPITests(TestCase):
 
         response = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
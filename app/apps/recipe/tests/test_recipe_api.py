@@ -1,15 +1,21 @@
 import os
 import tempfile
+from decimal import Decimal
+from unittest.mock import patch
 
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
 from apps.recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from apps.recipe.views import RecipeViewSet, TagViewSet
 
 RECIPES_URL = reverse('recipe:recipe-list')
 
@@ -46,6 +52,7 @@ def sample_recipe(user, **kwargs):
     return Recipe.objects.create(user=user, **defaults)
 
 
+@single_database
 class PublicRecipeAPITests(TestCase):
     # test unauthenticated user recipe access
 
@@ -59,6 +66,7 @@ class PublicRecipeAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateRecipeAPITests(TestCase):
     # test authenticated recipe API access
 
@@ -81,7 +89,7 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_recipes_limited_auth_user(self):
         # test retrieving recipes for user
@@ -98,8 +106,8 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_view_recipe_detail(self):
         # test viewing a recipe detail
@@ -174,6 +182,105 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_validates_ingredients_in_one_query(self):
+        # test that submitted ingredient ids are looked up together
+        def count_queries(size):
+            ingredients = [
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+                for i in range(size)
+            ]
+            payload = {
+                'title': 'Stew',
+                'ingredients': [ingredient.id for ingredient in ingredients],
+                'tags': [],
+                'time_minutes': 120,
+                'price': 12.00
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(RECIPES_URL, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.data['ingredients']), size)
+            return len(queries)
+
+        self.assertEqual(count_queries(1), count_queries(40))
+
+    def test_create_recipe_with_other_users_tag_rejected(self):
+        # test that tags and ingredients of other users cannot be assigned
+        user2 = get_user_model().objects.create_user(
+            email='other@email.com',
+            password='test12343'
+        )
+        payload = {
+            'title': 'Borrowed',
+            'tags': [sample_tag(user=user2).id],
+            'ingredients': [sample_ingredient(user=user2).id],
+            'time_minutes': 10,
+            'price': 3.00
+        }
+
+        response = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.data)
+        self.assertIn('ingredients', response.data)
+        self.assertFalse(Recipe.objects.filter(title='Borrowed').exists())
+
+    def test_create_recipe_invalid_tag_id(self):
+        # test that malformed tag ids are rejected
+        payload = {
+            'title': 'Broken',
+            'tags': ['abc'],
+            'time_minutes': 10,
+            'price': 3.00
+        }
+
+        response = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.data)
+
+    def test_filter_by_several_tags_unique(self):
+        # test that a recipe carrying several requested tags is listed once
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Quick')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag1, tag2)
+
+        response = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual([item['id'] for item in response.data['results']], [recipe.id])
+
+    def test_filter_match_all_tags(self):
+        # test that match=all returns recipes carrying every requested tag
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Quick')
+        both = sample_recipe(user=self.user, title='Salad')
+        both.tags.add(tag1, tag2)
+        one = sample_recipe(user=self.user, title='Stew')
+        one.tags.add(tag1)
+
+        response = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        )
+
+        self.assertEqual([item['id'] for item in response.data['results']], [both.id])
+
+    def test_filter_match_all_ingredients(self):
+        # test that match=all also applies to ingredients
+        ingredient1 = sample_ingredient(user=self.user, name='Egg')
+        ingredient2 = sample_ingredient(user=self.user, name='Milk')
+        both = sample_recipe(user=self.user, title='Pancakes')
+        both.ingredients.add(ingredient1, ingredient2)
+        sample_recipe(user=self.user, title='Omelette').ingredients.add(ingredient1)
+
+        response = self.client.get(
+            RECIPES_URL,
+            {'ingredients': f'{ingredient1.id},{ingredient2.id}', 'match': 'all'}
+        )
+
+        self.assertEqual([item['id'] for item in response.data['results']], [both.id])
+
     def test_partial_update_recipe(self):
         # test updating a recipe with patch
         # PATCH = update fields that are provided in a payload
@@ -223,6 +330,7 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(len(tags), 0)
 
 
+@single_database
 class RecipeImageUploadTests(TestCase):
 
     def setUp(self):
@@ -279,9 +387,9 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, response.data)
-        self.assertIn(serializer2.data, response.data)
-        self.assertNotIn(serializer3.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertIn(serializer2.data, response.data['results'])
+        self.assertNotIn(serializer3.data, response.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         # test returning recipe with specific ingredients
@@ -302,6 +410,261 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, response.data)
-        self.assertIn(serializer2.data, response.data)
-        self.assertNotIn(serializer3.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertIn(serializer2.data, response.data['results'])
+        self.assertNotIn(serializer3.data, response.data['results'])
+
+
+@single_database
+class RecipeQueryBudgetTests(TestCase):
+    # test that recipe endpoints run a fixed number of queries
+    # no matter how many recipes are returned
+    # PostgreSQL aggregates the tag and ingredient ids of the list in the
+    # recipe query, other databases read them with one query per relation
+    QUERY_BUDGET = {
+        'list': 1 if connection.vendor == 'postgresql' else 3,
+        'retrieve': 3,
+        'filter': 1 if connection.vendor == 'postgresql' else 3,
+        'tags': 1,
+        'ingredients': 1,
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'budget@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def _create_recipes(self, count):
+        # create recipes with a tag and an ingredient assigned
+        recipes = []
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+            recipes.append(recipe)
+        return recipes
+
+    def test_list_query_budget(self):
+        # test listing recipes does not issue a query per recipe
+        for count in (1, 10):
+            self._create_recipes(count)
+            with self.assertNumQueries(self.QUERY_BUDGET['list']):
+                response = self.client.get(RECIPES_URL)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_query_budget(self):
+        # test retrieving a recipe with nested tags and ingredients
+        recipe = self._create_recipes(1)[0]
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        recipe.ingredients.add(sample_ingredient(user=self.user, name='Salt'))
+
+        with self.assertNumQueries(self.QUERY_BUDGET['retrieve']):
+            response = self.client.get(detail_url(recipe.id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_filter_query_budget(self):
+        # test filtering by tags and ingredients keeps the same budget
+        self._create_recipes(10)
+        params = [
+            {'tags': f'{self.tag.id}'},
+            {'ingredients': f'{self.ingredient.id}'},
+        ]
+        for query in params:
+            with self.assertNumQueries(self.QUERY_BUDGET['filter']):
+                response = self.client.get(RECIPES_URL, query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_attribute_list_query_budget(self):
+        # test listing tags and ingredients with assigned_only
+        self._create_recipes(10)
+        urls = [
+            ('tags', reverse('recipe:tag-list')),
+            ('ingredients', reverse('recipe:ingredients-list')),
+        ]
+        for name, url in urls:
+            with self.assertNumQueries(self.QUERY_BUDGET[name]):
+                response = self.client.get(url, {'assigned_only': 1})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@single_database
+class RecipePaginationTests(TestCase):
+    # test keyset pagination of the recipe list
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'pages@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _collect_pages(self, params):
+        # follow the next links and return the ids of every page
+        pages = []
+        response = self.client.get(RECIPES_URL, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in response.data['results']])
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_recipes_paginated_by_cursor(self):
+        # test that pages follow the id ordering without gaps
+        recipes = [sample_recipe(user=self.user, title=f'Recipe {i}') for i in range(5)]
+
+        pages = self._collect_pages({'page_size': 2})
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), [recipe.id for recipe in recipes])
+
+    def test_paginated_filter_by_tags(self):
+        # test that the tags filter is kept across pages
+        tag = sample_tag(user=self.user)
+        tagged = []
+        for i in range(4):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            if i % 2 == 0:
+                recipe.tags.add(tag)
+                tagged.append(recipe.id)
+
+        pages = self._collect_pages({'page_size': 1, 'tags': f'{tag.id}'})
+
+        self.assertEqual(sum(pages, []), tagged)
+
+
+@single_database
+@override_settings(RECIPE_RESPONSE_CACHE='none')
+class RecipeValuesListTests(TestCase):
+    # test the lists built from values() rows match the serializers exactly
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rows@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _both(self, viewset, url, params=None):
+        # return the bodies rendered from values() rows and from the serializer
+        fast = self.client.get(url, params)
+        with patch.object(viewset, 'list_representation_class', None):
+            slow = self.client.get(url, params)
+        self.assertEqual(fast.status_code, status.HTTP_200_OK)
+        self.assertEqual(slow.status_code, status.HTTP_200_OK)
+        return fast.content, slow.content
+
+    def test_recipe_list_matches_serializer(self):
+        # test prices, links, variants and unordered relations render the same
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        ingredient = sample_ingredient(user=self.user)
+        recipe = sample_recipe(user=self.user, price=Decimal('4.50'), link='https://example.com/soup')
+        recipe.tags.add(tags[2], tags[0], tags[1])
+        recipe.ingredients.add(ingredient)
+        sample_recipe(user=self.user, title='Plain', image_variants={'thumbnail': {'webp': 'a.thumbnail.webp'}})
+
+        fast, slow = self._both(RecipeViewSet, RECIPES_URL)
+
+        self.assertEqual(fast, slow)
+        self.assertIn(b'"tags":[%d,%d,%d]' % tuple(tag.id for tag in tags), fast)
+        self.assertIn(b'"ingredients":[]', fast)
+
+    def test_filtered_pages_match_serializer(self):
+        # test filtered and search results paginate the same way
+        tag = sample_tag(user=self.user)
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'Lentil soup {i}').tags.add(tag)
+
+        for params in ({'page_size': 2}, {'tags': tag.id, 'page_size': 2}, {'search': 'soup', 'limit': 2}):
+            fast, slow = self._both(RecipeViewSet, RECIPES_URL, params)
+            self.assertEqual(fast, slow)
+
+    def test_attribute_list_matches_serializer(self):
+        # test tags keep their cursor pagination
+        for i in range(3):
+            sample_tag(user=self.user, name=f'Tag {i}')
+
+        fast, slow = self._both(TagViewSet, reverse('recipe:tag-list'), {'page_size': 2})
+
+        self.assertEqual(fast, slow)
+        self.assertIn(b'"next":"http', fast)
+
+
+@single_database
+@override_settings(RECIPE_RESPONSE_CACHE='none')
+class RecipeSparseFieldsetTests(TestCase):
+    # test ?fields= trims the output and the queries behind it
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'fields@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user, link='https://example.com')
+        self.recipe.tags.add(sample_tag(user=self.user))
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+
+    def test_list_fields(self):
+        # test both list paths return only the requested fields
+        for representation in (RecipeViewSet.list_representation_class, None):
+            with patch.object(RecipeViewSet, 'list_representation_class', representation):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(RECIPES_URL, {'fields': 'id,title,price'})
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['results'], [
+                {'id': self.recipe.id, 'title': self.recipe.title, 'price': '30.00'}
+            ])
+            # no relation queries and no unrequested columns
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('"link"', queries[0]['sql'])
+
+    def test_list_relation_field(self):
+        # test a requested relation is still loaded
+        response = self.client.get(RECIPES_URL, {'fields': 'title,tags'})
+
+        self.assertEqual(response.json()['results'], [
+            {'title': self.recipe.title, 'tags': list(self.recipe.tags.values_list('id', flat=True))}
+        ])
+
+    def test_retrieve_fields(self):
+        # test the detail view skips the prefetches of unrequested relations
+        with self.assertNumQueries(1):
+            response = self.client.get(detail_url(self.recipe.id), {'fields': 'title,link'})
+
+        self.assertEqual(response.json(), {'title': self.recipe.title, 'link': 'https://example.com'})
+
+    def test_attribute_list_fields(self):
+        # test tags keep paginating by name when only ids are requested
+        sample_tag(user=self.user, name='Vegan')
+
+        response = self.client.get(reverse('recipe:tag-list'), {'fields': 'id', 'page_size': 1})
+
+        self.assertEqual(list(response.json()['results'][0]), ['id'])
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_unknown_field_rejected(self):
+        # test unknown field names are a bad request
+        response = self.client.get(RECIPES_URL, {'fields': 'title,secret'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.json())
+
+    def test_writes_ignore_fields(self):
+        # test ?fields= does not trim the input of writes
+        response = self.client.patch(
+            detail_url(self.recipe.id) + '?fields=title', {'link': 'https://example.org'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['link'], 'https://example.org')
+        self.assertIn('tags', response.json())
@@ -0,0 +1,179 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+from apps.recipe.serializers import RecipeBulkSerializer
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def recipe_payload(**kwargs):
+    # Return a payload for one recipe of a bulk request
+    defaults = {
+        'title': 'Pancakes',
+        'time_minutes': 20,
+        'price': '4.50',
+    }
+    defaults.update(kwargs)
+    return defaults
+
+
+@single_database
+class RecipeBulkAPITests(TestCase):
+    # test the bulk recipe create/update endpoint
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'bulk@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Breakfast')
+        self.ingredient = Ingredients.objects.create(user=self.user, name='Flour')
+
+    def test_bulk_create_recipes(self):
+        # test creating recipes with tags and ingredients in one request
+        payload = [
+            recipe_payload(title='Pancakes', tags=[self.tag.id], ingredients=[self.ingredient.id]),
+            recipe_payload(title='Waffles', tags=[self.tag.id]),
+            recipe_payload(title='Toast'),
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['title'] for item in response.data], ['Pancakes', 'Waffles', 'Toast'])
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(list(recipes[0].ingredients.all()), [self.ingredient])
+        self.assertEqual(list(recipes[1].tags.all()), [self.tag])
+        self.assertFalse(recipes[2].tags.exists())
+        self.assertEqual(response.data[0]['tags'], [self.tag.id])
+
+    def test_bulk_update_recipes(self):
+        # test that recipes sent with an id are updated in place
+        recipe = Recipe.objects.create(user=self.user, title='Old', time_minutes=5, price=1)
+        recipe.tags.add(self.tag)
+        new_tag = Tag.objects.create(user=self.user, name='Dinner')
+        payload = [
+            recipe_payload(id=recipe.id, title='New', tags=[new_tag.id]),
+            recipe_payload(title='Created'),
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New')
+        self.assertEqual(list(recipe.tags.all()), [new_tag])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_update_keeps_relations_not_sent(self):
+        # test that an update without tags or ingredients leaves those links alone
+        recipe = Recipe.objects.create(user=self.user, title='Old', time_minutes=5, price=1)
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+        payload = [recipe_payload(id=recipe.id, title='New', ingredients=[])]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertFalse(recipe.ingredients.exists())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 1)
+
+    def test_bulk_errors_reported_per_item(self):
+        # test that an invalid item fails the whole request with its index
+        payload = [
+            recipe_payload(),
+            recipe_payload(title=''),
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('title', response.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_other_user_recipe_rejected(self):
+        # test that recipes of other users cannot be updated
+        user2 = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        recipe = Recipe.objects.create(user=user2, title='Theirs', time_minutes=5, price=1)
+
+        response = self.client.post(BULK_URL, [recipe_payload(id=recipe.id)], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data[0])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Theirs')
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=2)
+    def test_bulk_size_limited(self):
+        # test that oversized payloads are refused
+        response = self.client.post(BULK_URL, [recipe_payload()] * 3, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    @skipUnlessDBFeature('can_return_rows_from_bulk_insert')
+    def test_bulk_write_statements_fixed(self):
+        # test that writing more recipes does not issue more statements
+        def count_write_queries(size):
+            payload = [
+                recipe_payload(tags=[self.tag.id], ingredients=[self.ingredient.id])
+                for _ in range(size)
+            ]
+            serializer = RecipeBulkSerializer(
+                data=payload, many=True, context={'request': self._request()}
+            )
+            serializer.is_valid(raise_exception=True)
+            with CaptureQueriesContext(connection) as queries:
+                serializer.save(user=self.user)
+            return len(queries)
+
+        self.assertEqual(count_write_queries(2), count_write_queries(50))
+
+    @skipUnlessDBFeature('can_return_rows_from_bulk_insert')
+    def test_bulk_request_queries_fixed(self):
+        # test that validation and writes do not grow with the payload
+        def count_queries(size):
+            payload = [
+                recipe_payload(tags=[self.tag.id], ingredients=[self.ingredient.id])
+                for _ in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(BULK_URL, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(50))
+
+    def test_bulk_other_user_tag_rejected(self):
+        # test that every item is checked against the user's own tags
+        user2 = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        tag = Tag.objects.create(user=user2, name='Theirs')
+        payload = [
+            recipe_payload(tags=[self.tag.id]),
+            recipe_payload(tags=[tag.id]),
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('tags', response.data[1])
+
+    def _request(self):
+        # minimal request carrying the authenticated user
+        class Request:
+            user = self.user
+        return Request()
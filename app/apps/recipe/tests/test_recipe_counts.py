@@ -0,0 +1,200 @@
+import threading
+import time
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+
+TAGS_URL = reverse('recipe:tag-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def sample_recipe(user, title='Soup'):
+    return Recipe.objects.create(user=user, title=title, time_minutes=10, price=5.00)
+
+
+@single_database
+class RecipeCountTests(TestCase):
+    # test the recipe counters of tags and ingredients follow the links
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'counts@email.com',
+            'test_pass'
+        )
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.leek = Ingredients.objects.create(user=self.user, name='Leek')
+
+    def assertCounts(self, model, expected):
+        self.assertEqual(dict(model.objects.values_list('name', 'recipe_count')), expected)
+
+    def test_forward_changes(self):
+        # test adding, removing, setting and clearing the tags of a recipe
+        soup = sample_recipe(self.user)
+        curry = sample_recipe(self.user, 'Curry')
+        soup.tags.add(self.vegan, self.quick)
+        curry.tags.add(self.vegan)
+        soup.tags.add(self.vegan)
+        self.assertCounts(Tag, {'Vegan': 2, 'Quick': 1})
+
+        # removing a tag that is not linked changes nothing
+        curry.tags.remove(self.vegan, self.quick)
+        self.assertCounts(Tag, {'Vegan': 1, 'Quick': 1})
+
+        soup.tags.set([self.quick])
+        self.assertCounts(Tag, {'Vegan': 0, 'Quick': 1})
+
+        soup.ingredients.add(self.leek)
+        soup.tags.clear()
+        self.assertCounts(Tag, {'Vegan': 0, 'Quick': 0})
+        self.assertCounts(Ingredients, {'Leek': 1})
+
+    def test_reverse_changes(self):
+        # test changing the recipes of a tag
+        soup = sample_recipe(self.user)
+        curry = sample_recipe(self.user, 'Curry')
+        self.vegan.recipe_set.add(soup, curry)
+        self.assertCounts(Tag, {'Vegan': 2, 'Quick': 0})
+
+        self.vegan.recipe_set.remove(soup)
+        self.assertCounts(Tag, {'Vegan': 1, 'Quick': 0})
+
+        self.vegan.recipe_set.add(soup)
+        self.vegan.recipe_set.clear()
+        self.assertCounts(Tag, {'Vegan': 0, 'Quick': 0})
+
+    def test_deleted_recipes_uncounted(self):
+        # test deleting recipes releases their tags and ingredients
+        for title in ('Soup', 'Curry'):
+            recipe = sample_recipe(self.user, title)
+            recipe.tags.add(self.vegan)
+            recipe.ingredients.add(self.leek)
+
+        Recipe.objects.filter(title='Soup').delete()
+
+        self.assertCounts(Tag, {'Vegan': 1, 'Quick': 0})
+        self.assertCounts(Ingredients, {'Leek': 1})
+
+    def test_bulk_endpoint_counts(self):
+        # test the bulk endpoint recounts the rows whose links it replaced
+        client = APIClient()
+        client.force_authenticate(self.user)
+        soup = sample_recipe(self.user)
+        soup.tags.add(self.vegan)
+
+        response = client.post(BULK_URL, [
+            {'id': soup.id, 'title': 'Soup', 'time_minutes': 10, 'price': '5.00', 'tags': [self.quick.id]},
+            {'title': 'Curry', 'time_minutes': 30, 'price': '8.00', 'tags': [self.quick.id],
+             'ingredients': [self.leek.id]},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertCounts(Tag, {'Vegan': 0, 'Quick': 2})
+        self.assertCounts(Ingredients, {'Leek': 1})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent transactions of PostgreSQL')
+@single_database
+class ConcurrentCountTests(TransactionTestCase):
+    # test two transactions writing the same link count it once
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'race@email.com',
+            'test_pass'
+        )
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.soup = sample_recipe(self.user)
+
+    def race(self, change):
+        # run change on the soup in a second thread while the same change of
+        # this thread is not committed yet, so the second one waits on its rows
+        def other():
+            try:
+                change(Recipe.objects.get(pk=self.soup.pk))
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other)
+        with transaction.atomic():
+            change(self.soup)
+            thread.start()
+            time.sleep(0.3)
+        thread.join()
+
+    def test_concurrent_adds(self):
+        # test a link both transactions add is counted once
+        self.race(lambda recipe: recipe.tags.add(self.vegan))
+
+        self.vegan.refresh_from_db()
+        self.assertEqual(self.vegan.recipe_count, 1)
+
+    def test_concurrent_removals(self):
+        # test a link both transactions remove is uncounted once
+        self.soup.tags.add(self.vegan)
+        sample_recipe(self.user, 'Curry').tags.add(self.vegan)
+
+        self.race(lambda recipe: recipe.tags.remove(self.vegan))
+
+        self.vegan.refresh_from_db()
+        self.assertEqual(self.vegan.recipe_count, 1)
+
+
+@single_database
+@override_settings(RECIPE_RESPONSE_CACHE='none')
+class RecipeCountAPITests(TestCase):
+    # test the counters in the tag and ingredient lists
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'popular@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        tags = {name: Tag.objects.create(user=self.user, name=name) for name in ('A', 'B', 'C', 'D')}
+        for i, names in enumerate(('ABC', 'AB', 'A')):
+            sample_recipe(self.user, f'Recipe {i}').tags.add(*(tags[name] for name in names))
+
+    def test_popular_ordering(self):
+        # test ?ordering=popular lists the most used first, page by page
+        names = []
+        response = self.client.get(TAGS_URL, {'ordering': 'popular', 'page_size': 3})
+        names += [(tag['name'], tag['recipe_count']) for tag in response.json()['results']]
+        response = self.client.get(response.json()['next'])
+        names += [(tag['name'], tag['recipe_count']) for tag in response.json()['results']]
+
+        self.assertEqual(names, [('A', 3), ('B', 2), ('C', 1), ('D', 0)])
+
+    def test_popular_ordering_through_ties(self):
+        # test every tag comes back once when more than offset_cutoff share a count
+        Tag.objects.bulk_create(Tag(user=self.user, name=f'Tag {i}') for i in range(1100))
+        expected = list(Tag.objects.filter(user=self.user).order_by('-recipe_count', '-id').values_list('id', flat=True))
+
+        ids = []
+        url = f'{TAGS_URL}?ordering=popular&page_size=300'
+        while url:
+            page = self.client.get(url).json()
+            ids += [tag['id'] for tag in page['results']]
+            url = page['next']
+        self.assertEqual(ids, expected)
+
+        previous = self.client.get(page['previous']).json()
+        self.assertEqual([tag['id'] for tag in previous['results']], expected[600:900])
+
+    def test_assigned_only_reads_counter(self):
+        # test assigned_only filters on the counter without touching the links
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual([tag['name'] for tag in response.json()['results']], ['C', 'B', 'A'])
+        self.assertNotIn(Recipe.tags.through._meta.db_table, queries[-1]['sql'])
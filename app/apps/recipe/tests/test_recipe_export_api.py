@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+from apps.recipe import export
+from apps.recipe.serializers import RecipeDetailSerializer
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def sample_recipe(user, **kwargs):
+    # Create and return sample recipe
+    defaults = {
+        'title': 'Vanilla Cheesecake',
+        'time_minutes': 90,
+        'price': 30.00
+    }
+    defaults.update(**kwargs)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@single_database
+class RecipeExportAPITests(TestCase):
+    # test streaming all of a user's recipes
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'export@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _content(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_requires_authentication(self):
+        # test that anonymous users cannot export
+        response = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_ndjson(self):
+        # test every recipe is one JSON line matching the detail representation
+        recipe = sample_recipe(user=self.user, title='Soup')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(Ingredients.objects.create(user=self.user, name='Leek'))
+        sample_recipe(user=self.user, title='Curry')
+        other = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        sample_recipe(user=other, title='Not mine')
+
+        response = self.client.get(EXPORT_URL)
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Soup', 'Curry'])
+        expected = dict(RecipeDetailSerializer(recipe).data)
+        expected.pop('image_variants')
+        for relation in ('tags', 'ingredients'):
+            expected[relation] = [{'id': item['id'], 'name': item['name']} for item in expected[relation]]
+        self.assertEqual(rows[0], json.loads(json.dumps(expected)))
+
+    def test_export_csv(self):
+        # test the csv export has a header and the names of tags and ingredients
+        recipe = sample_recipe(user=self.user, title='Soup, with leeks')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Quick'))
+
+        response = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('recipes.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self._content(response))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Soup, with leeks')
+        self.assertEqual(rows[0]['tags'], 'Vegan|Quick')
+        self.assertEqual(rows[0]['ingredients'], '')
+
+    def test_export_csv_by_accept_header(self):
+        # test an empty csv export still has its header
+        response = self.client.get(EXPORT_URL, HTTP_ACCEPT='text/csv')
+
+        self.assertEqual(self._content(response).splitlines(), [','.join(export.CSV_COLUMNS)])
+
+    def test_export_honours_filters(self):
+        # test the list filters narrow down the export
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        sample_recipe(user=self.user, title='Soup').tags.add(tag)
+        sample_recipe(user=self.user, title='Steak')
+
+        response = self.client.get(EXPORT_URL, {'tags': tag.id})
+
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Soup'])
+
+    @patch.object(export, 'EXPORT_CHUNK_SIZE', 2)
+    def test_export_prefetches_per_chunk(self):
+        # test the relations are loaded with two queries per chunk, not per recipe
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'Recipe {i}').tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(EXPORT_URL)
+            lines = self._content(response).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        relation_queries = [q for q in queries.captured_queries if 'recipe_id' in q['sql'] and 'IN (' in q['sql']]
+        self.assertEqual(len(relation_queries), 3 * 2)
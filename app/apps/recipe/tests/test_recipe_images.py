@@ -0,0 +1,226 @@
+import io
+import os
+import tempfile
+
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe
+from apps.core.tests.utils import single_database
+from apps.recipe import images
+from apps.recipe.uploads import RecipeImageUploadHandler
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def image_upload_url(recipe_id):
+    # return url for recipe image upload
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+@single_database
+@override_settings(RECIPE_IMAGE_WORKERS=0)
+class RecipeImageVariantTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@user.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, title='Pizza', time_minutes=20, price=10)
+        self.storage = Recipe._meta.get_field('image').storage
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        for formats in self.recipe.image_variants.values():
+            for name in formats.values():
+                self.storage.delete(name)
+        self.recipe.image.delete(save=False)
+
+    def upload(self, size=(800, 600)):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', size, 'red').save(ntf, format='JPEG')
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+        self.recipe.refresh_from_db()
+        return response
+
+    def test_upload_generates_variants(self):
+        # test every variant is written in every format with the right size
+        response = self.upload()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(self.recipe.image_variants), set(images.VARIANTS))
+        for variant, (width, height, crop) in images.VARIANTS.items():
+            self.assertEqual(set(self.recipe.image_variants[variant]), set(images.FORMATS))
+            for name in self.recipe.image_variants[variant].values():
+                self.assertTrue(name.startswith(self.recipe.image.name))
+                with self.storage.open(name) as file, Image.open(file) as image:
+                    if crop:
+                        self.assertEqual(image.size, (width, height))
+                    else:
+                        self.assertLessEqual(max(image.size), max(width, height))
+
+    def test_full_variant_does_not_upscale(self):
+        # test small images keep their size in the full variant
+        self.upload(size=(300, 200))
+
+        name = self.recipe.image_variants['full']['webp']
+        with self.storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (300, 200))
+
+    def test_variants_exposed_in_api(self):
+        # test the recipe list returns absolute urls of the variants
+        self.upload()
+
+        response = self.client.get(RECIPES_URL)
+
+        variants = response.data['results'][0]['image_variants']
+        self.assertEqual(set(variants), set(images.VARIANTS))
+        self.assertTrue(variants['thumbnail']['jpeg'].startswith('http://testserver/'))
+
+    def test_variants_empty_until_generated(self):
+        # test the upload response does not point at variants that are not written yet
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (50, 50)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            response = self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_variants'], {})
+
+    def test_stale_variants_not_published(self):
+        # test variants of an image that was replaced meanwhile are not published
+        self.upload()
+        Recipe.objects.filter(pk=self.recipe.pk).update(image_variants={})
+        Recipe.objects.filter(pk=self.recipe.pk).update(image='uploads/recipe/replaced.jpg')
+
+        images.generate_variants(self.recipe.id, self.user.id, self.recipe.image.name)
+
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).image_variants, {})
+        Recipe.objects.filter(pk=self.recipe.pk).update(image=self.recipe.image.name)
+
+    def test_upload_resets_previous_variants(self):
+        # test a new upload replaces the variants of the previous image
+        self.upload()
+        first = self.recipe.image_variants
+        first_image = self.recipe.image.name
+
+        self.upload(size=(640, 480))
+
+        self.assertNotEqual(self.recipe.image_variants, first)
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        for formats in first.values():
+            for name in formats.values():
+                self.storage.delete(name)
+        self.storage.delete(first_image)
+
+    def test_same_image_reuses_stored_variants(self):
+        # test uploading an image stored before writes no new files
+        self.upload()
+        other = Recipe.objects.create(user=self.user, title='Pasta', time_minutes=20, price=10)
+        thumbnail = self.storage.path(self.recipe.image_variants['thumbnail']['webp'])
+        written = os.stat(thumbnail).st_mtime_ns
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (800, 600), 'red').save(ntf, format='JPEG')
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(image_upload_url(other.id), {'image': ntf}, format='multipart')
+
+        other.refresh_from_db()
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        self.assertEqual(other.image_variants, self.recipe.image_variants)
+        self.assertEqual(os.stat(thumbnail).st_mtime_ns, written)
+
+
+@single_database
+@override_settings(RECIPE_IMAGE_WORKERS=0)
+class RecipeImageUploadLimitTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@user.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(user=self.user, title='Pizza', time_minutes=20, price=10)
+        self.staging = os.path.join(settings.MEDIA_ROOT, settings.RECIPE_IMAGE_STAGING_DIR)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            storage = self.recipe.image.storage
+            for formats in self.recipe.image_variants.values():
+                for name in formats.values():
+                    storage.delete(name)
+            self.recipe.image.delete(save=False)
+
+    def post_image(self, size=(100, 100), image_format='JPEG', suffix='.jpg'):
+        with tempfile.NamedTemporaryFile(suffix=suffix) as ntf:
+            Image.effect_noise(size, 64).convert('RGB').save(ntf, format=image_format)
+            ntf.seek(0)
+            return self.client.post(image_upload_url(self.recipe.id), {'image': ntf}, format='multipart')
+
+    def staged_files(self):
+        if not os.path.isdir(self.staging):
+            return []
+        return os.listdir(self.staging)
+
+    def test_upload_is_moved_out_of_staging(self):
+        # test accepted images are moved to their final name
+        response = self.post_image()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(self.staged_files(), [])
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_upload_too_large(self):
+        # test uploads over the byte limit are rejected with 413
+        response = self.post_image(size=(500, 500), image_format='PNG', suffix='.png')
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self.staged_files(), [])
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100 * 100)
+    def test_upload_too_many_pixels(self):
+        # test images with more pixels than allowed are rejected
+        response = self.post_image(size=(101, 100))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+        self.assertEqual(self.staged_files(), [])
+
+    def test_upload_unsupported_format(self):
+        # test images in formats outside RECIPE_IMAGE_FORMATS are rejected
+        response = self.post_image(image_format='BMP', suffix='.bmp')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+        self.assertEqual(self.staged_files(), [])
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100 * 100)
+    def test_pixels_checked_from_header(self):
+        # test oversized images are rejected on the first chunk, before the rest is read
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 2000)).save(buffer, format='PNG')
+        handler = RecipeImageUploadHandler()
+        handler.new_file('image', 'big.png', 'image/png', None)
+
+        with self.assertRaises(ValidationError):
+            handler.receive_data_chunk(buffer.getvalue()[:handler.chunk_size], 0)
+        self.assertEqual(self.staged_files(), [])
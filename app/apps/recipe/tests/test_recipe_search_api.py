@@ -0,0 +1,95 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, **kwargs):
+    # Create and return sample recipe
+    defaults = {
+        'title': 'Vanilla Cheesecake',
+        'time_minutes': 90,
+        'price': 30.00
+    }
+    defaults.update(**kwargs)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@single_database
+class RecipeSearchAPITests(TestCase):
+    # test searching recipes by title, tags and ingredients
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'search@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, terms):
+        response = self.client.get(RECIPES_URL, {'search': terms})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_search_by_title(self):
+        # test that recipes are found by words of their title
+        sample_recipe(user=self.user, title='Pumpkin soup')
+        sample_recipe(user=self.user, title='Fish and chips')
+
+        self.assertEqual(self._search('pumpkin'), ['Pumpkin soup'])
+
+    def test_search_by_tag_and_ingredient(self):
+        # test that tag and ingredient names are searched
+        soup = sample_recipe(user=self.user, title='Soup')
+        soup.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        curry = sample_recipe(user=self.user, title='Curry')
+        curry.ingredients.add(Ingredients.objects.create(user=self.user, name='Coconut'))
+
+        self.assertEqual(self._search('vegan'), ['Soup'])
+        self.assertEqual(self._search('coconut'), ['Curry'])
+
+    def test_search_follows_renamed_tag(self):
+        # test that renaming a tag updates the search results
+        recipe = sample_recipe(user=self.user, title='Salad')
+        tag = Tag.objects.create(user=self.user, name='Summer')
+        recipe.tags.add(tag)
+
+        tag.name = 'Winter'
+        tag.save()
+
+        self.assertEqual(self._search('winter'), ['Salad'])
+        self.assertEqual(self._search('summer'), [])
+
+    def test_search_limited_to_user(self):
+        # test that other users' recipes are not found
+        user2 = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        sample_recipe(user=user2, title='Pumpkin pie')
+
+        self.assertEqual(self._search('pumpkin'), [])
+
+    def test_search_requires_every_word(self):
+        # test that all words of the query have to match
+        recipe = sample_recipe(user=self.user, title='Tomato soup')
+        recipe.ingredients.add(Ingredients.objects.create(user=self.user, name='Basil'))
+        sample_recipe(user=self.user, title='Tomato salad')
+
+        self.assertEqual(self._search('tomato basil'), ['Tomato soup'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'ranking needs PostgreSQL full-text search')
+    def test_search_ranks_title_matches_first(self):
+        # test that title matches outrank ingredient matches
+        by_ingredient = sample_recipe(user=self.user, title='Stew')
+        by_ingredient.ingredients.add(Ingredients.objects.create(user=self.user, name='Lentil'))
+        sample_recipe(user=self.user, title='Lentil soup')
+
+        self.assertEqual(self._search('lentil'), ['Lentil soup', 'Stew'])
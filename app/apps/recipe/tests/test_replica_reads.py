@@ -0,0 +1,100 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core import routers
+from apps.core.models import Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def detail_url(recipe_id):
+    # Return recipe detail url
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+# the first configured replica; set POSTGRES_REPLICA_HOSTS (e.g. to the
+# primary's host) to run these
+REPLICA = next(iter(settings.REPLICA_DATABASES), None)
+
+
+@skipUnless(REPLICA, 'needs a replica database (POSTGRES_REPLICA_HOSTS)')
+@override_settings(REPLICA_DATABASES=[REPLICA], SHARD_DATABASES=['default'], RECIPE_RESPONSE_CACHE='none')
+class ReplicaReadTests(TransactionTestCase):
+    # test the recipe API reads from the replica unless the user just wrote
+    databases = {'default', *settings.REPLICA_DATABASES[:1]}
+
+    def setUp(self):
+        routers._lag.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'replica@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=5.00
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        # the writes above pinned the user to the primary
+        cache.clear()
+
+    def get(self, url):
+        # the response and the queries each database ran for it
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(primary), len(replica)
+
+    def test_reads_from_replica(self):
+        # test lists and details are queried on the replica
+        for url in (RECIPES_URL, TAGS_URL, detail_url(self.recipe.id)):
+            response, primary, replica = self.get(url)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+        self.assertEqual(response.data['title'], 'Soup')
+
+    def test_writer_reads_from_primary(self):
+        # test a user who just wrote reads their write from the primary
+        res = self.client.post(TAGS_URL, {'name': 'Quick'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        response, primary, replica = self.get(TAGS_URL)
+
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        self.assertIn('Quick', [tag['name'] for tag in response.data['results']])
+
+    def test_bulk_writer_reads_from_primary(self):
+        # test a bulk update pins the user to the primary like single writes
+        payload = [{'id': self.recipe.id, 'title': 'Stew', 'time_minutes': 10, 'price': '5.00'}]
+        res = self.client.post(BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        response, primary, replica = self.get(RECIPES_URL)
+
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+    @patch('apps.core.routers.replica_lag', return_value=60.0)
+    def test_lagging_replica_routed_around(self, replica_lag):
+        # test reads fall back to the primary when the replica lags
+        response, primary, replica = self.get(RECIPES_URL)
+
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from apps.core.models import Recipe, Tag, Ingredients
+from apps.core.tests.utils import single_database
+from apps.recipe.versioning import get_user_version
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredients-list')
+
+
+def detail_url(recipe_id):
+    # Return recipe detail url
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@single_database
+class ResponseCacheTests(TestCase):
+    # test rendered responses are reused until the user's data changes
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'cache@email.com',
+            'test_pass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=5.00
+        )
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        self.recipe.ingredients.add(Ingredients.objects.create(user=self.user, name='Leek'))
+
+    def _assert_cached(self, url, params=None):
+        # the second request must skip the database and return the same bytes
+        first = self.client.get(url, params)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, params)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        self.assertEqual(second['ETag'], first['ETag'])
+        return second
+
+    def test_repeated_reads_cached(self):
+        # test lists and details are served from the cache
+        for url in (RECIPES_URL, TAGS_URL, INGREDIENTS_URL, detail_url(self.recipe.id)):
+            self._assert_cached(url)
+
+    def test_query_parameters_cached_separately(self):
+        # test different parameters get different entries
+        full = self._assert_cached(RECIPES_URL)
+        sparse = self._assert_cached(RECIPES_URL, {'fields': 'title'})
+
+        self.assertNotEqual(full.content, sparse.content)
+        self.assertEqual(sparse.json()['results'], [{'title': 'Soup'}])
+
+    def test_writes_invalidate(self):
+        # test API writes, model saves and relation changes show up at once
+        self._assert_cached(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': 'Quick'})
+        self.assertIn('Quick', [tag['name'] for tag in self.client.get(TAGS_URL).json()['results']])
+
+        self._assert_cached(RECIPES_URL)
+        self.recipe.tags.clear()
+        self.assertEqual(self.client.get(RECIPES_URL).json()['results'][0]['tags'], [])
+
+        Recipe.objects.filter(pk=self.recipe.pk).first().save()
+        with self.assertNumQueries(1):
+            self.client.get(detail_url(self.recipe.id), {'fields': 'title'})
+
+    def test_other_users_not_served(self):
+        # test the cache is per user
+        self._assert_cached(TAGS_URL)
+        other = get_user_model().objects.create_user('other@email.com', 'test_pass')
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get(TAGS_URL).json()['results'], [])
+
+    def test_writes_bump_again_on_commit(self):
+        # test a response cached before the commit cannot be served after it
+        version = get_user_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Tag.objects.create(user=self.user, name='Quick')
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_user_version(self.user.id), version + 2)
+
+    @override_settings(RECIPE_RESPONSE_CACHE='shared')
+    def test_shared_backend(self):
+        # test responses can be kept in the shared Django cache
+        self._assert_cached(RECIPES_URL)
+
+    @override_settings(RECIPE_RESPONSE_CACHE='none')
+    def test_disabled(self):
+        # test the cache can be switched off
+        self.client.get(TAGS_URL)
+        with self.assertNumQueries(1):
+            self.client.get(TAGS_URL)
+
+    @override_settings(RECIPE_RESPONSE_CACHE_MAX_BYTES=10)
+    def test_large_responses_not_cached(self):
+        # test responses over the size limit are rendered every time
+        self.client.get(TAGS_URL)
+        with self.assertNumQueries(1):
+            self.client.get(TAGS_URL)
@@ -5,11 +5,13 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from apps.core.models import Tag, Recipe
+from apps.core.tests.utils import single_database
 from apps.recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
 
 
+@single_database
 class PublicTagsAPITests(TestCase):
     # Publicly available test API
 
@@ -23,6 +25,7 @@ class PublicTagsAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateTagsAPITests(TestCase):
     # Tag tests for authorized users
     def setUp(self):
@@ -44,7 +47,7 @@ class PrivateTagsAPITests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         # test that tags returned are for authenticated user
@@ -58,8 +61,8 @@ class PrivateTagsAPITests(TestCase):
         response = self.client.get(TAGS_URL)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], tag.name)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], tag.name)
 
     def test_create_tag_successful(self):
         # Test creating a new tag
@@ -96,14 +99,15 @@ class PrivateTagsAPITests(TestCase):
             user=self.user
         )
         recipe.tags.add(tag1)
+        tag1.refresh_from_db()
 
         response = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
 
-        self.assertIn(serializer1.data, response.data)
-        self.assertNotIn(serializer2.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertNotIn(serializer2.data, response.data['results'])
 
     def test_tags_filtered_are_unique(self):
         # test that the filtered, listed tags are unique
@@ -127,4 +131,25 @@ class PrivateTagsAPITests(TestCase):
 
         response = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_tags_paginated_with_assigned_only(self):
+        # test paging through assigned tags ordered by name
+        recipe = Recipe.objects.create(
+            title='Porridge',
+            time_minutes=5,
+            price=2.00,
+            user=self.user
+        )
+        for name in ['Apple', 'Banana', 'Cherry']:
+            recipe.tags.add(Tag.objects.create(user=self.user, name=name))
+        Tag.objects.create(user=self.user, name='Unused')
+
+        names = []
+        response = self.client.get(TAGS_URL, {'assigned_only': 1, 'page_size': 2})
+        while response.data['next']:
+            names += [tag['name'] for tag in response.data['results']]
+            response = self.client.get(response.data['next'])
+        names += [tag['name'] for tag in response.data['results']]
+
+        self.assertEqual(names, ['Cherry', 'Banana', 'Apple'])
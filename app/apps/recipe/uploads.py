@@ -0,0 +1,116 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+# most formats describe their size in the first few kilobytes, give up on
+# files that have not done so after this many bytes
+HEADER_MAX_SIZE = 256 * 1024
+
+
+class RequestEntityTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('Uploaded image is too large.')
+    default_code = 'too_large'
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    # Upload written to a staging directory inside MEDIA_ROOT, so saving it
+    # with the file system storage is a rename instead of a copy
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        directory = os.path.join(settings.MEDIA_ROOT, settings.RECIPE_IMAGE_STAGING_DIR)
+        os.makedirs(directory, exist_ok=True)
+        _, extension = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + extension, dir=directory)
+        super(TemporaryUploadedFile, self).__init__(file, name, content_type, size, charset, content_type_extra)
+
+
+class RecipeImageUploadHandler(FileUploadHandler):
+    # Streams uploaded images to disk chunk by chunk and rejects them as soon
+    # as they exceed the byte limit or their header shows an unsupported
+    # format or too many pixels, so nothing is ever fully decoded in memory
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            raise RequestEntityTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StagedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.header = bytearray()
+        self.identified = False
+        # hashed on the way in for the content addressed storage
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            self.discard()
+            raise RequestEntityTooLarge()
+        if not self.identified:
+            self.header += raw_data[:HEADER_MAX_SIZE - len(self.header)]
+            self.identified = self.check_header(final=len(self.header) >= HEADER_MAX_SIZE)
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.identified:
+            self.check_header(final=True)
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
+
+    def check_header(self, final):
+        # return whether the header read so far identifies an acceptable
+        # image, Pillow only parses the header until the pixels are loaded
+        try:
+            image = Image.open(io.BytesIO(self.header), formats=settings.RECIPE_IMAGE_FORMATS)
+        except Image.DecompressionBombError:
+            self.reject(_('Image has too many pixels.'))
+        except (UnidentifiedImageError, OSError):
+            if final:
+                self.reject(_('Upload a valid JPEG, PNG or GIF image.'))
+            return False
+        width, height = image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.reject(_('Image has too many pixels.'))
+        return True
+
+    def reject(self, message):
+        self.discard()
+        raise ValidationError({self.field_name: [message]})
+
+    def discard(self):
+        # closing the staged file deletes it
+        self.file.close()
+
+
+class RecipeImageUploadParser(MultiPartParser):
+    # Multipart parser streaming files through RecipeImageUploadHandler
+    # instead of the default memory and temporary file handlers
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = [RecipeImageUploadHandler(request)]
+
+        try:
+            parser = DjangoMultiPartParser(meta, stream, upload_handlers, encoding)
+            data, files = parser.parse()
+            return DataAndFiles(data, files)
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
@@ -0,0 +1,41 @@
+import secrets
+
+from django.core.cache import cache
+
+from apps.core.routers import pin_to_primary
+
+# versions live for a long time; if one is evicted anyway it restarts from a
+# random value so ETags handed out before the eviction cannot match again
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _version_key(user_id):
+    return f'recipe-version:{user_id}'
+
+
+def _initial_version():
+    return secrets.randbits(48)
+
+
+def get_user_version(user_id):
+    # return the current change version of the user's recipe data
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_version(user_id):
+    # mark the user's tags, ingredients and recipes as changed; the user's
+    # next reads must see the change, so they also go to the primary rather
+    # than to a lagging replica whose body would be cached under the new
+    # version
+    pin_to_primary(user_id)
+    key = _version_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), VERSION_TIMEOUT)
+        return cache.incr(key)
@@ -1,21 +1,49 @@
+from django.db.models import Count, Exists, OuterRef, Prefetch
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from apps.core.models import Tag, Ingredients, Recipe
+from apps.user.authentication import CachedTokenAuthentication
+from .export import CSVRenderer, NDJSONRenderer, export_response
+from .images import queue_variants
+from .mixins import ReplicaReadMixin, ResponseCacheMixin, SparseFieldsetMixin, UserShardMixin, \
+    UserVersionETagMixin, ValuesListMixin
+from .pagination import RecipeCursorPagination, RecipeAttributeCursorPagination, RecipeAttributePopularityPagination, \
+    RecipeSearchPagination
+from .rows import ValuesRepresentation
+from .search import search_recipes
 from .serializers import TagSerializer, IngredientSerializer, RecipeSerializer, RecipeDetailSerializer, \
-    RecipeImageSerializer
+    RecipeImageSerializer, RecipeBulkSerializer
+from .uploads import RecipeImageUploadParser
 
 
-class BaseRecipeViewSet(viewsets.GenericViewSet,
+class BaseRecipeViewSet(UserShardMixin,
+                        ReplicaReadMixin,
+                        ResponseCacheMixin,
+                        UserVersionETagMixin,
+                        ValuesListMixin,
+                        SparseFieldsetMixin,
+                        viewsets.GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.CreateModelMixin):
 
     # Base ViewSet for user owned recipe attributes
-    authentication_classes = [TokenAuthentication, ]
+    authentication_classes = [CachedTokenAuthentication, ]
     permission_classes = [IsAuthenticated, ]
+    pagination_class = RecipeAttributeCursorPagination
+    list_representation_class = ValuesRepresentation
+
+    def popular(self):
+        # ?ordering=popular lists the most used first
+        return self.request is not None and self.request.query_params.get('ordering') == 'popular'
+
+    @property
+    def paginator(self):
+        if self.popular():
+            self.pagination_class = RecipeAttributePopularityPagination
+        return super().paginator
 
     def get_queryset(self):
         # return objects for the authenticated user only
@@ -24,11 +52,12 @@ class BaseRecipeViewSet(viewsets.GenericViewSet,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            # the denormalized counter spares a semi-join on the links
+            queryset = queryset.filter(recipe_count__gt=0)
 
-        return queryset.filter(
+        return self.sparse_queryset(queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by(*(('-recipe_count', '-id') if self.popular() else ('-name',))))
 
     def perform_create(self, serializer):
         # Create a new object
@@ -49,29 +78,66 @@ class IngredientViewSet(BaseRecipeViewSet):
     serializer_class = IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(UserShardMixin, ReplicaReadMixin, ResponseCacheMixin, UserVersionETagMixin, ValuesListMixin,
+                    SparseFieldsetMixin, viewsets.ModelViewSet):
     # Manage recipes in the db
     serializer_class = RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication, ]
+    authentication_classes = [CachedTokenAuthentication, ]
     permission_classes = [IsAuthenticated, ]
+    pagination_class = RecipeCursorPagination
+    list_representation_class = ValuesRepresentation
 
     def _params_to_ints(self, _qs):
         # convert a list of string IDs to list of ints
         return [int(str_id) for str_id in _qs.split(',')]
 
+    def _filter_related(self, queryset, relation, ids, match_all):
+        # keep recipes linked to any (or, with match_all, every) of the ids
+        # using EXISTS, so a recipe matching several ids is returned once
+        field = Recipe._meta.get_field(relation)
+        links = field.remote_field.through.objects.filter(
+            recipe=OuterRef('pk'),
+            **{f'{field.m2m_reverse_field_name()}__in': ids}
+        )
+        if match_all:
+            links = links.values('recipe').annotate(
+                matched=Count('pk')
+            ).filter(matched=len(set(ids)))
+        return queryset.filter(Exists(links))
+
     def get_queryset(self):
         # retrieve the queryset for the authenticated user
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
+        match_all = self.request.query_params.get('match') == 'all'
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_related(queryset, 'tags', tag_ids, match_all)
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-        return queryset.filter(user=self.request.user)
+            queryset = self._filter_related(queryset, 'ingredients', ingredient_ids, match_all)
+        if search:
+            queryset = search_recipes(queryset, search)
+        # load the requested M2M relations in one query each instead of one
+        # per recipe, in id order like the list rows aggregate them
+        prefetches = [
+            Prefetch(relation, queryset=model.objects.order_by('id'))
+            for relation, model in (('tags', Tag), ('ingredients', Ingredients))
+            if self.field_requested(relation)
+        ]
+        return self.sparse_queryset(queryset.filter(
+            user=self.request.user
+        ).prefetch_related(*prefetches))
+
+    @property
+    def paginator(self):
+        # ranked search results are paginated by offset
+        if self.action == 'list' and self.request is not None and self.request.query_params.get('search'):
+            self.pagination_class = RecipeSearchPagination
+        return super().paginator
 
     def get_serializer_class(self):
         # gets serializer class for a different actions,requests
@@ -80,13 +146,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeDetailSerializer
         elif self.action == 'upload_image':
             return RecipeImageSerializer
+        elif self.action == 'bulk':
+            return RecipeBulkSerializer
         return self.serializer_class
 
     def perform_create(self, serializer):
         # create a new recipe
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST', ], detail=True, url_path='upload-image')
+    @action(methods=['POST', ], detail=True, url_path='upload-image', parser_classes=[RecipeImageUploadParser])
     def upload_image(self, request, pk=None):
         # upload an image to a recipe
         recipe = self.get_object()
@@ -95,7 +163,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            # variants of the previous image no longer apply; new ones are
+            # generated in the background and exposed once they are ready
+            recipe = serializer.save(image_variants={})
+            queue_variants(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -104,3 +175,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['POST', ], detail=False, url_path='bulk')
+    def bulk(self, request):
+        # create or update a list of recipes in one request
+        # the list is validated as a whole and nothing is written
+        # unless every recipe is valid
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(methods=['GET', ], detail=False, url_path='export', renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        # stream all of the user's recipes (honouring the list filters)
+        # as NDJSON or, with ?format=csv or Accept: text/csv, as CSV
+        queryset = self.filter_queryset(self.get_queryset())
+        # the rows are read while streaming, after the request left the
+        # user's shard
+        return export_response(queryset.using(queryset.db), request.accepted_renderer.format)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.user'
+
+    def ready(self):
+        # connect the token cache invalidation handlers
+        from . import signals  # noqa: F401
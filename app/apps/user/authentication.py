@@ -0,0 +1,90 @@
+import copy
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from apps.core.cache import LRUCache
+from apps.core.concurrency import run_in_database_thread
+
+# per-process copy of recently used tokens in front of the shared cache
+token_cache = LRUCache(
+    max_size=settings.AUTH_TOKEN_LOCAL_CACHE_SIZE,
+    timeout=settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT,
+)
+
+
+def _cache_key(key):
+    # token keys are credentials, so only their digest leaves the process
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _without_password(token):
+    # the password hash never goes into a cache: the cached user has it
+    # deferred, so it is loaded from the database if a request reads it and
+    # saving the user leaves it alone unless it was set
+    user = copy.copy(token.user)
+    del user.password
+    token.user = user
+    return token
+
+
+def invalidate_token(key):
+    # drop a token from the local and the shared cache
+    token_cache.delete(key)
+    cache.delete(_cache_key(key))
+
+
+class TokenNotCached(Exception):
+    # Raised by authenticate_credentials() in local_only mode
+    def __init__(self, key):
+        self.key = key
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Token authentication that resolves the token owner from the cache
+    # and only falls back to the database on a miss
+    local_only = False
+
+    async def authenticate_async(self, request):
+        # authenticate() for async views: tokens in this process' cache are
+        # resolved on the event loop, the others in a database thread
+        self.local_only = True
+        try:
+            return self.authenticate(request)
+        except TokenNotCached as miss:
+            self.local_only = False
+            return await run_in_database_thread(self.authenticate_credentials, miss.key)
+        finally:
+            self.local_only = False
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            if self.local_only:
+                raise TokenNotCached(key)
+            token = cache.get(_cache_key(key))
+            if token is None:
+                token = _without_password(self._get_token(key))
+                cache.set(_cache_key(key), token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            token_cache.set(key, token)
+
+        # hand out a copy so a request mutating its user (e.g. ManageUserView)
+        # never changes the instance other requests read from the cache
+        token = copy.copy(token)
+        user = copy.copy(token.user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user, token
+
+    def _get_token(self, key):
+        # load the token together with its user in a single query
+        model = self.get_model()
+        try:
+            return model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    # a deleted token must stop authenticating straight away
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_tokens(sender, instance, created, **kwargs):
+    # cached tokens carry a copy of the user, so drop them on every change
+    # (profile edits through ManageUserView, deactivation, password changes)
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(key)
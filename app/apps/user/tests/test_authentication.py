@@ -0,0 +1,100 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.core.tests.utils import single_database
+from apps.user.authentication import _cache_key, token_cache
+
+ME_URL = reverse('user:me')
+
+
+@single_database
+class CachedTokenAuthenticationTests(TestCase):
+    # Test the cached token authentication backend
+
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com',
+            password='test_pass',
+            name='Name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_database(self):
+        # Test that a repeated request resolves the user without a query
+        with self.assertNumQueries(1):
+            response = self.client.get(ME_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_shared_cache_used_after_local_eviction(self):
+        # Test that the shared cache serves tokens evicted from the local LRU
+        self.client.get(ME_URL)
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token_rejected(self):
+        # Test that an unknown token is rejected
+        self.client.credentials(HTTP_AUTHORIZATION='Token wrong')
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_evicted(self):
+        # Test that deleting a token stops it authenticating
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_evicted(self):
+        # Test that deactivating a user stops their token authenticating
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_evicted(self):
+        # Test that edits through the profile endpoint are not served stale
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.data['name'], 'New name')
+
+    def test_password_hash_not_cached(self):
+        # Test that the cached user carries no password hash and saving it
+        # keeps the stored one
+        self.client.get(ME_URL)
+
+        cached = cache.get(_cache_key(self.token.key))
+        self.assertNotIn('password', cached.user.__dict__)
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('test_pass'))
+
+        self.client.patch(ME_URL, {'password': 'new_pass'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new_pass'))
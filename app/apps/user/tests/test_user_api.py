@@ -4,6 +4,9 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from apps.core.tests.utils import single_database
+
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -13,6 +16,7 @@ def create_user(**parameters):
     return get_user_model().objects.create_user(**parameters)
 
 
+@single_database
 class PublicUserApiTests(TestCase):
     # Unauthenticated user from the internet gives the request
     # Test the user API Public
@@ -117,6 +121,7 @@ class PublicUserApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateUserAPITests(TestCase):
     # Test APi than requires authentication
     def setUp(self):
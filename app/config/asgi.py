@@ -9,8 +9,23 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+
+class AsyncURLConfASGIHandler(ASGIHandler):
+    # Resolve ASGI requests with ASGI_URLCONF, which serves the recipe API
+    # read path with async views
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = AsyncURLConfASGIHandler()
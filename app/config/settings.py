@@ -63,20 +63,95 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# URLs of the ASGI application (config.asgi), with async recipe API views
+
+ASGI_URLCONF = 'config.urls_asgi'
+
+# Threads running the queries of async views, 0 uses Django's single
+# thread for sync code
+
+ASYNC_DATABASE_THREADS = env.int('ASYNC_DATABASE_THREADS', default=4)
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
      "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "apps.core.backends.postgresql_pool",
         "HOST": env.str("POSTGRES_HOST", default='db'),
         "NAME": env.str("POSTGRES_DB", default='config'),
         "USER": env.str("POSTGRES_USER", default='postgres'),
         "PASSWORD": env.str("POSTGRES_PASSWORD", default='secretpassword'),
+        # per-process connection pool, MAX_SIZE 0 disables it
+        "POOL": {
+            "MIN_SIZE": env.int("DATABASE_POOL_MIN_SIZE", default=2),
+            "MAX_SIZE": env.int("DATABASE_POOL_MAX_SIZE", default=20),
+            "TIMEOUT": env.float("DATABASE_POOL_TIMEOUT", default=10),
+            "MAX_IDLE": env.float("DATABASE_POOL_MAX_IDLE", default=300),
+            "MAX_LIFETIME": env.float("DATABASE_POOL_MAX_LIFETIME", default=3600),
+            "CHECK_AFTER": env.float("DATABASE_POOL_CHECK_AFTER", default=5),
+        },
     }
 }
 
+# Read replicas of the default database, one replica_<n> alias per host in
+# POSTGRES_REPLICA_HOSTS; list and retrieve requests of the recipe API read
+# from them (see apps.core.routers). Locally a replica can point at the
+# primary itself, e.g. POSTGRES_REPLICA_HOSTS=db.
+
+REPLICA_DATABASES = []
+for number, host in enumerate(env.list('POSTGRES_REPLICA_HOSTS', default=[]), start=1):
+    REPLICA_DATABASES.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+# Shards of the user owned tables (see apps.core.sharding): the default
+# database plus one shard_<n> alias per POSTGRES_SHARDS entry, "host" or
+# "host/name". Run migrate for every shard (--database shard_<n>); the
+# sharded tables then hand out ids modulo SHARD_ID_STRIDE by shard.
+
+SHARD_DATABASES = ['default']
+for number, shard in enumerate(env.list('POSTGRES_SHARDS', default=[]), start=1):
+    host, _, name = shard.partition('/')
+    SHARD_DATABASES.append(f'shard_{number}')
+    DATABASES[f'shard_{number}'] = {**DATABASES['default'], 'HOST': host, 'NAME': name or DATABASES['default']['NAME']}
+SHARD_ID_STRIDE = 1024
+
+DATABASE_ROUTERS = ['apps.core.routers.ShardRouter', 'apps.core.routers.ReplicaRouter']
+
+# users who wrote within REPLICA_PIN_SECONDS read from the primary; replicas
+# further than REPLICA_MAX_LAG seconds behind are skipped
+REPLICA_PIN_SECONDS = env.float('REPLICA_PIN_SECONDS', default=5)
+REPLICA_MAX_LAG = env.float('REPLICA_MAX_LAG', default=2)
+REPLICA_LAG_CHECK_INTERVAL = env.float('REPLICA_LAG_CHECK_INTERVAL', default=1)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Authentication tokens are kept in a small per-process LRU in front of the
+# shared cache; the local copy expires quickly so revocations made in other
+# processes are picked up within AUTH_TOKEN_LOCAL_CACHE_TIMEOUT seconds
+
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+AUTH_TOKEN_LOCAL_CACHE_SIZE = 10000
+AUTH_TOKEN_LOCAL_CACHE_TIMEOUT = 30
+
+
+# Rendered tag, ingredient and recipe responses are cached per user version
+# ('local' in this process, 'shared' in RECIPE_RESPONSE_CACHE_ALIAS, 'none');
+# larger responses are not cached
+
+RECIPE_RESPONSE_CACHE = env.str('RECIPE_RESPONSE_CACHE', default='local')
+RECIPE_RESPONSE_CACHE_ALIAS = 'default'
+RECIPE_RESPONSE_CACHE_SIZE = 256
+RECIPE_RESPONSE_CACHE_MAX_BYTES = 256 * 1024
+RECIPE_RESPONSE_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -131,8 +206,44 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apps.core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'apps.recipe.pagination.RecipeCursorPagination',
+    'PAGE_SIZE': 100,
 }
 
+# JSON library behind the API renderer and parser: 'orjson', or 'json' for
+# the standard library encoder DRF uses by default
+
+JSON_BACKEND = env.str('JSON_BACKEND', default='orjson')
+
+# Largest list accepted by the bulk recipe endpoint
+
+RECIPE_BULK_MAX_ITEMS = 5000
+
+# Worker threads resizing uploaded recipe images (0 resizes inline)
+
+RECIPE_IMAGE_WORKERS = env.int('RECIPE_IMAGE_WORKERS', default=2)
+
+# Limits on uploaded recipe images, checked while the upload streams in;
+# files are staged inside MEDIA_ROOT so storing them is a rename
+
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 32 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 50000000
+RECIPE_IMAGE_FORMATS = ['JPEG', 'PNG', 'GIF']
+RECIPE_IMAGE_STAGING_DIR = 'uploads/staging'
+
+# Text search configuration used for the recipe search vectors
+
+RECIPE_SEARCH_CONFIG = 'english'
+
 # DRF-Spectacular
 
 SPECTACULAR_SETTINGS = {
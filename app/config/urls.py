@@ -4,7 +4,11 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from django.conf.urls.static import static
 from django.conf import settings
 
+from apps.core.health import healthz, readyz
+
 urlpatterns = [
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
     path('admin/', admin.site.urls),
     path('api/user/', include('apps.user.urls')),
     path('api/recipe/', include('apps.recipe.urls')),
@@ -0,0 +1,10 @@
+from django.urls import include, path
+
+from apps.recipe.async_views import urlpatterns as recipe_async_urlpatterns
+from .urls import urlpatterns as sync_urlpatterns
+
+# URLs of the ASGI application: the recipe API routes with async views
+# first, then everything the WSGI application serves
+urlpatterns = [
+    path('api/recipe/', include(recipe_async_urlpatterns)),
+] + sync_urlpatterns